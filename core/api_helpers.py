@@ -3,29 +3,230 @@
 Módulo com funções auxiliares para comunicação com a API do SIDRA.
 """
 
+import os
+import sqlite3
+import threading
+import time
 import requests
 import json
 from qgis.core import QgsMessageLog, Qgis
 
-def get_metadata_from_api(tabela_id):
+from ..utils import constants
+from ..utils.paths import get_cache_dir
+from .http_session import get_session
+
+# Cache dos metadados: em memória e persistido no diretório de cache do perfil do QGIS
+METADATA_DB_NAME = "metadados_ibge.db"
+# Incrementar quando o formato guardado mudar, para invalidar entradas antigas
+METADATA_CACHE_FORMAT = 2
+
+METADATA_URL = "https://sidra.ibge.gov.br/Ajax/JSon/Tabela/1/{tabela_id}?versao=-1"
+# Lista de períodos da tabela (resposta pequena), usada para conferir se a tabela
+# foi republicada sem baixar os metadados completos.
+PERIODS_URL = "https://servicodados.ibge.gov.br/api/v3/agregados/{tabela_id}/periodos"
+
+_metadata_cache = {}
+_metadata_lock = threading.Lock()
+
+
+def _connect_metadata_db():
+    """
+    Abre o banco de metadados em cache, criando a tabela se necessário.
+    
+    Returns:
+        sqlite3.Connection: Conexão com o banco
+    """
+    conn = sqlite3.connect(os.path.join(get_cache_dir('metadados'), METADATA_DB_NAME), timeout=10)
+    # Tabela do formato anterior, sem o marcador de versão de cada tabela do SIDRA
+    conn.execute("DROP TABLE IF EXISTS metadados")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metadados_tabelas (
+            tabela_id TEXT PRIMARY KEY,
+            versao TEXT NOT NULL,
+            formato INTEGER NOT NULL,
+            gravado_em REAL NOT NULL,
+            conteudo TEXT NOT NULL
+        )
+    """)
+    return conn
+
+
+def _period_version(period_codes):
+    """
+    Monta o marcador de versão de uma tabela a partir dos códigos dos seus períodos:
+    o período mais recente e a quantidade de períodos. Muda quando o IBGE publica
+    um novo período ou retira um antigo.
+    """
+    codes = [str(code) for code in period_codes if code is not None]
+    if not codes:
+        return ''
+    latest = max(codes, key=lambda code: (len(code), code))
+    return f"{latest}|{len(codes)}"
+
+
+def metadata_version(metadata):
+    """
+    Retorna o marcador de versão dos metadados completos de uma tabela.
+    """
+    periods = (metadata or {}).get('Periodos', {}).get('Periodos', [])
+    return _period_version(period.get('Codigo') for period in periods)
+
+
+def fetch_metadata_version(tabela_id, timeout=constants.METADATA_REVALIDATE_TIMEOUT):
+    """
+    Consulta o marcador de versão atual de uma tabela pela lista de períodos.
+
+    Returns:
+        str: Marcador (ver metadata_version) ou None se a consulta falhou
+    """
+    try:
+        response = get_session().get(PERIODS_URL.format(tabela_id=tabela_id), timeout=timeout)
+        response.raise_for_status()
+        return _period_version(period.get('id') for period in response.json())
+    except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+        QgsMessageLog.logMessage(f"Não foi possível conferir a versão da tabela {tabela_id}: {e}", "SIDRA Connector", Qgis.Warning)
+        return None
+
+
+def get_cached_metadata(tabela_id):
+    """
+    Procura os metadados de uma tabela no cache em memória e, em seguida, no banco local.
+    
+    Args:
+        tabela_id (str): ID da tabela do SIDRA
+        
+    Returns:
+        tuple: (gravado_em, metadados, versao) ou None se a tabela não estiver em cache
+    """
+    tabela_id = str(tabela_id)
+    with _metadata_lock:
+        cached = _metadata_cache.get(tabela_id)
+    if cached:
+        return cached
+
+    try:
+        conn = _connect_metadata_db()
+        try:
+            row = conn.execute(
+                "SELECT gravado_em, conteudo, versao FROM metadados_tabelas WHERE tabela_id = ? AND formato = ?",
+                (tabela_id, METADATA_CACHE_FORMAT)
+            ).fetchone()
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        QgsMessageLog.logMessage(f"Não foi possível ler o cache de metadados: {e}", "SIDRA Connector", Qgis.Warning)
+        return None
+
+    if row is None:
+        return None
+
+    cached = (row[0], json.loads(row[1]), row[2])
+    with _metadata_lock:
+        _metadata_cache[tabela_id] = cached
+    return cached
+
+
+def _store_metadata(tabela_id, metadata):
+    """
+    Guarda os metadados de uma tabela, com o seu marcador de versão, no cache em
+    memória e no banco local.
+    """
+    cached = (time.time(), metadata, metadata_version(metadata))
+    with _metadata_lock:
+        _metadata_cache[tabela_id] = cached
+
+    try:
+        conn = _connect_metadata_db()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO metadados_tabelas VALUES (?, ?, ?, ?, ?)",
+                    (tabela_id, cached[2], METADATA_CACHE_FORMAT, cached[0], json.dumps(metadata))
+                )
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        QgsMessageLog.logMessage(f"Não foi possível gravar o cache de metadados: {e}", "SIDRA Connector", Qgis.Warning)
+
+
+def _touch_metadata(tabela_id, cached):
+    """
+    Renova o prazo de validade de metadados em cache cuja versão foi confirmada.
+    """
+    renewed = (time.time(),) + tuple(cached[1:])
+    with _metadata_lock:
+        _metadata_cache[tabela_id] = renewed
+
+    try:
+        conn = _connect_metadata_db()
+        try:
+            with conn:
+                conn.execute("UPDATE metadados_tabelas SET gravado_em = ? WHERE tabela_id = ?", (renewed[0], tabela_id))
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        QgsMessageLog.logMessage(f"Não foi possível gravar o cache de metadados: {e}", "SIDRA Connector", Qgis.Warning)
+    return renewed
+
+
+def is_metadata_cached(tabela_id):
+    """
+    Indica se os metadados de uma tabela estão em cache e dentro do prazo de validade.
+    
+    Args:
+        tabela_id (str): ID da tabela do SIDRA
+        
+    Returns:
+        bool: True se não for preciso consultar a API
+    """
+    cached = get_cached_metadata(tabela_id)
+    return bool(cached) and (time.time() - cached[0]) < constants.METADATA_CACHE_TTL
+
+
+def get_metadata_from_api(tabela_id, use_cache=True, revalidate=False):
     """
     Busca os metadados (a estrutura completa) de uma tabela diretamente da API do SIDRA.
     
+    Metadados já consultados são servidos do cache enquanto estiverem dentro de
+    constants.METADATA_CACHE_TTL. Depois disso, ou sempre que revalidate for True,
+    a versão guardada (período mais recente e quantidade de períodos) é conferida
+    com a lista de períodos da tabela: se não mudou, o cache é renovado sem baixar
+    os metadados de novo; se mudou (tabela republicada), eles são baixados. Se a
+    API estiver inacessível, a versão em cache é usada mesmo que tenha expirado.
+    
     Args:
         tabela_id (str): ID da tabela do SIDRA
+        use_cache (bool): Se False, sempre consulta a API
+        revalidate (bool): Se True, confere a versão mesmo dentro do prazo de validade
         
     Returns:
         dict: Metadados da tabela em formato JSON ou None em caso de erro
     """
-    url = f"https://sidra.ibge.gov.br/Ajax/JSon/Tabela/1/{tabela_id}?versao=-1"
+    tabela_id = str(tabela_id)
+    cached = get_cached_metadata(tabela_id) if use_cache else None
+    if cached:
+        fresh = (time.time() - cached[0]) < constants.METADATA_CACHE_TTL
+        if fresh and not revalidate:
+            return cached[1]
+        current_version = fetch_metadata_version(tabela_id)
+        if current_version is None:
+            # Sem conexão: os metadados em cache ainda servem.
+            return cached[1]
+        if current_version and current_version == cached[2]:
+            _touch_metadata(tabela_id, cached)
+            return cached[1]
+
+    url = METADATA_URL.format(tabela_id=tabela_id)
     
     QgsMessageLog.logMessage(f"Buscando metadados para a tabela {tabela_id}...", "SIDRA Connector", Qgis.Info)
     
     try:
-        response = requests.get(url, timeout=30)
+        response = get_session().get(url, timeout=30)
         response.raise_for_status()
+        metadata = response.json()
         QgsMessageLog.logMessage("Metadados recebidos com sucesso.", "SIDRA Connector", Qgis.Info)
-        return response.json()
+        _store_metadata(tabela_id, metadata)
+        return metadata
         
     except requests.exceptions.HTTPError as errh:
         error_msg = f"Erro HTTP: {errh}. Verifique se o código da tabela '{tabela_id}' está correto e disponível."
@@ -39,9 +240,35 @@ def get_metadata_from_api(tabela_id):
         error_msg = "Erro: A resposta da API não é um JSON válido."
         QgsMessageLog.logMessage(error_msg, "SIDRA Connector", Qgis.Critical)
     
+    if cached:
+        QgsMessageLog.logMessage(f"Usando metadados em cache da tabela {tabela_id}.", "SIDRA Connector", Qgis.Warning)
+        return cached[1]
+    
     return None
 
 
+def prefetch_metadata(tabela_ids, is_canceled=None):
+    """
+    Busca antecipadamente os metadados das tabelas que ainda não estão em cache.
+    
+    Args:
+        tabela_ids (list): IDs das tabelas, em ordem de prioridade
+        is_canceled (callable): Função opcional que interrompe a busca quando retorna True
+        
+    Returns:
+        int: Quantidade de tabelas efetivamente buscadas na API
+    """
+    fetched = 0
+    for tabela_id in tabela_ids:
+        if is_canceled and is_canceled():
+            break
+        if is_metadata_cached(tabela_id):
+            continue
+        if get_metadata_from_api(tabela_id) is not None:
+            fetched += 1
+    return fetched
+
+
 def montar_url_interativa(tabela_id, nivel_geo, variaveis, periodos, classificacoes_selecionadas):
     """
     Monta a string final da URL da API do SIDRA para buscar valores.
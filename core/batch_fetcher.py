@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Busca de várias consultas do SIDRA em lote, executadas ao mesmo tempo em um laço
+asyncio, e combinação dos resultados em um único lookup para o DataJoiner.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from ..utils import constants
+from .sidra_api_client import SidraApiClient, OUTPUT_DEFAULT, OUTPUT_LONG
+
+# Intervalo (s) entre verificações de cancelamento enquanto as consultas rodam
+_CANCEL_POLL_INTERVAL = 0.2
+
+
+class BatchResult:
+    """
+    Resultado de uma consulta do lote: o lookup e o cabeçalho ou o erro ocorrido.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.table_code = None
+        self.sidra_data = None
+        self.header_info = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and self.sidra_data is not None
+
+
+def _fetch_one(result, cache, force_refresh, output_mode, metadata_loader, is_canceled):
+    """
+    Executa uma consulta do lote (em uma thread do executor), guardando o
+    resultado ou o erro em `result`.
+    """
+    try:
+        client = SidraApiClient(result.url, cache=cache)
+        result.table_code = client.table_code
+        result.sidra_data, result.header_info = client.fetch_and_parse(
+            force_refresh=force_refresh,
+            output_mode=output_mode,
+            metadata_loader=metadata_loader,
+            is_canceled=is_canceled
+        )
+    except Exception as e:
+        result.error = str(e) or type(e).__name__
+    return result
+
+
+async def _run_batch(results, cache, force_refresh, output_mode, metadata_loader,
+                     max_concurrency, progress_callback, is_canceled):
+    """
+    Agenda as consultas no executor, no máximo `max_concurrency` ao mesmo tempo,
+    relatando cada uma assim que termina.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def run(result):
+        async with semaphore:
+            if is_canceled and is_canceled():
+                return result
+            return await loop.run_in_executor(
+                executor, _fetch_one, result, cache, force_refresh,
+                output_mode, metadata_loader, is_canceled
+            )
+
+    canceled = False
+    try:
+        pending = {asyncio.ensure_future(run(result)) for result in results}
+        done_count = 0
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=_CANCEL_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                done_count += 1
+                if progress_callback:
+                    progress_callback(done_count, future.result())
+            if is_canceled and is_canceled():
+                canceled = True
+                for future in pending:
+                    future.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                break
+    finally:
+        # No cancelamento, não espera as requisições em andamento: as threads
+        # terminam sozinhas e seus resultados são descartados.
+        executor.shutdown(wait=not canceled, cancel_futures=True)
+
+
+def fetch_batch(urls, cache=None, force_refresh=False, output_mode=OUTPUT_DEFAULT, metadata_loader=None,
+                max_concurrency=None, progress_callback=None, is_canceled=None):
+    """
+    Busca várias consultas do SIDRA ao mesmo tempo.
+
+    As consultas rodam em um laço asyncio próprio, cada uma em uma thread do
+    executor (o cliente HTTP é bloqueante), limitadas por um semáforo. Uma consulta
+    com erro não interrompe as demais: o erro fica no BatchResult correspondente.
+
+    :param urls: URLs completas da API SIDRA.
+    :param cache: ResponseCache opcional, compartilhado por todas as consultas.
+    :param force_refresh: Se True, ignora as respostas em cache.
+    :param output_mode: Formato do lookup (ver SidraApiClient.fetch_and_parse).
+    :param metadata_loader: Função opcional (código da tabela → metadados).
+    :param max_concurrency: Consultas simultâneas (padrão: constants.BATCH_MAX_CONCURRENT_QUERIES).
+    :param progress_callback: Função opcional chamada como (consultas_concluídas, BatchResult)
+                              a cada consulta concluída.
+    :param is_canceled: Função opcional que indica se o lote foi cancelado.
+    :return: Lista de BatchResult, na ordem das URLs.
+    """
+    results = [BatchResult(url) for url in urls]
+    if not results:
+        return results
+    if max_concurrency is None:
+        max_concurrency = constants.BATCH_MAX_CONCURRENT_QUERIES
+    max_concurrency = max(1, min(max_concurrency, len(results)))
+
+    asyncio.run(_run_batch(
+        results, cache, force_refresh, output_mode, metadata_loader,
+        max_concurrency, progress_callback, is_canceled
+    ))
+    return results
+
+
+def merge_batch_results(results):
+    """
+    Combina os lookups das consultas bem-sucedidas em um único lookup, prefixando
+    as colunas com a tabela de origem (t<tabela>_<coluna>) para que nomes iguais
+    em tabelas diferentes não colidam. O prefixo é usado mesmo quando apenas uma
+    consulta teve sucesso, para que os nomes das colunas não dependam das falhas.
+
+    :param results: Lista de BatchResult.
+    :return: Tupla (sidra_data_dict, header_info); header_info['field_aliases'] traz
+             o nome completo de cada coluna e header_info['tables'] as tabelas unidas.
+    :raises ValueError: Se houver mais de uma consulta no formato longo.
+    """
+    successful = [result for result in results if result.ok and result.sidra_data]
+    if len(successful) > 1 and any(
+        (result.header_info or {}).get('output_mode') == OUTPUT_LONG for result in successful
+    ):
+        raise ValueError("O formato longo aceita apenas uma consulta por vez.")
+    if len(successful) == 1 and (successful[0].header_info or {}).get('output_mode') == OUTPUT_LONG:
+        return successful[0].sidra_data, successful[0].header_info
+
+    merged = {}
+    field_aliases = {}
+    tables = []
+    used_prefixes = set()
+    for result in successful:
+        prefix = f"t{result.table_code}"
+        counter = 1
+        while prefix in used_prefixes:
+            counter += 1
+            prefix = f"t{result.table_code}_{counter}"
+        used_prefixes.add(prefix)
+        tables.append(result.table_code)
+
+        aliases = (result.header_info or {}).get('field_aliases', {})
+        for geo_code, values in result.sidra_data.items():
+            geo_entry = merged.get(geo_code)
+            if geo_entry is None:
+                geo_entry = merged[geo_code] = {}
+            for key, value in values.items():
+                geo_entry[f"{prefix}_{key}"] = value
+
+        keys = {key for values in result.sidra_data.values() for key in values}
+        for key in keys:
+            field_aliases[f"{prefix}_{key}"] = f"Tabela {result.table_code} - {aliases.get(key, key)}"
+
+    header_info = {'field_aliases': field_aliases, 'tables': tables}
+    if successful:
+        header_info['output_mode'] = (successful[0].header_info or {}).get('output_mode', OUTPUT_DEFAULT)
+    return merged, header_info
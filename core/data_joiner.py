@@ -6,11 +6,18 @@ from qgis.core import (
     QgsFeature,
     QgsFields,
     QgsWkbTypes,
+    QgsFeatureRequest,
+    QgsVectorLayerJoinInfo,
+    QgsVectorLayerFeatureSource,
     edit,
     Qgis
 )
 from qgis.PyQt.QtCore import QVariant
 
+from ..utils import constants
+from . import join_key_index
+from .join_key_index import JoinKeyIndex, normalize_join_key
+
 class DataJoiner:
     """
     Responsável por unir dados a uma camada vetorial, criando uma nova camada de resultado.
@@ -44,19 +51,42 @@ class DataJoiner:
         self.sidra_data = sidra_data
         self.header_info = header_info if header_info else {}
 
-    def join_data(self):
+        # Cópia das propriedades da camada e fonte de feições independente dela,
+        # para que a união possa ser executada fora da thread principal.
+        self.target_fields = target_layer.fields()
+        self.target_name = target_layer.name()
+        self.target_layer_id = target_layer.id()
+        self.target_wkb_type = target_layer.wkbType()
+        self.target_crs = target_layer.crs()
+        self.feature_count = target_layer.featureCount()
+        self.feature_source = QgsVectorLayerFeatureSource(target_layer)
+        self.layer_stamp = join_key_index.modification_stamp(target_layer)
+
+    @staticmethod
+    def normalize_key(raw_key):
         """
-        Executa a operação de união e retorna a nova camada e estatísticas.
-        :return: Uma tupla (nova_camada, contagem_uniao, amostra_nao_correspondida, amostra_chave_camada).
+        Normaliza o valor do campo de união da camada para o formato das chaves do SIDRA.
+        :param raw_key: Valor do campo na feição.
+        :return: A chave normalizada (str) ou None se o valor for nulo.
+        """
+        return normalize_join_key(raw_key)
+
+    def _build_fields(self, base_fields=None, reserved_names=()):
+        """
+        Monta os campos da camada de resultado: os campos base (por padrão, os da
+        camada alvo) seguidos de um campo numérico para cada variável/categoria do SIDRA.
+        :param base_fields: Campos iniciais da camada de resultado.
+        :param reserved_names: Nomes que os campos do SIDRA não podem usar.
+        :return: Uma tupla (campos, mapa_classe_para_nome_do_campo).
         """
         new_fields = QgsFields()
-        for field in self.target_layer.fields():
+        for field in (self.target_fields if base_fields is None else base_fields):
             new_fields.append(field)
 
         all_class_values = sorted(list(set(k for item in self.sidra_data.values() for k in item.keys())))
-        period = self.header_info.get('D3N', 'periodo')
+        field_aliases = self.header_info.get('field_aliases', {})
         field_map = {}
-        used_field_names = set()
+        used_field_names = set(reserved_names)
         
         for class_value in all_class_values:
             safe_class = str(class_value).lower()
@@ -80,24 +110,311 @@ class DataJoiner:
             used_field_names.add(field_name)
             
             if new_fields.indexFromName(field_name) == -1:
-                new_fields.append(QgsField(field_name, QVariant.Double))
+                new_field = QgsField(field_name, QVariant.Double)
+                if class_value in field_aliases:
+                    new_field.setAlias(field_aliases[class_value])
+                new_fields.append(new_field)
             field_map[class_value] = field_name
 
+        return new_fields, field_map
+
+    def _create_result_layer(self, new_fields):
+        """
+        Cria a camada de memória vazia que receberá o resultado da união.
+        """
         temp_layer = QgsVectorLayer(
-            f"{QgsWkbTypes.displayString(self.target_layer.wkbType())}?crs={self.target_layer.crs().authid()}",
-            f"{self.target_layer.name()}_sidra",
+            f"{QgsWkbTypes.displayString(self.target_wkb_type)}?crs={self.target_crs.authid()}",
+            f"{self.target_name}_sidra",
             "memory"
         )
         provider = temp_layer.dataProvider()
         provider.addAttributes(new_fields)
         temp_layer.updateFields()
+        return temp_layer
+
+    def _prepare_values(self, new_fields, field_map):
+        """
+        Converte uma única vez os valores do SIDRA em pares (índice do campo, valor),
+        descartando os que não são numéricos.
+        :return: Dicionário chave_geografica -> lista de (índice, float).
+        """
+        field_indexes = {
+            class_value: new_fields.indexFromName(field_name)
+            for class_value, field_name in field_map.items()
+        }
+        prepared = {}
+        for geo_key, values in self.sidra_data.items():
+            pairs = []
+            for class_value, data_value in values.items():
+                index = field_indexes.get(class_value, -1)
+                if index < 0:
+                    continue
+                try:
+                    pairs.append((index, float(data_value)))
+                except (ValueError, TypeError):
+                    pass
+            prepared[geo_key] = pairs
+        return prepared
+
+    def _iter_features(self, request=None, progress_callback=None, is_canceled=None):
+        """
+        Percorre as feições da camada alvo, relatando o progresso a cada
+        constants.JOIN_PROGRESS_STEP feições e parando se a união for cancelada.
+        :param request: QgsFeatureRequest opcional.
+        :param progress_callback: Função opcional que recebe o progresso (0 a 100).
+        :param is_canceled: Função opcional que indica se a união foi cancelada.
+        """
+        total = max(self.feature_count, 1)
+        for position, feature in enumerate(self.feature_source.getFeatures(request or QgsFeatureRequest())):
+            if position % constants.JOIN_PROGRESS_STEP == 0:
+                if is_canceled and is_canceled():
+                    return
+                if progress_callback:
+                    progress_callback(min(position * 100.0 / total, 100.0))
+            yield feature
+
+    def key_index(self, progress_callback=None, is_canceled=None):
+        """
+        Retorna o índice das chaves de união da camada alvo, reaproveitado entre
+        uniões enquanto a camada e o campo não mudarem.
+        :param progress_callback: Função opcional para relatar o progresso da leitura (0 a 100).
+        :param is_canceled: Função opcional que indica se a união foi cancelada.
+        :return: JoinKeyIndex ou None se a leitura foi cancelada.
+        """
+        field_index = self.target_fields.indexFromName(self.join_field_name)
+        return join_key_index.get_key_index(
+            self.target_layer_id,
+            self.join_field_name,
+            self.layer_stamp,
+            lambda: JoinKeyIndex.build(
+                self.feature_source, field_index, progress_callback, is_canceled, self.feature_count
+            )
+        )
 
+    @staticmethod
+    def _scaled_progress(progress_callback, start, end):
+        """
+        Adapta um callback de progresso para relatar apenas o intervalo [start, end].
+        """
+        if progress_callback is None:
+            return None
+        return lambda progress: progress_callback(start + progress * (end - start) / 100.0)
+
+    def join_data(self, bulk=True, progress_callback=None, is_canceled=None):
+        """
+        Executa a operação de união e retorna a nova camada e estatísticas.
+        :param bulk: Se True, grava as feições em lotes diretamente no provedor da
+                     camada de memória (sem sessão de edição). Se False, usa o caminho
+                     original com edit() e addFeature por feição.
+        :param progress_callback: Função opcional para relatar o progresso (0 a 100).
+        :param is_canceled: Função opcional que indica se a união foi cancelada.
+        :return: Uma tupla (nova_camada, contagem_uniao, amostra_nao_correspondida, amostra_chave_camada)
+                 ou None se a união foi cancelada.
+        """
+        new_fields, field_map = self._build_fields()
+        temp_layer = self._create_result_layer(new_fields)
+        if bulk:
+            stats = self._join_bulk(temp_layer, new_fields, field_map, progress_callback, is_canceled)
+        else:
+            stats = self._join_edit_buffer(temp_layer, new_fields, field_map, progress_callback, is_canceled)
+        if is_canceled and is_canceled():
+            return None
+        return (temp_layer,) + stats
+
+    def _join_bulk(self, temp_layer, new_fields, field_map, progress_callback=None, is_canceled=None):
+        """
+        União em lotes: a lista completa de atributos de cada feição é montada de
+        uma vez e as feições são enviadas em lotes para dataProvider().addFeatures,
+        sem passar pelo buffer de edição e pela pilha de desfazer.
+        """
+        provider = temp_layer.dataProvider()
+        prepared_values = self._prepare_values(new_fields, field_map)
+        extra_attributes = [None] * (new_fields.count() - self.target_fields.count())
+
+        index = self.key_index(self._scaled_progress(progress_callback, 0, 20), is_canceled)
+        if index is None:
+            return 0, [], []
+        fid_keys = index.fid_keys
+        batch = []
+
+        for feature in self._iter_features(None, self._scaled_progress(progress_callback, 20, 100), is_canceled):
+            attributes = feature.attributes() + extra_attributes
+            pairs = prepared_values.get(fid_keys.get(feature.id()))
+            if pairs:
+                for position, value in pairs:
+                    attributes[position] = value
+
+            new_feat = QgsFeature(new_fields)
+            new_feat.setGeometry(feature.geometry())
+            new_feat.setAttributes(attributes)
+            batch.append(new_feat)
+
+            if len(batch) >= constants.JOIN_BATCH_SIZE:
+                provider.addFeatures(batch)
+                batch = []
+
+        if batch:
+            provider.addFeatures(batch)
+        temp_layer.updateExtents()
+
+        return (
+            index.match_count(prepared_values),
+            index.unmatched_sample(prepared_values),
+            list(index.layer_keys_sample)
+        )
+
+    def join_virtual(self, progress_callback=None, is_canceled=None):
+        """
+        União virtual: em vez de copiar a camada alvo com suas geometrias, cria uma
+        camada de memória sem geometria apenas com os atributos do SIDRA, a ser
+        ligada à camada alvo por uma união de camadas do QGIS (ver create_join_info).
+
+        A camada de atributos tem uma linha por valor distinto do campo de união que
+        corresponde aos dados do SIDRA, com o valor original da camada alvo como chave.
+        :param progress_callback: Função opcional para relatar o progresso (0 a 100).
+        :param is_canceled: Função opcional que indica se a união foi cancelada.
+        :return: Uma tupla (camada_de_atributos, contagem_uniao, amostra_nao_correspondida, amostra_chave_camada)
+                 ou None se a união foi cancelada.
+        """
+        target_fields = self.target_fields
+        join_field_index = target_fields.indexFromName(self.join_field_name)
+        key_fields = QgsFields()
+        key_fields.append(QgsField(target_fields.at(join_field_index)))
+
+        new_fields, field_map = self._build_fields(key_fields, reserved_names=target_fields.names())
+        prepared_values = self._prepare_values(new_fields, field_map)
+
+        attribute_layer = QgsVectorLayer("None", f"{self.target_name}_sidra_dados", "memory")
+        provider = attribute_layer.dataProvider()
+        provider.addAttributes(new_fields)
+        attribute_layer.updateFields()
+
+        index = self.key_index(progress_callback, is_canceled)
+        if index is None:
+            return None
+
+        extra_attributes = [None] * (new_fields.count() - 1)
+        batch = []
+
+        for normalized_key, raw_values in index.raw_values.items():
+            pairs = prepared_values.get(normalized_key)
+            if pairs is None:
+                continue
+
+            for raw_key in raw_values:
+                attributes = [raw_key] + extra_attributes
+                for position, value in pairs:
+                    attributes[position] = value
+                new_feat = QgsFeature(new_fields)
+                new_feat.setAttributes(attributes)
+                batch.append(new_feat)
+
+            if len(batch) >= constants.JOIN_BATCH_SIZE:
+                provider.addFeatures(batch)
+                batch = []
+
+        if batch:
+            provider.addFeatures(batch)
+
+        return (
+            attribute_layer,
+            index.match_count(prepared_values),
+            index.unmatched_sample(prepared_values),
+            list(index.layer_keys_sample)
+        )
+
+    def is_long_format(self):
+        """
+        Indica se os dados do SIDRA estão no formato longo (várias linhas por código geográfico).
+        """
+        return 'long_columns' in self.header_info
+
+    def join_long(self, progress_callback=None, is_canceled=None):
+        """
+        Formato longo: cria uma tabela sem geometria com uma linha por valor do SIDRA
+        (variável, período, categorias, unidade e valor), com o valor original do
+        campo de união da camada alvo como chave. A tabela é ligada à camada alvo por
+        uma relação um-para-muitos (ver layer_manager.add_related_table).
+        :param progress_callback: Função opcional para relatar o progresso (0 a 100).
+        :param is_canceled: Função opcional que indica se a união foi cancelada.
+        :return: Uma tupla (tabela, contagem_uniao, amostra_nao_correspondida, amostra_chave_camada)
+                 ou None se a união foi cancelada.
+        """
+        join_field_index = self.target_fields.indexFromName(self.join_field_name)
+        new_fields = QgsFields()
+        new_fields.append(QgsField(self.target_fields.at(join_field_index)))
+        for name, alias in self.header_info['long_columns']:
+            if name == self.join_field_name:
+                name = f"{name}_sidra"
+            new_field = QgsField(name, QVariant.Double if name == 'valor' else QVariant.String)
+            new_field.setAlias(alias)
+            new_fields.append(new_field)
+
+        table_layer = QgsVectorLayer("None", f"{self.target_name}_sidra_longo", "memory")
+        provider = table_layer.dataProvider()
+        provider.addAttributes(new_fields)
+        table_layer.updateFields()
+
+        index = self.key_index(progress_callback, is_canceled)
+        if index is None:
+            return None
+
+        batch = []
+        for normalized_key, raw_values in index.raw_values.items():
+            rows = self.sidra_data.get(normalized_key)
+            if not rows:
+                continue
+
+            for raw_key in raw_values:
+                for row in rows:
+                    new_feat = QgsFeature(new_fields)
+                    new_feat.setAttributes([raw_key, *row])
+                    batch.append(new_feat)
+
+            if len(batch) >= constants.JOIN_BATCH_SIZE:
+                provider.addFeatures(batch)
+                batch = []
+
+        if batch:
+            provider.addFeatures(batch)
+
+        return (
+            table_layer,
+            index.match_count(self.sidra_data),
+            index.unmatched_sample(self.sidra_data),
+            list(index.layer_keys_sample)
+        )
+
+    def create_join_info(self, attribute_layer):
+        """
+        Cria a definição da união entre a camada alvo e a camada de atributos
+        gerada por join_virtual. Os campos do SIDRA aparecem na camada alvo com os
+        mesmos nomes da camada de atributos, sem prefixo.
+        :param attribute_layer: Camada retornada por join_virtual.
+        :return: QgsVectorLayerJoinInfo pronto para QgsVectorLayer.addJoin.
+        """
+        join_info = QgsVectorLayerJoinInfo()
+        join_info.setJoinLayer(attribute_layer)
+        join_info.setJoinFieldName(self.join_field_name)
+        join_info.setTargetFieldName(self.join_field_name)
+        join_info.setUsingMemoryCache(True)
+        join_info.setPrefix('')
+        join_info.setJoinFieldNamesSubset(
+            [field.name() for field in attribute_layer.fields() if field.name() != self.join_field_name]
+        )
+        return join_info
+
+    def _join_edit_buffer(self, temp_layer, new_fields, field_map, progress_callback=None, is_canceled=None):
+        """
+        União pelo buffer de edição, com addFeature e um setAttribute por atributo.
+        Mantida para comparação (dev/benchmark_join.py).
+        """
         join_count = 0
         unmatched_keys_sample = []
         layer_keys_sample = []
 
         with edit(temp_layer):
-            for feature in self.target_layer.getFeatures():
+            for feature in self._iter_features(None, progress_callback, is_canceled):
                 new_feat = QgsFeature(new_fields)
                 new_feat.setGeometry(feature.geometry())
                 for i, field in enumerate(feature.fields()):
@@ -105,12 +422,7 @@ class DataJoiner:
 
                 raw_key = feature[self.join_field_name]
                 
-                normalized_layer_key = None
-                if raw_key is not None:
-                    try:
-                        normalized_layer_key = str(int(float(raw_key)))
-                    except (ValueError, TypeError):
-                        normalized_layer_key = str(raw_key).strip()
+                normalized_layer_key = self.normalize_key(raw_key)
 
                 if len(layer_keys_sample) < 5 and normalized_layer_key:
                     layer_keys_sample.append(normalized_layer_key)
@@ -129,4 +441,4 @@ class DataJoiner:
                 
                 temp_layer.addFeature(new_feat)
 
-        return temp_layer, join_count, unmatched_keys_sample, layer_keys_sample
+        return join_count, unmatched_keys_sample, layer_keys_sample
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistente em disco para respostas HTTP (consultas /values do SIDRA).
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit, unquote
+
+from ..utils import constants
+
+
+def normalize_url(url):
+    """
+    Normaliza uma URL para uso como chave de cache.
+
+    Esquema http/https, maiúsculas no host, espaços codificados (%20), barras
+    duplicadas e a barra final não diferenciam consultas.
+
+    Args:
+        url (str): URL da consulta
+
+    Returns:
+        str: URL normalizada
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme == 'http':
+        scheme = 'https'
+    path = re.sub(r'/{2,}', '/', unquote(parts.path)).rstrip('/')
+    return urlunsplit((scheme, parts.netloc.lower(), path, parts.query, ''))
+
+
+class ResponseCache:
+    """
+    Cache de respostas HTTP com expiração (TTL), limite de tamanho e remoção das
+    entradas usadas há mais tempo (LRU).
+
+    Os corpos das respostas ficam em arquivos no diretório do cache e um índice
+    SQLite guarda a URL normalizada, os validadores (ETag/Last-Modified), o tamanho
+    e as datas de gravação e de último acesso de cada entrada.
+
+    Arquivos que não puderam ser substituídos ou removidos por estarem abertos
+    (ex.: lidos por outra tarefa no Windows) mantêm a sua entrada no índice; os que
+    ficaram fora do índice são removidos na próxima abertura do cache.
+    """
+
+    def __init__(self, cache_dir, ttl=constants.HTTP_CACHE_TTL, max_bytes=constants.HTTP_CACHE_MAX_BYTES):
+        """
+        Construtor.
+        :param cache_dir: Diretório onde os arquivos do cache serão guardados.
+        :param ttl: Tempo, em segundos, em que uma resposta é usada sem consultar o servidor.
+        :param max_bytes: Tamanho máximo do cache em bytes.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.sqlite')
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entradas (
+                    chave TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    content_type TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    tamanho INTEGER NOT NULL,
+                    gravado_em REAL NOT NULL,
+                    acessado_em REAL NOT NULL
+                )
+            """)
+            self._remove_orphans(conn)
+
+    @contextmanager
+    def _connect(self):
+        """
+        Abre uma conexão com o índice dentro de uma transação. Cada operação usa a
+        sua própria conexão, o que permite usar o cache nas tarefas em segundo plano.
+        """
+        conn = sqlite3.connect(self.index_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _body_path(self, key):
+        """
+        Retorna o caminho do arquivo com o corpo da resposta de uma entrada.
+        """
+        return os.path.join(self.cache_dir, f"{key}.body")
+
+    @staticmethod
+    def key_for(url):
+        """
+        Retorna a chave de cache de uma URL.
+        """
+        return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+
+    def lookup(self, url):
+        """
+        Procura a resposta em cache de uma URL.
+
+        Args:
+            url (str): URL da consulta
+
+        Returns:
+            dict: Dados da entrada ou None se a URL não estiver no cache
+        """
+        key = self.key_for(url)
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT content_type, etag, last_modified, tamanho, gravado_em FROM entradas WHERE chave = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(self._body_path(key)):
+                conn.execute("DELETE FROM entradas WHERE chave = ?", (key,))
+                return None
+            conn.execute("UPDATE entradas SET acessado_em = ? WHERE chave = ?", (time.time(), key))
+
+        content_type, etag, last_modified, size, stored_at = row
+        return {
+            'key': key,
+            'content_type': content_type or '',
+            'etag': etag,
+            'last_modified': last_modified,
+            'size': size,
+            'stored_at': stored_at,
+        }
+
+    def is_fresh(self, entry):
+        """
+        Indica se a entrada ainda está dentro do prazo de validade (TTL).
+        """
+        return (time.time() - entry['stored_at']) < self.ttl
+
+    def validation_headers(self, entry):
+        """
+        Monta os cabeçalhos de revalidação condicional (If-None-Match/If-Modified-Since).
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def mark_revalidated(self, entry):
+        """
+        Renova a validade de uma entrada confirmada pelo servidor (HTTP 304).
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE entradas SET gravado_em = ?, acessado_em = ? WHERE chave = ?",
+                (now, now, entry['key'])
+            )
+        entry['stored_at'] = now
+
+    def iter_body(self, entry):
+        """
+        Lê o corpo de uma resposta em cache em blocos de constants.CHUNK_SIZE bytes.
+        """
+        with open(self._body_path(entry['key']), 'rb') as body:
+            while True:
+                chunk = body.read(constants.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def store_stream(self, url, headers, byte_chunks):
+        """
+        Repassa os blocos de uma resposta enquanto os grava no cache.
+
+        A entrada só é registrada quando todos os blocos foram consumidos; se a
+        leitura for interrompida, o arquivo parcial é descartado.
+
+        Args:
+            url (str): URL da consulta
+            headers: Cabeçalhos da resposta HTTP
+            byte_chunks: Iterável com os blocos de bytes da resposta
+
+        Returns:
+            generator: Os mesmos blocos de byte_chunks
+        """
+        key = self.key_for(url)
+        part_path = f"{self._body_path(key)}.{uuid.uuid4().hex}.part"
+        size = 0
+        completed = False
+
+        try:
+            with open(part_path, 'wb') as part:
+                for chunk in byte_chunks:
+                    part.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                self._commit(key, url, headers, part_path, size)
+            elif os.path.exists(part_path):
+                os.remove(part_path)
+
+    def _commit(self, key, url, headers, part_path, size):
+        """
+        Registra no índice uma resposta gravada por completo e aplica o limite de tamanho.
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                os.replace(part_path, self._body_path(key))
+            except OSError:
+                # O corpo anterior está aberto por outro leitor: mantém a entrada antiga.
+                self._remove_file(part_path)
+                return
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entradas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, normalize_url(url), headers.get('Content-Type', ''), headers.get('ETag'),
+                     headers.get('Last-Modified'), size, now, now)
+                )
+                self._evict(conn, keep=(key,))
+
+    def _evict(self, conn, keep=()):
+        """
+        Remove as entradas acessadas há mais tempo até o cache caber em max_bytes.
+        As entradas com chave em `keep` (a que acabou de ser gravada) nunca são removidas.
+        """
+        total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM entradas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in conn.execute("SELECT chave, tamanho FROM entradas ORDER BY acessado_em").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            # Só sai do índice o que saiu do disco; um corpo aberto fica para a próxima vez.
+            if not self._remove_file(self._body_path(key)):
+                continue
+            conn.execute("DELETE FROM entradas WHERE chave = ?", (key,))
+            total -= size
+
+    def _remove_orphans(self, conn):
+        """
+        Remove corpos que ficaram fora do índice e gravações parciais abandonadas
+        há mais de um TTL.
+        """
+        indexed = {row[0] for row in conn.execute("SELECT chave FROM entradas")}
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.body'):
+                if name[:-len('.body')] not in indexed:
+                    self._remove_file(path)
+            elif name.endswith('.part'):
+                try:
+                    abandoned = time.time() - os.path.getmtime(path) > self.ttl
+                except OSError:
+                    continue
+                if abandoned:
+                    self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path):
+        """
+        Remove um arquivo do cache.
+        :return: True se o arquivo não existe mais.
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+        return True
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Sessão HTTP compartilhada pelos módulos de rede do plugin (API SIDRA, metadados
+e malhas do IBGE), com conexões reaproveitadas e novas tentativas automáticas.
+"""
+
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..utils import constants
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class JitteredRetry(Retry):
+    """
+    Retry com espera exponencial e variação aleatória (jitter), para que
+    requisições paralelas que falharam juntas não tentem de novo ao mesmo tempo.
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        return min(random.uniform(backoff / 2, backoff), constants.HTTP_BACKOFF_MAX)
+
+
+def _create_session():
+    """
+    Cria a sessão com o pool de conexões por servidor e a política de novas tentativas.
+
+    O pool bloqueia (pool_block) quando as HTTP_MAX_CONNECTIONS_PER_HOST conexões de
+    um servidor estão em uso, limitando as requisições simultâneas a cada um deles.
+    O limite cobre o paralelismo aninhado (consultas de um lote × partes de cada
+    consulta, UFs × segmentos de cada malha), que assim não é serializado pelo pool.
+    Respostas 429/5xx são repetidas até constants.MAX_RETRIES vezes, respeitando o
+    cabeçalho Retry-After; esgotadas as tentativas, a última resposta é devolvida
+    para que o chamador trate o erro com raise_for_status().
+    """
+    retry = JitteredRetry(
+        total=constants.MAX_RETRIES,
+        connect=constants.MAX_RETRIES,
+        read=constants.MAX_RETRIES,
+        status=constants.MAX_RETRIES,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        backoff_factor=constants.HTTP_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=constants.HTTP_MAX_CONNECTIONS_PER_HOST,
+        pool_block=True,
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Retorna a sessão HTTP compartilhada, criando-a na primeira chamada.
+
+    A mesma sessão é usada a partir de várias threads (tarefas do QGIS e partes
+    de consultas baixadas em paralelo); apenas requisições GET/HEAD sem estado
+    são feitas por ela.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _create_session()
+        return _session
+
+
+def close_session():
+    """
+    Fecha as conexões abertas da sessão compartilhada (ao descarregar o plugin).
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Índice das chaves de união de uma camada (código geográfico normalizado → feições),
+reaproveitado entre uniões sucessivas de tabelas do SIDRA à mesma malha.
+"""
+
+import threading
+
+from qgis.core import QgsFeatureRequest, NULL
+
+from ..utils import constants
+
+
+def normalize_join_key(raw_key):
+    """
+    Normaliza o valor do campo de união da camada para o formato das chaves do SIDRA.
+    :param raw_key: Valor do campo na feição.
+    :return: A chave normalizada (str) ou None se o valor for nulo.
+    """
+    if raw_key is None or raw_key == NULL:
+        return None
+    if isinstance(raw_key, int):
+        return str(raw_key)
+    if isinstance(raw_key, str) and raw_key.isdigit():
+        return str(int(raw_key))
+    try:
+        return str(int(float(raw_key)))
+    except (ValueError, TypeError):
+        return str(raw_key).strip()
+
+
+class JoinKeyIndex:
+    """
+    Chaves de união normalizadas de uma camada, lidas uma única vez.
+
+    Guarda a chave de cada feição, quantas feições têm cada chave e os valores
+    originais do campo que produziram cada chave (usados pela união virtual).
+    """
+
+    def __init__(self):
+        self.fid_keys = {}
+        self.key_counts = {}
+        self.raw_values = {}
+        self.layer_keys_sample = []
+
+    @classmethod
+    def build(cls, feature_source, field_index, progress_callback=None, is_canceled=None, total=0):
+        """
+        Lê apenas o campo de união, sem geometria, e normaliza cada valor distinto uma vez.
+        :param feature_source: Fonte de feições da camada (QgsVectorLayerFeatureSource).
+        :param field_index: Índice do campo de união.
+        :param progress_callback: Função opcional para relatar o progresso (0 a 100).
+        :param is_canceled: Função opcional que indica se a leitura foi cancelada.
+        :param total: Número de feições da camada, para o cálculo do progresso.
+        :return: O índice ou None se a leitura foi cancelada.
+        """
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([field_index])
+
+        index = cls()
+        normalized_cache = {}
+        total = max(total, 1)
+
+        for position, feature in enumerate(feature_source.getFeatures(request)):
+            if position % constants.JOIN_PROGRESS_STEP == 0:
+                if is_canceled and is_canceled():
+                    return None
+                if progress_callback:
+                    progress_callback(min(position * 100.0 / total, 100.0))
+
+            raw_key = feature.attribute(field_index)
+            try:
+                normalized = normalized_cache[raw_key]
+            except KeyError:
+                normalized = normalized_cache[raw_key] = normalize_join_key(raw_key)
+            except TypeError:
+                # Valor não utilizável como chave de dicionário (ex.: QVariant nulo).
+                normalized = normalize_join_key(raw_key)
+
+            if not normalized:
+                continue
+
+            index.fid_keys[feature.id()] = normalized
+            if normalized in index.key_counts:
+                index.key_counts[normalized] += 1
+                if raw_key not in index.raw_values[normalized]:
+                    index.raw_values[normalized].append(raw_key)
+            else:
+                index.key_counts[normalized] = 1
+                index.raw_values[normalized] = [raw_key]
+                if len(index.layer_keys_sample) < 5:
+                    index.layer_keys_sample.append(normalized)
+
+        return index
+
+    def match_count(self, keys):
+        """
+        Retorna o número de feições cuja chave está em `keys`.
+        """
+        return sum(count for key, count in self.key_counts.items() if key in keys)
+
+    def unmatched_sample(self, keys, size=5):
+        """
+        Retorna até `size` chaves da camada, na ordem das feições, ausentes de `keys`.
+        """
+        sample = []
+        for key in self.key_counts:
+            if key not in keys:
+                sample.append(key)
+                if len(sample) >= size:
+                    break
+        return sample
+
+
+_indexes = {}
+_stamps = {}
+_lock = threading.Lock()
+
+
+def _bump_stamp(layer_id):
+    """
+    Marca uma camada como modificada, invalidando seus índices.
+    """
+    with _lock:
+        _stamps[layer_id] = _stamps.get(layer_id, 0) + 1
+        for key in [key for key in _indexes if key[0] == layer_id]:
+            del _indexes[key]
+
+
+def _forget_layer(layer_id):
+    """
+    Descarta os índices e o contador de uma camada removida.
+    """
+    with _lock:
+        _stamps.pop(layer_id, None)
+        for key in [key for key in _indexes if key[0] == layer_id]:
+            del _indexes[key]
+
+
+def modification_stamp(layer):
+    """
+    Retorna o contador de modificações de uma camada, passando a acompanhá-la na
+    primeira chamada. Deve ser chamada na thread principal.
+
+    O contador aumenta quando os dados ou o filtro da camada mudam.
+    """
+    layer_id = layer.id()
+    with _lock:
+        if layer_id in _stamps:
+            return _stamps[layer_id]
+        _stamps[layer_id] = 0
+
+    layer.dataChanged.connect(lambda: _bump_stamp(layer_id))
+    layer.subsetStringChanged.connect(lambda: _bump_stamp(layer_id))
+    layer.willBeDeleted.connect(lambda: _forget_layer(layer_id))
+    return 0
+
+
+def get_key_index(layer_id, field_name, stamp, builder):
+    """
+    Retorna o índice de chaves de (camada, campo, estado de modificação),
+    construindo-o com `builder` quando não está em cache.
+    :param builder: Função sem argumentos que retorna um JoinKeyIndex ou None (cancelado).
+    :return: O índice ou None se a construção foi cancelada.
+    """
+    cache_key = (layer_id, field_name)
+    with _lock:
+        cached = _indexes.get(cache_key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+    index = builder()
+    if index is None:
+        return None
+
+    with _lock:
+        if _stamps.get(layer_id, 0) == stamp:
+            _indexes[cache_key] = (stamp, index)
+    return index
+
+
+def clear_key_indexes():
+    """
+    Descarta todos os índices em cache (ao descarregar o plugin).
+    """
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistente das malhas territoriais do IBGE já baixadas e extraídas.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from ..utils import constants
+from .mesh_downloader import VSIZIP_PREFIX
+
+
+class MeshCache:
+    """
+    Cache de malhas extraídas, indexado por (ano, localidade, tipo de malha), com
+    limite de tamanho e remoção das malhas usadas há mais tempo (LRU).
+
+    Cada malha fica em um subdiretório próprio do cache. O índice SQLite guarda a
+    URL de origem, o subdiretório, o shapefile, o tamanho de cada arquivo extraído
+    e as datas de gravação e de último acesso; uma entrada cujos arquivos sumiram
+    ou mudaram de tamanho é descartada na consulta.
+
+    Subdiretórios que não puderam ser removidos por estarem em uso (ex.: abertos
+    por uma camada no Windows) são removidos em uma limpeza posterior.
+    """
+
+    def __init__(self, cache_dir, max_bytes=constants.MESH_CACHE_MAX_BYTES):
+        """
+        Construtor.
+        :param cache_dir: Diretório onde as malhas serão guardadas.
+        :param max_bytes: Tamanho máximo do cache em bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.sqlite')
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS malhas (
+                    chave TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    diretorio TEXT NOT NULL,
+                    shapefile TEXT NOT NULL,
+                    arquivos TEXT NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    gravado_em REAL NOT NULL,
+                    acessado_em REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """
+        Abre uma conexão com o índice dentro de uma transação.
+        """
+        conn = sqlite3.connect(self.index_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def key_for(ano, localidade, tipo):
+        """
+        Retorna a chave de cache de uma malha.
+        :param ano: Ano da malha (ex.: '2022').
+        :param localidade: Sigla da localidade (ex.: 'BR', 'SP').
+        :param tipo: Prefixo do tipo de malha (ex.: 'Municipios').
+        """
+        identity = f"{ano}|{localidade}|{tipo}".lower()
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def _remove_dir(self, path):
+        """
+        Remove um diretório do cache; arquivos ainda abertos (ex.: no Windows) são
+        mantidos e a remoção é tentada de novo na próxima limpeza.
+        """
+        shutil.rmtree(path, ignore_errors=True)
+        return not os.path.exists(path)
+
+    def lookup(self, ano, localidade, tipo):
+        """
+        Procura uma malha no cache.
+
+        :return: O caminho do shapefile em cache ou None se a malha não está
+                 no cache ou os seus arquivos não conferem com o índice.
+        """
+        key = self.key_for(ano, localidade, tipo)
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT diretorio, shapefile, arquivos FROM malhas WHERE chave = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            entry_dir = os.path.join(self.cache_dir, row[0])
+            shapefile, files = row[1], json.loads(row[2])
+            vsizip = shapefile.startswith(VSIZIP_PREFIX)
+            if vsizip:
+                shapefile = shapefile[len(VSIZIP_PREFIX):]
+            for name, size in files.items():
+                path = os.path.join(entry_dir, name)
+                if not os.path.isfile(path) or os.path.getsize(path) != size:
+                    conn.execute("DELETE FROM malhas WHERE chave = ?", (key,))
+                    self._remove_dir(entry_dir)
+                    return None
+
+            conn.execute("UPDATE malhas SET acessado_em = ? WHERE chave = ?", (time.time(), key))
+        return self._shapefile_path(entry_dir, shapefile, vsizip)
+
+    @staticmethod
+    def _shapefile_path(entry_dir, shapefile, vsizip):
+        """
+        Monta o caminho do shapefile de uma entrada: um ficheiro extraído ou, se a
+        malha foi guardada como zip, um caminho /vsizip/ para dentro dele.
+        """
+        if vsizip:
+            return VSIZIP_PREFIX + entry_dir.replace(os.sep, '/') + '/' + shapefile
+        return os.path.join(entry_dir, shapefile)
+
+    def staging_dir(self, ano, localidade, tipo):
+        """
+        Cria um diretório temporário, dentro do cache, para baixar e extrair uma malha
+        antes de registrá-la com commit().
+        """
+        key = self.key_for(ano, localidade, tipo)
+        path = os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex}.part")
+        os.makedirs(path)
+        return path
+
+    def partial_path(self, ano, localidade, tipo):
+        """
+        Retorna o caminho estável do download parcial de uma malha, para que um
+        download interrompido seja retomado na próxima tentativa.
+        """
+        return os.path.join(self.cache_dir, f"{self.key_for(ano, localidade, tipo)}.zip.part")
+
+    def commit(self, ano, localidade, tipo, url, staging_dir, shapefile_path, keep=()):
+        """
+        Registra no cache uma malha extraída em `staging_dir` e aplica o limite de tamanho.
+
+        :param shapefile_path: Caminho do shapefile extraído, dentro de staging_dir, ou o
+                               caminho /vsizip/ para o shapefile dentro do zip em staging_dir.
+        :param keep: Tuplas (ano, localidade, tipo) de outras malhas que não podem ser
+                     removidas pelo limite de tamanho (ex.: as UFs de uma mesma união).
+        :return: O caminho definitivo do shapefile no cache.
+        """
+        key = self.key_for(ano, localidade, tipo)
+        protected = {key}.union(self.key_for(*other) for other in keep)
+        files = {}
+        for root, _, names in os.walk(staging_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, staging_dir).replace(os.sep, '/')] = os.path.getsize(path)
+        vsizip = shapefile_path.startswith(VSIZIP_PREFIX)
+        if vsizip:
+            shapefile_path = shapefile_path[len(VSIZIP_PREFIX):]
+        shapefile = os.path.relpath(shapefile_path, staging_dir).replace(os.sep, '/')
+        size = sum(files.values())
+        now = time.time()
+
+        directory = os.path.basename(staging_dir)[:-len('.part')]
+        entry_dir = os.path.join(self.cache_dir, directory)
+        with self._lock:
+            os.replace(staging_dir, entry_dir)
+            with self._connect() as conn:
+                previous = conn.execute("SELECT diretorio FROM malhas WHERE chave = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO malhas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, url, directory, (VSIZIP_PREFIX if vsizip else '') + shapefile, json.dumps(files), size, now, now)
+                )
+                if previous and previous[0] != directory:
+                    self._remove_dir(os.path.join(self.cache_dir, previous[0]))
+                self._evict(conn, keep=protected)
+        return self._shapefile_path(entry_dir, shapefile, vsizip)
+
+    def discard(self, staging_dir):
+        """
+        Remove um diretório temporário de um download que falhou ou foi cancelado.
+        """
+        with self._lock:
+            if staging_dir and os.path.exists(staging_dir):
+                self._remove_dir(staging_dir)
+
+    def _remove_orphans(self, conn):
+        """
+        Remove subdiretórios fora do índice (versões substituídas que estavam em uso),
+        extrações e downloads parciais abandonados há mais de constants.MESH_PARTIAL_MAX_AGE.
+        """
+        indexed = {row[0] for row in conn.execute("SELECT diretorio FROM malhas")}
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name in indexed:
+                continue
+            try:
+                abandoned = time.time() - os.path.getmtime(path) > constants.MESH_PARTIAL_MAX_AGE
+                is_dir = os.path.isdir(path)
+            except OSError:
+                # Removido durante a varredura (ex.: descartado por outro processo).
+                continue
+            if is_dir:
+                if not name.endswith('.part') or abandoned:
+                    self._remove_dir(path)
+            elif name.endswith(('.zip.part', '.zip.part.json')) and abandoned:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _evict(self, conn, keep=()):
+        """
+        Remove as malhas acessadas há mais tempo até o cache caber em max_bytes.
+        As malhas com chave em `keep` (a que acabou de ser gravada e as protegidas
+        pelo chamador) nunca são removidas.
+        """
+        self._remove_orphans(conn)
+
+        total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM malhas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute("SELECT chave, diretorio, tamanho FROM malhas ORDER BY acessado_em").fetchall()
+        for key, directory, size in rows:
+            if total <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            conn.execute("DELETE FROM malhas WHERE chave = ?", (key,))
+            self._remove_dir(os.path.join(self.cache_dir, directory))
+            total -= size
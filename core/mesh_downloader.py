@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import json
 import os
 import requests
 import zipfile
 import tempfile
 import shutil
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from ..utils import constants
+from .http_session import get_session
+
+# Prefixo do sistema de ficheiros virtual do GDAL para ler ficheiros dentro de um .zip
+VSIZIP_PREFIX = '/vsizip/'
 
 def fetch_available_years():
     """
@@ -15,7 +23,7 @@ def fetch_available_years():
     """
     try:
         url = constants.IBGE_MESH_BASE_URL_PARENT
-        response = requests.get(url, timeout=constants.API_TIMEOUT)
+        response = get_session().get(url, timeout=constants.API_TIMEOUT)
         response.raise_for_status()
         
         year_folders = re.findall(r'href="municipio_(\d{4})/"', response.text)
@@ -30,48 +38,93 @@ def fetch_available_years():
         raise ConnectionError(f"Não foi possível conectar ao servidor do IBGE para buscar os anos: {e}")
 
 
+def load_cached_years(cache_path):
+    """
+    Lê a lista de anos guardada por store_cached_years.
+    :return: Tupla (gravado_em, anos) ou None se não há cache legível.
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        years = [str(year) for year in cached['anos']]
+        return (float(cached['gravado_em']), years) if years else None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def store_cached_years(cache_path, years):
+    """
+    Guarda a lista de anos disponíveis com a data da consulta.
+    """
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'gravado_em': time.time(), 'anos': list(years)}, f)
+    os.replace(temp_path, cache_path)
+
+
+class _RangeNotHonored(IOError):
+    """O servidor respondeu a um pedido parcial com o ficheiro inteiro (ex.: a malha mudou)."""
+
+
 class MeshDownloader:
     """
     Responsável por baixar e extrair ficheiros de malha territorial do IBGE.
+
+    Quando o servidor aceita pedidos parciais (Accept-Ranges), o zip é baixado em
+    segmentos paralelos para um ficheiro .part; o estado de cada segmento fica em
+    um ficheiro .part.json ao lado, de modo que um download interrompido é
+    retomado de onde parou na tentativa seguinte.
     """
 
-    def __init__(self, url):
+    def __init__(self, url, target_dir=None, part_path=None):
         """
         Construtor.
         :param url: A URL completa para o ficheiro .zip da malha.
+        :param target_dir: Diretório onde a malha será extraída (ex.: MeshCache.staging_dir).
+                           Se omitido, é usado um diretório temporário.
+        :param part_path: Caminho estável do download parcial (ex.: MeshCache.partial_path),
+                          para retomá-lo em outra tentativa. Se omitido, fica em target_dir.
         """
         self.url = url
-        self.temp_dir_path = tempfile.mkdtemp()
+        self.temp_dir_path = target_dir or tempfile.mkdtemp()
+        self.part_path = part_path
 
-    def download_and_extract(self, progress_callback=None):
+    def download_and_extract(self, progress_callback=None, is_canceled=None, from_zip=False):
         """
-        Baixa o ficheiro zip, extrai e retorna o caminho para o shapefile.
+        Baixa o ficheiro zip e retorna o caminho para o shapefile.
+
+        Apenas os ficheiros do shapefile escolhido (.shp, .shx, .dbf, .prj...) são
+        lidos do zip, e o CRC de cada um é conferido durante a leitura. O download
+        é conferido com o tamanho anunciado pelo servidor.
         :param progress_callback: Uma função opcional para relatar o progresso.
-        :return: O caminho completo para o ficheiro .shp extraído.
+        :param is_canceled: Função opcional que interrompe o download quando retorna True;
+                            o download parcial é mantido para ser retomado.
+        :param from_zip: Se True, o zip é mantido e o shapefile é lido diretamente dele
+                         pelo GDAL (/vsizip/), sem extração; senão, os ficheiros do
+                         shapefile são extraídos e o zip é apagado.
+        :return: O caminho completo para o ficheiro .shp extraído ou o caminho /vsizip/.
         """
         try:
             zip_path = os.path.join(self.temp_dir_path, 'download.zip')
-            
-            response = requests.get(self.url, stream=True, timeout=constants.DOWNLOAD_TIMEOUT)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            bytes_downloaded = 0
-
-            with open(zip_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=constants.CHUNK_SIZE):
-                    f.write(chunk)
-                    bytes_downloaded += len(chunk)
-                    if progress_callback and total_size > 0:
-                        progress = (bytes_downloaded / total_size) * 100
-                        progress_callback(progress)
-            
+            self._download(zip_path, progress_callback, is_canceled)
+
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
                 shapefile_name = next((name for name in zip_ref.namelist() if name.lower().endswith('.shp')), None)
                 if not shapefile_name:
                     raise FileNotFoundError("Nenhum ficheiro .shp encontrado no arquivo .zip.")
-                zip_ref.extractall(self.temp_dir_path)
-                return os.path.join(self.temp_dir_path, shapefile_name)
+                members = _shapefile_members(zip_ref, shapefile_name)
+                for member in members:
+                    if is_canceled and is_canceled():
+                        raise InterruptedError("Download da malha cancelado.")
+                    if from_zip:
+                        _verify_member(zip_ref, member)
+                    else:
+                        self._extract_member(zip_ref, member)
+
+            if from_zip:
+                return VSIZIP_PREFIX + zip_path.replace(os.sep, '/') + '/' + shapefile_name
+            os.remove(zip_path)
+            return os.path.join(self.temp_dir_path, shapefile_name)
 
         except requests.exceptions.RequestException as e:
             self.cleanup()
@@ -80,6 +133,179 @@ class MeshDownloader:
             self.cleanup()
             raise e
 
+    def _extract_member(self, zip_ref, member):
+        """
+        Extrai um ficheiro do zip em blocos para o diretório da malha. A leitura
+        até o fim confere o CRC do ficheiro (BadZipFile se não conferir).
+        """
+        target = os.path.normpath(os.path.join(self.temp_dir_path, member.filename))
+        if not target.startswith(os.path.normpath(self.temp_dir_path) + os.sep):
+            raise zipfile.BadZipFile(f"Caminho inválido no arquivo .zip da malha: {member.filename}")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with zip_ref.open(member) as source, open(target, 'wb') as destination:
+            shutil.copyfileobj(source, destination, constants.CHUNK_SIZE)
+
+    def _download(self, zip_path, progress_callback=None, is_canceled=None):
+        """
+        Baixa o zip para zip_path, em segmentos se o servidor aceitar pedidos parciais.
+
+        Um pedido do primeiro byte descobre o tamanho e se o servidor aceita Range;
+        se não aceitar, a própria resposta (completa) é gravada diretamente.
+        """
+        part_path = self.part_path or zip_path + '.part'
+        probe = get_session().get(
+            self.url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=constants.DOWNLOAD_TIMEOUT
+        )
+        probe.raise_for_status()
+        total_size = _content_range_total(probe)
+
+        if probe.status_code != 206 or total_size is None:
+            with probe:
+                self._download_single(probe, part_path, progress_callback, is_canceled)
+        else:
+            validator = probe.headers.get('ETag') or probe.headers.get('Last-Modified')
+            probe.close()
+            try:
+                self._download_ranges(part_path, total_size, validator, progress_callback, is_canceled)
+            except _RangeNotHonored:
+                # O ficheiro mudou no servidor: o download parcial não serve mais.
+                _remove_partial(part_path)
+                raise
+
+        if is_canceled and is_canceled():
+            raise InterruptedError("Download da malha cancelado.")
+        os.replace(part_path, zip_path)
+
+    def _download_single(self, response, part_path, progress_callback=None, is_canceled=None):
+        """
+        Grava uma resposta completa (servidor sem suporte a Range) no ficheiro parcial.
+        """
+        _remove_partial(part_path)
+        total_size = int(response.headers.get('content-length', 0))
+        bytes_downloaded = 0
+
+        with open(part_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=constants.CHUNK_SIZE):
+                if is_canceled and is_canceled():
+                    return
+                f.write(chunk)
+                bytes_downloaded += len(chunk)
+                if progress_callback and total_size > 0:
+                    progress = (bytes_downloaded / total_size) * 100
+                    progress_callback(progress)
+
+        if total_size and bytes_downloaded != total_size:
+            raise IOError(f"Download da malha incompleto: {bytes_downloaded} de {total_size} bytes recebidos.")
+
+    def _download_ranges(self, part_path, total_size, validator, progress_callback=None, is_canceled=None):
+        """
+        Baixa os segmentos que faltam em paralelo, cada um na sua posição do ficheiro
+        parcial, e relata o progresso somando os bytes de todos os segmentos.
+        """
+        state_path = part_path + '.json'
+        segments = self._load_segments(state_path, part_path, total_size, validator)
+        if segments is None:
+            segments = _plan_segments(total_size)
+            with open(part_path, 'wb') as f:
+                f.truncate(total_size)
+
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def save_state():
+            with lock:
+                state = {'url': self.url, 'validator': validator, 'total': total_size,
+                         'segments': [list(segment) for segment in segments]}
+            with open(state_path, 'w') as f:
+                json.dump(state, f)
+
+        pending = [segment for segment in segments if segment[0] + segment[2] <= segment[1]]
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = [
+                    executor.submit(self._fetch_segment, segment, part_path, validator, lock, stop)
+                    for segment in pending
+                ]
+                try:
+                    not_done = futures
+                    while not_done:
+                        _, not_done = wait(not_done, timeout=0.5)
+                        if progress_callback:
+                            with lock:
+                                downloaded = sum(segment[2] for segment in segments)
+                            progress_callback(downloaded * 100.0 / total_size)
+                        save_state()
+                        if (is_canceled and is_canceled()) or any(future.done() and future.exception() for future in futures):
+                            stop.set()
+                    for future in futures:
+                        future.result()
+                finally:
+                    stop.set()
+                    save_state()
+
+        if is_canceled and is_canceled():
+            return
+        if any(segment[0] + segment[2] <= segment[1] for segment in segments):
+            raise IOError("Download da malha incompleto.")
+        os.remove(state_path)
+
+    def _load_segments(self, state_path, part_path, total_size, validator):
+        """
+        Lê o estado de um download parcial anterior, se ele for do mesmo ficheiro
+        (mesma URL, tamanho e ETag/Last-Modified).
+        :return: A lista de segmentos [início, fim, bytes baixados] ou None.
+        """
+        if not validator or not os.path.exists(state_path) or not os.path.exists(part_path):
+            return None
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (state.get('url') != self.url or state.get('validator') != validator
+                or state.get('total') != total_size or os.path.getsize(part_path) != total_size):
+            return None
+        return [list(segment) for segment in state.get('segments', [])] or None
+
+    def _fetch_segment(self, segment, part_path, validator, lock, stop):
+        """
+        Baixa um segmento [início, fim, bytes baixados] a partir do ponto em que parou,
+        repetindo até constants.MAX_RETRIES vezes quando a conexão cai no meio.
+        """
+        failures = 0
+        while not stop.is_set():
+            start, end, done = segment
+            if start + done > end:
+                return
+            headers = {'Range': f'bytes={start + done}-{end}'}
+            if validator:
+                headers['If-Range'] = validator
+            try:
+                with get_session().get(self.url, headers=headers, stream=True, timeout=constants.DOWNLOAD_TIMEOUT) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise _RangeNotHonored("O servidor não aceitou o pedido parcial da malha.")
+                    with open(part_path, 'r+b') as f:
+                        f.seek(start + done)
+                        for chunk in response.iter_content(chunk_size=constants.CHUNK_SIZE):
+                            if stop.is_set():
+                                return
+                            chunk = chunk[:end + 1 - (start + segment[2])]
+                            f.write(chunk)
+                            with lock:
+                                segment[2] += len(chunk)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError):
+                failures += 1
+                if failures > constants.MAX_RETRIES:
+                    raise
+                time.sleep(min(constants.HTTP_BACKOFF_FACTOR * (2 ** failures), constants.HTTP_BACKOFF_MAX))
+                continue
+            if segment[0] + segment[2] <= segment[1]:
+                failures += 1
+                if failures > constants.MAX_RETRIES:
+                    raise IOError("Download da malha incompleto.")
+
     def cleanup(self):
         """
         Remove o diretório temporário e o seu conteúdo.
@@ -89,3 +315,51 @@ class MeshDownloader:
                 shutil.rmtree(self.temp_dir_path)
         except Exception:
             pass
+
+
+def _shapefile_members(zip_ref, shapefile_name):
+    """
+    Retorna as entradas do zip que pertencem ao shapefile (mesmo diretório e
+    mesmo nome, qualquer extensão: .shp, .shx, .dbf, .prj, .cpg...).
+    """
+    stem = os.path.splitext(shapefile_name)[0].lower()
+    return [
+        info for info in zip_ref.infolist()
+        if not info.is_dir() and os.path.splitext(info.filename)[0].lower() == stem
+    ]
+
+
+def _verify_member(zip_ref, member):
+    """
+    Lê um ficheiro do zip até o fim, sem gravá-lo, para conferir o seu CRC.
+    """
+    with zip_ref.open(member) as source:
+        while source.read(constants.CHUNK_SIZE):
+            pass
+
+
+def _content_range_total(response):
+    """
+    Retorna o tamanho total anunciado em Content-Range ("bytes 0-0/12345") ou None.
+    """
+    match = re.match(r'bytes\s+\d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+def _plan_segments(total_size):
+    """
+    Divide o ficheiro em até constants.MESH_DOWNLOAD_SEGMENTS segmentos de pelo menos
+    constants.MESH_SEGMENT_MIN_BYTES, como listas [início, fim, bytes baixados].
+    """
+    count = max(1, min(constants.MESH_DOWNLOAD_SEGMENTS, total_size // constants.MESH_SEGMENT_MIN_BYTES))
+    size = -(-total_size // count)
+    return [[start, min(start + size, total_size) - 1, 0] for start in range(0, total_size, size)]
+
+
+def _remove_partial(part_path):
+    """
+    Apaga um download parcial e o seu estado.
+    """
+    for path in (part_path, part_path + '.json'):
+        if os.path.exists(path):
+            os.remove(path)
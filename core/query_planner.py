@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Estimativa do tamanho de consultas à API SIDRA e divisão das que excedem o
+limite de valores por requisição em partes menores.
+"""
+
+import math
+import re
+from urllib.parse import quote, unquote, urlsplit, urlunsplit
+
+from ..utils import constants
+
+_TERRITORY_KEY = re.compile(r'^n(\d+)$')
+_CLASSIFICATION_KEY = re.compile(r'^c(\d+)$')
+_RELATIVE_SELECTION = re.compile(r'^(first|last)(?:\s+(\d+))?$')
+_UF_SELECTION = re.compile(r'^in\s+n3\s+([\d,]+)$')
+
+# Seleções que só podem ser resolvidas com os metadados da tabela
+_METADATA_KEYWORDS = ('all', 'first', 'last')
+
+# Seleções de todos os itens de uma dimensão que podem ser listadas pelos metadados;
+# outras variantes de 'all' não são divididas. 'allxp' são as variáveis sem as
+# derivadas (percentuais).
+_LISTABLE_ALL = ('all', 'allxp')
+
+
+def _split_list(value):
+    """
+    Separa uma lista de códigos da URL ("1,2,3") em itens.
+    """
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _chunk(items, groups):
+    """
+    Divide `items` em até `groups` partes contíguas de tamanho semelhante.
+    """
+    groups = max(1, min(groups, len(items)))
+    size = math.ceil(len(items) / groups)
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def _resolve_selection(value, universe):
+    """
+    Resolve a seleção de uma dimensão (período ou variável) em uma lista de códigos.
+
+    :param value: Valor do segmento da URL (ex.: '2010,2011', 'all', 'last 5', '2010-2015').
+    :param universe: Códigos disponíveis na tabela, em ordem, ou None se desconhecidos.
+                     Para 'allxp', apenas os códigos das variáveis não derivadas.
+    :return: Tupla (quantidade, códigos); códigos é None quando não podem ser listados
+             e quantidade é None quando nem o tamanho pode ser estimado.
+    """
+    value = value.strip().lower()
+    if value.startswith('all'):
+        if universe is None or value not in _LISTABLE_ALL:
+            return None, None
+        return len(universe), list(universe)
+
+    relative = _RELATIVE_SELECTION.match(value)
+    if relative:
+        count = int(relative.group(2) or 1)
+        if universe is None:
+            return count, None
+        codes = universe[-count:] if relative.group(1) == 'last' else universe[:count]
+        return len(codes), list(codes)
+
+    codes = []
+    for item in _split_list(value):
+        if '-' not in item:
+            codes.append(item)
+            continue
+        start, end = item.split('-', 1)
+        if universe is not None:
+            codes.extend(code for code in universe if start <= code <= end)
+        elif start.isdigit() and end.isdigit() and int(end) >= int(start):
+            # Sem metadados, um intervalo de anos é contado como anos consecutivos.
+            codes.extend(str(code) for code in range(int(start), int(end) + 1))
+        else:
+            return None, None
+    return len(codes), codes
+
+
+class SidraQuery:
+    """
+    Consulta de valores da API SIDRA decomposta nos seus segmentos
+    (/t/<tabela>/n6/all/v/93/p/2010/c2/all/...).
+    """
+
+    def __init__(self, url):
+        """
+        :param url: URL completa da API SIDRA (https://apisidra.ibge.gov.br/values/...).
+        """
+        parts = urlsplit(url)
+        path = parts.path
+        prefix_end = path.find('/t/')
+        if prefix_end < 0:
+            raise ValueError(f"Não foi possível extrair o código da tabela da URL: {url}")
+
+        self._parts = parts
+        self._prefix = path[:prefix_end]
+        pieces = [unquote(piece) for piece in path[prefix_end + 1:].split('/')]
+        if pieces and pieces[-1] == '':
+            pieces.pop()
+        if len(pieces) % 2:
+            raise ValueError(f"URL da API SIDRA com segmentos incompletos: {url}")
+        self.segments = [[pieces[i], pieces[i + 1]] for i in range(0, len(pieces), 2)]
+
+    def to_url(self):
+        """
+        Monta a URL da consulta a partir dos segmentos atuais.
+        """
+        path = self._prefix + ''.join(
+            f"/{key}/{quote(value, safe=',-')}" for key, value in self.segments
+        )
+        return urlunsplit(self._parts._replace(path=path))
+
+    def value(self, key):
+        """
+        Retorna o valor do segmento `key` ou None se a consulta não o tem.
+        """
+        for segment_key, segment_value in self.segments:
+            if segment_key == key:
+                return segment_value
+        return None
+
+    def replace(self, key, value):
+        """
+        Retorna uma cópia da consulta com o valor do segmento `key` substituído.
+        """
+        copy = SidraQuery.__new__(SidraQuery)
+        copy._parts = self._parts
+        copy._prefix = self._prefix
+        copy.segments = [
+            [segment_key, value if segment_key == key else segment_value]
+            for segment_key, segment_value in self.segments
+        ]
+        return copy
+
+    @property
+    def table_code(self):
+        return self.value('t')
+
+    def territories(self):
+        """
+        Retorna os segmentos territoriais da consulta como pares (nível, seleção).
+        """
+        return [
+            (match.group(1), value)
+            for key, value in self.segments
+            for match in [_TERRITORY_KEY.match(key)] if match
+        ]
+
+    def classifications(self):
+        """
+        Retorna os segmentos de classificação como pares (id da classificação, seleção).
+        """
+        return [
+            (match.group(1), value)
+            for key, value in self.segments
+            for match in [_CLASSIFICATION_KEY.match(key)] if match
+        ]
+
+    def needs_metadata(self):
+        """
+        Indica se o tamanho da consulta depende dos metadados da tabela
+        (seleções como 'all', 'last 5' ou intervalos de períodos).
+        """
+        values = [self.value('v') or '', self.value('p') or '']
+        values.extend(value for _, value in self.classifications())
+        for value in values:
+            value = value.strip().lower()
+            if value.startswith(_METADATA_KEYWORDS) or '-' in value:
+                return True
+        return False
+
+
+def _period_codes(metadata):
+    if not metadata:
+        return None
+    periods = metadata.get('Periodos', {}).get('Periodos', [])
+    return [str(period.get('Codigo')) for period in periods] or None
+
+
+def _variable_codes(metadata, selection='all'):
+    """
+    Códigos das variáveis da tabela na ordem dos metadados, cada uma seguida das
+    suas variáveis derivadas, que a seleção 'allxp' exclui.
+    """
+    if not metadata:
+        return None
+    include_derived = selection.strip().lower() != 'allxp'
+    codes = []
+    for variable in metadata.get('Variaveis', []):
+        codes.append(str(variable.get('Id')))
+        if include_derived:
+            codes.extend(str(derived.get('Id')) for derived in variable.get('VariaveisDerivadas', []))
+    return codes or None
+
+
+def _category_count(value, class_id, metadata):
+    """
+    Conta as categorias selecionadas de uma classificação.
+    """
+    value = value.strip().lower()
+    if not value.startswith('all'):
+        return len(_split_list(value)) or 1
+    if not metadata:
+        return 1
+    for classification in metadata.get('Classificacoes', []):
+        if str(classification.get('Id')) == class_id:
+            count = len(classification.get('Categorias', [])) or 1
+            # 'allxt' exclui a categoria total.
+            return max(count - 1, 1) if value == 'allxt' else count
+    return 1
+
+
+def _territory_count(level, value):
+    """
+    Estima quantas unidades territoriais uma seleção retorna.
+    """
+    value = value.strip().lower()
+    level_count = constants.NIVEIS_TERRITORIAIS_QTD.get(level)
+    if value == 'all':
+        return level_count or 1
+
+    uf_selection = _UF_SELECTION.match(value)
+    if uf_selection:
+        ufs = _split_list(uf_selection.group(1))
+        if level == '3':
+            return len(ufs)
+        if not level_count:
+            return 1
+        municipalities = sum(constants.MUNICIPIOS_POR_UF.get(uf, 0) for uf in ufs)
+        total = sum(constants.MUNICIPIOS_POR_UF.values())
+        return max(1, math.ceil(level_count * municipalities / total))
+
+    if value.startswith('in '):
+        # Outras seleções contidas ("in n2 3"): usa o total do nível como limite superior.
+        return level_count or 1
+    return len(_split_list(value)) or 1
+
+
+def estimate_cells(query, metadata=None):
+    """
+    Estima o número de valores (células) retornados por uma consulta.
+
+    :param query: SidraQuery.
+    :param metadata: Metadados da tabela (get_metadata_from_api), usados para resolver
+                     seleções como 'all' e 'last 5'. Dimensões que não podem ser
+                     resolvidas contam como 1.
+    :return: A estimativa de células.
+    """
+    territories = sum(_territory_count(level, value) for level, value in query.territories()) or 1
+
+    variables = 1
+    if query.value('v') is not None:
+        variables = _resolve_selection(query.value('v'), _variable_codes(metadata, query.value('v')))[0] or 1
+
+    periods = 1
+    if query.value('p') is not None:
+        periods = _resolve_selection(query.value('p'), _period_codes(metadata))[0] or 1
+
+    cells = territories * variables * periods
+    for class_id, value in query.classifications():
+        cells *= _category_count(value, class_id, metadata)
+    return cells
+
+
+def _split_dimension(query, key, universe, groups):
+    """
+    Divide a seleção do segmento `key` em até `groups` listas explícitas.
+    """
+    value = query.value(key)
+    if value is None:
+        return None
+    _, codes = _resolve_selection(value, universe)
+    if not codes or len(codes) < 2:
+        return None
+    return [query.replace(key, ','.join(part)) for part in _chunk(codes, groups)]
+
+
+def _split_periods(query, metadata, groups):
+    return _split_dimension(query, 'p', _period_codes(metadata), groups)
+
+
+def _split_variables(query, metadata, groups):
+    return _split_dimension(query, 'v', _variable_codes(metadata, query.value('v') or 'all'), groups)
+
+
+def _group_ufs(ufs, groups):
+    """
+    Agrupa UFs consecutivas em até `groups` partes com número semelhante de municípios.
+    """
+    weights = [constants.MUNICIPIOS_POR_UF.get(uf, 1) for uf in ufs]
+    target = sum(weights) / max(groups, 1)
+    result = [[]]
+    current = 0
+    for uf, weight in zip(ufs, weights):
+        if result[-1] and current + weight > target:
+            result.append([])
+            current = 0
+        result[-1].append(uf)
+        current += weight
+    return result
+
+
+def _split_territories(query, metadata, groups):
+    """
+    Divide a seleção territorial: níveis contidos nas UFs viram grupos de UFs
+    ("in n3 11,12"), listas explícitas de unidades são repartidas.
+    """
+    territories = query.territories()
+    if len(territories) != 1:
+        return None
+    level, value = territories[0]
+    key = f'n{level}'
+    normalized = value.strip().lower()
+
+    if level in constants.NIVEIS_DIVISIVEIS_POR_UF:
+        if normalized == 'all':
+            ufs = list(constants.MUNICIPIOS_POR_UF)
+        else:
+            uf_selection = _UF_SELECTION.match(normalized)
+            ufs = _split_list(uf_selection.group(1)) if uf_selection else None
+        if ufs is not None:
+            if len(ufs) < 2:
+                return None
+            return [query.replace(key, f"in n3 {','.join(part)}") for part in _group_ufs(ufs, groups)]
+
+    if normalized == 'all' or normalized.startswith('in '):
+        return None
+    units = _split_list(value)
+    if len(units) < 2:
+        return None
+    return [query.replace(key, ','.join(part)) for part in _chunk(units, groups)]
+
+
+_SPLITTERS = (_split_periods, _split_variables, _split_territories)
+
+
+def split_query(query, metadata=None, limit=None):
+    """
+    Divide uma consulta em partes que não excedem `limit` células, cortando
+    primeiro os períodos, depois as variáveis e por fim os territórios.
+
+    Uma parte que não pode mais ser dividida é mantida mesmo acima do limite.
+
+    :param query: SidraQuery.
+    :param metadata: Metadados da tabela, opcionais (ver estimate_cells).
+    :param limit: Número máximo de células por parte (padrão: constants.SIDRA_CELL_LIMIT).
+    :return: Lista de SidraQuery, na ordem em que os resultados devem ser unidos.
+    """
+    if limit is None:
+        limit = constants.SIDRA_CELL_LIMIT
+    cells = estimate_cells(query, metadata)
+    if cells <= limit:
+        return [query]
+
+    groups = math.ceil(cells / limit)
+    for splitter in _SPLITTERS:
+        parts = splitter(query, metadata, groups)
+        if parts and len(parts) > 1:
+            result = []
+            for part in parts:
+                result.extend(split_query(part, metadata, limit))
+            return result
+    return [query]
@@ -1,7 +1,15 @@
+import codecs
+import json
+import numpy as np
 import pandas as pd
 import requests
 import xml.etree.ElementTree as ET
 import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ..utils import constants
+from .query_planner import SidraQuery, split_query
+from .http_session import get_session
 
 try:
     from qgis.core import QgsMessageLog, Qgis
@@ -9,17 +17,595 @@ try:
 except ImportError:
     QGIS_AVAILABLE = False
 
+# Intervalo (s) entre verificações de cancelamento enquanto as partes são baixadas
+_CANCEL_POLL_INTERVAL = 0.2
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_XML_ROW_TAG = '{http://schemas.datacontract.org/2004/07/IBGE.BTE.Tabela}ValorDescritoPorSuasDimensoes'
+# Nome completo da dimensão de período ('Ano', 'Trimestre Móvel'...); classificações
+# que apenas começam com essas palavras ('Anos de estudo', 'Mês de referência') não contam.
+_PERIOD_DIMENSION = re.compile(r'^(ano|mês|bimestre|trimestre|semestre|período|quinquênio|decênio)(\s+móvel)?$', re.IGNORECASE)
+
+# Formatos de saída do lookup
+OUTPUT_DEFAULT = 'default'  # {geo_code: {variável: valor}}, com sufixos _1, _2 em repetições
+OUTPUT_WIDE = 'wide'        # {geo_code: {v<var>_p<período>_c<categoria>: valor}}
+OUTPUT_LONG = 'long'        # {geo_code: [linha, ...]}, uma linha por valor
+
+
+def _parse_values(series: pd.Series) -> list:
+    """
+    Converte uma coluna de valores do SIDRA de uma só vez.
+
+    Valores numéricos (com vírgula ou ponto decimal) viram float, valores especiais
+    do SIDRA ('-', '...', 'X') são mantidos como texto e ausentes viram None.
+
+    :param series: Coluna do DataFrame com os valores brutos.
+    :return: Lista com os valores processados, na mesma ordem da coluna.
+    """
+    raw = series.to_numpy(dtype=object)
+    parsed = np.full(len(raw), None, dtype=object)
+    present = pd.notna(raw)
+    if not present.any():
+        return parsed.tolist()
+
+    original = pd.Series(raw[present], dtype=object).astype(str)
+    text = original.str.replace(',', '.', regex=False)
+    is_numeric = text.str.replace('.', '', regex=False).str.replace('-', '', regex=False).str.isdigit()
+    is_numeric = is_numeric.to_numpy(dtype=bool)
+
+    present_values = original.to_numpy(dtype=object)
+    if is_numeric.any():
+        candidates = text.to_numpy(dtype=object)[is_numeric]
+        try:
+            numbers = candidates.astype(float).tolist()
+        except ValueError:
+            # Texto como "1.2.3" passa no teste de dígitos mas não é um número.
+            numbers = []
+            for candidate, fallback in zip(candidates, present_values[is_numeric]):
+                try:
+                    numbers.append(float(candidate))
+                except ValueError:
+                    numbers.append(fallback)
+        numeric_values = np.empty(len(numbers), dtype=object)
+        numeric_values[:] = numbers
+        present_values[is_numeric] = numeric_values
+
+    parsed[present] = present_values
+    return parsed.tolist()
+
+
+def _resolve_variable_keys(geo_codes: list, variable_names: list) -> list:
+    """
+    Gera as chaves de variável de cada linha, numerando repetições dentro do mesmo
+    código geográfico (Variável, Variável_1, Variável_2...).
+
+    :param geo_codes: Códigos geográficos de cada linha.
+    :param variable_names: Nomes de variável de cada linha.
+    :return: Lista com a chave final de cada linha.
+    """
+    frame = pd.DataFrame({'geo': geo_codes, 'name': variable_names}, dtype=object)
+    occurrence = frame.groupby(['geo', 'name'], sort=False).cumcount().to_numpy()
+    repeated = np.flatnonzero(occurrence)
+    if not len(repeated):
+        return list(variable_names)
+
+    keys = list(variable_names)
+    suffixed = {position: f"{keys[position]}_{occurrence[position]}" for position in repeated}
+
+    if set(variable_names).isdisjoint(suffixed.values()):
+        for position, key in suffixed.items():
+            keys[position] = key
+        return keys
+
+    # Um sufixo gerado coincide com um nome real de variável: numera linha a linha.
+    keys = []
+    used_keys = {}
+    for geo_code, variable_name in zip(geo_codes, variable_names):
+        geo_keys = used_keys.setdefault(geo_code, set())
+        var_key = variable_name
+        counter = 1
+        while var_key in geo_keys:
+            var_key = f"{variable_name}_{counter}"
+            counter += 1
+        geo_keys.add(var_key)
+        keys.append(var_key)
+    return keys
+
+
+def _dimension_role(description) -> str:
+    """
+    Classifica uma dimensão da resposta pelo seu nome no cabeçalho.
+
+    :param description: Nome da dimensão no cabeçalho (ex.: 'Variável', 'Ano', 'Sexo').
+    :return: 'v' (variável), 'p' (período), 'c' (classificação) ou '' se o cabeçalho não for conhecido.
+    """
+    if not description:
+        return ''
+    description = str(description).strip()
+    if description.lower().startswith('variável'):
+        return 'v'
+    if _PERIOD_DIMENSION.match(description):
+        return 'p'
+    return 'c'
+
+
+def _compact_text(series: pd.Series) -> pd.Categorical:
+    """
+    Converte uma coluna de texto em categórica, removendo espaços apenas dos
+    valores distintos em vez de linha a linha.
+    """
+    codes, uniques = pd.factorize(series.to_numpy(dtype=object))
+    stripped = pd.Index([str(value).strip() for value in uniques], dtype=object)
+    if not stripped.is_unique:
+        values = stripped.to_numpy()[codes]
+        values[codes < 0] = None
+        return pd.Categorical(values)
+    return pd.Categorical.from_codes(codes, stripped)
+
+
+def _concat_categoricals(categoricals: list) -> pd.Series:
+    """
+    Une colunas categóricas de vários blocos em uma única Series de texto.
+    """
+    if not categoricals:
+        return pd.Series([], dtype=object)
+    return pd.Series(pd.api.types.union_categoricals(categoricals, ignore_order=True)).astype(str)
+
+
+def _iter_json_array(byte_chunks):
+    """
+    Lê incrementalmente um array JSON a partir de blocos de bytes, produzindo um
+    elemento por vez, sem carregar a resposta inteira em memória.
+
+    :param byte_chunks: Iterável de blocos de bytes (ex.: response.iter_content()).
+    :return: Gerador com os elementos do array, na ordem em que aparecem.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    position = 0
+    inside_array = False
+
+    for chunk in byte_chunks:
+        buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+
+        while True:
+            position = _JSON_WHITESPACE.match(buffer, position).end()
+            if position >= len(buffer):
+                break
+
+            char = buffer[position]
+            if not inside_array:
+                if char != '[':
+                    raise ValueError("A resposta da API SIDRA não é um array JSON.")
+                inside_array = True
+                position += 1
+                continue
+            if char == ',':
+                position += 1
+                continue
+            if char == ']':
+                return
+
+            try:
+                item, position_end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Elemento incompleto: aguarda o próximo bloco da resposta.
+                break
+            yield item
+            position = position_end
+
+    if inside_array or buffer[position:].strip():
+        raise ValueError("Resposta JSON da API SIDRA incompleta ou inválida.")
+
+
+class SidraLookupBuilder:
+    """
+    Monta o dicionário de lookup do SIDRA a partir de blocos de linhas.
+
+    Cada bloco é reduzido assim que chega às colunas usadas na conversão (código
+    geográfico, valores já convertidos e candidatas a coluna de variável), de modo
+    que as linhas brutas da resposta não precisam ficar em memória até o final.
+
+    Nos formatos OUTPUT_WIDE e OUTPUT_LONG também são guardados os códigos e nomes
+    de todas as dimensões não geográficas (variável, período e classificações).
+    """
+
+    EXCLUDED_COLUMNS = {
+        'geo_code', 'D1C', 'D1N', 'D2C', 'D2N', 'D3C', 'D3N', 'D4C', 'D4N',
+        'NC', 'NN', 'MC', 'MN'
+    }
+    VARIABLE_CANDIDATES = ['D4N', 'D3N', 'D2N', 'D5N', 'D6N', 'D7N']
+
+    def __init__(self, geo_code_col: str = None, output_mode: str = OUTPUT_DEFAULT, header: dict = None):
+        """
+        Inicializa um construtor de lookup vazio.
+
+        :param geo_code_col: Coluna com o código geográfico, quando já conhecida (ex.: 'D1C').
+                             Se omitida, é identificada a partir das colunas recebidas.
+        :param output_mode: Formato do lookup: OUTPUT_DEFAULT, OUTPUT_WIDE ou OUTPUT_LONG.
+        :param header: Cabeçalho da resposta ({código da coluna: descrição}), usado para
+                       reconhecer variável, período e classificações nos formatos wide/long.
+        """
+        self.header_info = {}
+        self.output_mode = output_mode
+        self._header = dict(header) if header else {}
+        self._dimensions = []
+        self._geo_code_hint = geo_code_col
+        self.rows_received = 0
+        self._columns = None
+        self._geo_code_col = None
+        self._value_cols = []
+        self._candidates = []
+        self._candidate_values = {}
+        self._chunks = []
+
+    def add_rows(self, rows: list, columns: list):
+        """
+        Adiciona um bloco de linhas da resposta da API.
+
+        :param rows: Lista de dicionários (uma linha por item), como na resposta JSON.
+        :param columns: Códigos das colunas, na ordem do cabeçalho da resposta.
+        """
+        if rows:
+            self.add_dataframe(pd.DataFrame(rows, columns=columns))
+
+    def add_dataframe(self, df: pd.DataFrame):
+        """
+        Adiciona um bloco de linhas já carregado em um DataFrame.
+
+        :param df: DataFrame com as colunas da resposta do SIDRA.
+        """
+        if df.empty:
+            return
+
+        if self._columns is None:
+            self._prepare(df)
+        self.rows_received += len(df)
+
+        if self._geo_code_col is None:
+            return
+
+        tracked_candidates = self._tracked_candidates()
+        for candidate in tracked_candidates:
+            self._candidate_values[candidate].update(df[candidate].dropna().unique().tolist())
+
+        geo_series = df[self._geo_code_col]
+        geo_present = geo_series.notna().to_numpy()
+        chunk = {
+            'geo_codes': pd.Categorical(geo_series[geo_present].astype(str).str.strip().to_numpy(dtype=object)),
+            'names': {},
+            'values': {},
+        }
+
+        for candidate in tracked_candidates:
+            variable_series = df[candidate][geo_present]
+            chunk['names'][candidate] = pd.Categorical(np.where(
+                variable_series.notna().to_numpy(),
+                variable_series.astype(str).str.strip().to_numpy(dtype=object),
+                'Valor'
+            ))
+
+        for col in self._value_cols:
+            if col == 'V':
+                chunk['values'][col] = _parse_values(df[col][geo_present])
+            else:
+                # Colunas extras só são convertidas se a lógica de fallback for usada.
+                chunk['values'][col] = pd.Categorical(df[col][geo_present].to_numpy(dtype=object))
+
+        if self._dimensions:
+            chunk['dimensions'] = {}
+            for code_col, name_col, _ in self._dimensions:
+                chunk['dimensions'][code_col] = _compact_text(df[code_col][geo_present])
+                chunk['dimensions'][name_col] = _compact_text(df[name_col][geo_present])
+            if 'MN' in self._columns:
+                chunk['dimensions']['MN'] = _compact_text(df['MN'][geo_present])
+
+        self._chunks.append(chunk)
+
+    def merge(self, other: 'SidraLookupBuilder'):
+        """
+        Acrescenta os blocos de outro construtor, montado com outra parte da mesma
+        consulta (ver query_planner.split_query), depois dos blocos já recebidos.
+
+        :param other: Construtor com as linhas de uma parte da consulta.
+        """
+        if other is None or other.rows_received == 0:
+            return
+        if self.rows_received == 0:
+            self.__dict__.update(other.__dict__)
+            self.header_info = dict(other.header_info)
+            self._chunks = list(other._chunks)
+            self._candidate_values = {col: set(values) for col, values in other._candidate_values.items()}
+            return
+        if other._columns != self._columns or other._geo_code_col != self._geo_code_col:
+            raise ValueError("As partes da consulta ao SIDRA retornaram colunas diferentes.")
+
+        self.rows_received += other.rows_received
+        for candidate, values in other._candidate_values.items():
+            self._candidate_values.setdefault(candidate, set()).update(values)
+        self._chunks.extend(other._chunks)
+
+    def _prepare(self, df: pd.DataFrame):
+        """
+        Identifica as colunas de valores, a coluna geográfica e o cabeçalho a partir
+        do primeiro bloco recebido.
+        """
+        columns = list(df.columns)
+        self._columns = columns
+
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Colunas disponíveis: {columns}", "SIDRA Connector", Qgis.Info)
+
+        first_row = df.iloc[0]
+        for col in columns:
+            if col.endswith('N'):
+                self.header_info[col] = first_row[col] if pd.notna(first_row[col]) else col
+
+        if self._geo_code_hint in columns:
+            geo_code_col = self._geo_code_hint
+        elif 'geo_code' in columns:
+            geo_code_col = 'geo_code'
+        else:
+            if QGIS_AVAILABLE:
+                QgsMessageLog.logMessage("Coluna 'geo_code' não encontrada. Tentando identificar coluna geográfica...", "SIDRA Connector", Qgis.Warning)
+
+            geo_candidates = [col for col in columns if col.endswith('C') and any(dim in col for dim in ['D1', 'D2', 'D3', 'D4'])]
+            if 'D1C' in columns:
+                geo_code_col = 'D1C'
+            elif geo_candidates:
+                geo_code_col = geo_candidates[0]
+            else:
+                if QGIS_AVAILABLE:
+                    QgsMessageLog.logMessage("Nenhuma coluna geográfica identificada", "SIDRA Connector", Qgis.Critical)
+                return
+
+            if QGIS_AVAILABLE:
+                QgsMessageLog.logMessage(f"Usando coluna '{geo_code_col}' como código geográfico", "SIDRA Connector", Qgis.Info)
+
+        self._geo_code_col = geo_code_col
+
+        self._value_cols = ['V'] if 'V' in columns else []
+        for col in columns:
+            if col not in self.EXCLUDED_COLUMNS and col != geo_code_col and col not in self._value_cols:
+                self._value_cols.append(col)
+
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Colunas de valores identificadas: {self._value_cols}", "SIDRA Connector", Qgis.Info)
+
+        geo_name_col = geo_code_col[:-1] + 'N'
+        self._candidates = [col for col in self.VARIABLE_CANDIDATES if col in columns and col != geo_name_col]
+        self._candidate_values = {col: set() for col in self._candidates}
+
+        if self.output_mode != OUTPUT_DEFAULT and 'V' in columns:
+            for i in range(1, 10):
+                code_col, name_col = f'D{i}C', f'D{i}N'
+                if code_col in columns and code_col != geo_code_col:
+                    self._dimensions.append((
+                        code_col,
+                        name_col if name_col in columns else code_col,
+                        _dimension_role(self._header.get(name_col))
+                    ))
+
+    def _tracked_candidates(self) -> list:
+        """
+        Retorna as candidatas a coluna de variável que ainda podem ser escolhidas.
+        Candidatas de menor prioridade deixam de ser acompanhadas quando uma de
+        maior prioridade já tem mais de um valor distinto.
+        """
+        tracked = []
+        for candidate in self._candidates:
+            tracked.append(candidate)
+            if len(self._candidate_values[candidate]) > 1:
+                break
+        return tracked
+
+    def _variable_column(self):
+        """
+        Escolhe a coluna de variável: a primeira candidata com mais de um valor distinto.
+        """
+        for candidate in self._candidates:
+            if len(self._candidate_values[candidate]) > 1:
+                return candidate
+        return None
+
+    def _concat(self, getter) -> list:
+        """
+        Concatena, na ordem de chegada, uma coluna compacta de todos os blocos.
+        """
+        combined = []
+        for chunk in self._chunks:
+            combined.extend(getter(chunk))
+        return combined
+
+    def build(self) -> tuple:
+        """
+        Gera o dicionário de lookup a partir de todos os blocos recebidos.
+
+        :return: Tupla (sidra_data_dict, header_info)
+        """
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Iniciando conversão dos dados. Linhas recebidas: {self.rows_received}", "SIDRA Connector", Qgis.Info)
+
+        if self.rows_received == 0:
+            if QGIS_AVAILABLE:
+                QgsMessageLog.logMessage("DataFrame vazio recebido da API SIDRA", "SIDRA Connector", Qgis.Warning)
+            return {}, {}
+
+        if self._geo_code_col is None:
+            return {}, self.header_info
+
+        if self._dimensions and self.output_mode == OUTPUT_WIDE:
+            return self._build_wide()
+        if self._dimensions and self.output_mode == OUTPUT_LONG:
+            return self._build_long()
+
+        sidra_data_dict = {}
+        rows_processed = 0
+
+        variable_column = self._variable_column()
+        has_value_column = 'V' in self._columns       # Valor
+
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Coluna de variável identificada: {variable_column}", "SIDRA Connector", Qgis.Info)
+            QgsMessageLog.logMessage(f"Tem coluna de valor (V): {has_value_column}", "SIDRA Connector", Qgis.Info)
+
+        geo_codes = self._concat(lambda chunk: chunk['geo_codes'].tolist())
+
+        if variable_column and has_value_column:
+            variable_names = self._concat(lambda chunk: chunk['names'][variable_column].tolist())
+            values = self._concat(lambda chunk: chunk['values']['V'])
+            var_keys = _resolve_variable_keys(geo_codes, variable_names)
+
+            for geo_code, var_key, value in zip(geo_codes, var_keys, values):
+                geo_entry = sidra_data_dict.get(geo_code)
+                if geo_entry is None:
+                    geo_entry = sidra_data_dict[geo_code] = {}
+                geo_entry[var_key] = value
+            rows_processed = len(geo_codes)
+
+        else:
+            if QGIS_AVAILABLE:
+                QgsMessageLog.logMessage("Usando lógica de fallback - sem agrupamento por variável", "SIDRA Connector", Qgis.Info)
+
+            parsed_columns = []
+            for col in self._value_cols:
+                if col == 'V':
+                    parsed = self._concat(lambda chunk: chunk['values']['V'])
+                else:
+                    parsed = self._concat(lambda chunk, col=col: _parse_values(pd.Series(chunk['values'][col])))
+                parsed_columns.append((col, parsed))
+
+            for position, geo_code in enumerate(geo_codes):
+                row_data = {
+                    col: parsed[position]
+                    for col, parsed in parsed_columns
+                    if parsed[position] is not None
+                }
+                if row_data:
+                    sidra_data_dict[geo_code] = row_data
+                    rows_processed += 1
+
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Conversão concluída: {len(sidra_data_dict)} registros geográficos, {rows_processed} linhas processadas", "SIDRA Connector", Qgis.Info)
+            if len(sidra_data_dict) > 0:
+                sample_key = next(iter(sidra_data_dict.keys()))
+                sample_data = sidra_data_dict[sample_key]
+                variables = list(sample_data.keys())
+                QgsMessageLog.logMessage(f"Exemplo de dados: geo_code={sample_key}, variáveis={variables}", "SIDRA Connector", Qgis.Info)
+
+        return sidra_data_dict, self.header_info
+
+    def _dimension_series(self, column: str) -> pd.Series:
+        """
+        Concatena, na ordem de chegada, uma coluna de dimensão de todos os blocos.
+        """
+        return _concat_categoricals([chunk['dimensions'][column] for chunk in self._chunks])
+
+    def _build_wide(self) -> tuple:
+        """
+        Formato largo: uma coluna por combinação de variável × período × categorias,
+        nomeada pelos códigos das dimensões (ex.: v93_p2010_c6794). Como cada
+        combinação é única por código geográfico, não há numeração de repetições.
+
+        Os nomes legíveis de cada coluna ficam em header_info['field_aliases'].
+
+        :return: Tupla (sidra_data_dict, header_info)
+        """
+        geo_codes = self._concat(lambda chunk: chunk['geo_codes'].tolist())
+        values = self._concat(lambda chunk: chunk['values']['V'])
+
+        keys = None
+        labels = None
+        for position, (code_col, name_col, role) in enumerate(self._dimensions, start=1):
+            prefix = role or f'd{position}_'
+            part = prefix + self._dimension_series(code_col)
+            name = self._dimension_series(name_col)
+            keys = part if keys is None else keys.str.cat(part, sep='_')
+            labels = name if labels is None else labels.str.cat(name, sep=' - ')
+
+        first = pd.DataFrame({'key': keys, 'label': labels}).drop_duplicates('key')
+        self.header_info['field_aliases'] = dict(zip(first['key'], first['label']))
+        self.header_info['output_mode'] = OUTPUT_WIDE
+
+        sidra_data_dict = {}
+        for geo_code, key, value in zip(geo_codes, keys.tolist(), values):
+            geo_entry = sidra_data_dict.get(geo_code)
+            if geo_entry is None:
+                geo_entry = sidra_data_dict[geo_code] = {}
+            geo_entry[key] = value
+
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Conversão (formato largo) concluída: {len(sidra_data_dict)} registros geográficos, {len(first)} colunas", "SIDRA Connector", Qgis.Info)
+        return sidra_data_dict, self.header_info
+
+    def _build_long(self) -> tuple:
+        """
+        Formato longo: uma linha por valor, com os códigos e nomes de cada dimensão,
+        a unidade de medida e o valor numérico, agrupadas por código geográfico.
+
+        As colunas das linhas ficam em header_info['long_columns'] como pares
+        (nome, descrição).
+
+        :return: Tupla (sidra_data_dict, header_info)
+        """
+        geo_codes = self._concat(lambda chunk: chunk['geo_codes'].tolist())
+        role_names = {'v': 'variavel', 'p': 'periodo', 'c': 'categoria'}
+        role_totals = {}
+        for _, _, role in self._dimensions:
+            role_totals[role] = role_totals.get(role, 0) + 1
+
+        long_columns = []
+        column_values = []
+        role_counts = {}
+        for position, (code_col, name_col, role) in enumerate(self._dimensions, start=1):
+            base = role_names.get(role, f'd{position}')
+            if role and role_totals[role] > 1:
+                role_counts[role] = role_counts.get(role, 0) + 1
+                base = f'{base}_{role_counts[role]}'
+            long_columns.append((f'{base}_cod', self._header.get(code_col, code_col)))
+            column_values.append(self._dimension_series(code_col).tolist())
+            if name_col != code_col:
+                long_columns.append((base, self._header.get(name_col, name_col)))
+                column_values.append(self._dimension_series(name_col).tolist())
+
+        if 'MN' in self._columns:
+            long_columns.append(('unidade', self._header.get('MN', 'Unidade de Medida')))
+            column_values.append(self._dimension_series('MN').tolist())
+
+        values = self._concat(lambda chunk: chunk['values']['V'])
+        long_columns.append(('valor', self._header.get('V', 'Valor')))
+        column_values.append([value if isinstance(value, float) else None for value in values])
+
+        self.header_info['long_columns'] = long_columns
+        self.header_info['output_mode'] = OUTPUT_LONG
+
+        sidra_data_dict = {}
+        for geo_code, row in zip(geo_codes, zip(*column_values)):
+            geo_rows = sidra_data_dict.get(geo_code)
+            if geo_rows is None:
+                geo_rows = sidra_data_dict[geo_code] = []
+            geo_rows.append(row)
+
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Conversão (formato longo) concluída: {len(sidra_data_dict)} registros geográficos, {len(geo_codes)} linhas", "SIDRA Connector", Qgis.Info)
+        return sidra_data_dict, self.header_info
+
+
 class SidraApiClient:
     """
     Cliente para interagir com a API do SIDRA para obter dados de tabelas.
     """
 
-    def __init__(self, table_query: any):
+    def __init__(self, table_query: any, cache=None):
         """
         Inicializa o cliente da API do SIDRA.
 
         :param table_query: O código da tabela (int) ou a URL completa da API do SIDRA (str).
+        :param cache: ResponseCache opcional para reutilizar respostas já baixadas.
         """
+        self.cache = cache
         self.full_query_url = None
         if isinstance(table_query, str) and table_query.startswith('http'):
             self.full_query_url = table_query
@@ -34,11 +620,24 @@ class SidraApiClient:
         self.base_url = f"https://apisidra.ibge.gov.br/values/t/{self.table_code}"
 
 
-    def fetch_and_parse(self, params: dict = None) -> tuple:
+    def fetch_and_parse(self, params: dict = None, stream: bool = True, force_refresh: bool = False,
+                        output_mode: str = OUTPUT_DEFAULT, metadata_loader=None,
+                        progress_callback=None, is_canceled=None) -> tuple:
         """
         Busca e analisa dados da API do SIDRA com base nos parâmetros fornecidos.
 
+        Consultas estimadas acima de constants.SIDRA_CELL_LIMIT valores são divididas
+        por períodos, variáveis e territórios (ver query_planner.split_query); as
+        partes são baixadas em paralelo e unidas em um único lookup.
+
         :param params: Um dicionário de parâmetros para a consulta da API (ignorado se uma URL completa foi usada na inicialização).
+        :param stream: Se True, lê a resposta JSON incrementalmente, em blocos de constants.STREAM_CHUNK_ROWS linhas.
+        :param force_refresh: Se True, ignora a resposta em cache e baixa os dados novamente.
+        :param output_mode: Formato do lookup: OUTPUT_DEFAULT, OUTPUT_WIDE ou OUTPUT_LONG.
+        :param metadata_loader: Função opcional (código da tabela → metadados) usada apenas quando
+                                o tamanho da consulta depende deles (ex.: 'all', 'last 5').
+        :param progress_callback: Função opcional para relatar o progresso (0 a 100) por parte concluída.
+        :param is_canceled: Função opcional que indica se a busca foi cancelada.
         :return: Uma tupla (sidra_data_dict, header_info) onde sidra_data_dict é um dicionário de lookup e header_info contém metadados.
         """
 
@@ -55,68 +654,272 @@ class SidraApiClient:
                 path_params = "/".join([f"{k}/{v}" for k, v in sanitized_params.items()])
                 final_url = f"{self.base_url}/{path_params}"
 
+        part_urls = self._plan_parts(final_url, metadata_loader)
+        if len(part_urls) == 1:
+            builder = self._fetch_builder(final_url, stream, force_refresh, output_mode)
+        else:
+            builder = self._fetch_parts(part_urls, stream, force_refresh, output_mode, progress_callback, is_canceled)
+            if builder is None:
+                raise InterruptedError("Busca de dados do SIDRA cancelada.")
+
+        if builder is None:
+            return {}, {}
+        return builder.build()
+
+    def _plan_parts(self, url: str, metadata_loader=None) -> list:
+        """
+        Divide a URL em partes que respeitam o limite de valores por requisição.
+
+        :return: Lista de URLs; a própria URL se não for preciso dividir.
+        """
+        try:
+            query = SidraQuery(url)
+        except ValueError:
+            return [url]
+
+        metadata = None
+        if metadata_loader and query.needs_metadata():
+            metadata = metadata_loader(self.table_code)
+
+        parts = split_query(query, metadata)
+        if len(parts) == 1:
+            return [url]
+
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Consulta acima do limite de {constants.SIDRA_CELL_LIMIT} valores dividida em {len(parts)} partes", "SIDRA Connector", Qgis.Info)
+        return [part.to_url() for part in parts]
+
+    def _fetch_parts(self, part_urls: list, stream: bool, force_refresh: bool, output_mode: str,
+                     progress_callback=None, is_canceled=None):
+        """
+        Baixa as partes de uma consulta dividida em paralelo, com no máximo
+        constants.SIDRA_MAX_PARALLEL_REQUESTS requisições ao mesmo tempo, e une os
+        resultados na ordem das partes.
+
+        :return: O SidraLookupBuilder com todas as partes ou None se a busca foi cancelada.
+        """
+        builders = [None] * len(part_urls)
+        workers = min(constants.SIDRA_MAX_PARALLEL_REQUESTS, len(part_urls))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                executor.submit(self._fetch_builder, url, stream, force_refresh, output_mode): position
+                for position, url in enumerate(part_urls)
+            }
+            pending = set(futures)
+            done_count = 0
+            while pending:
+                done, pending = wait(pending, timeout=_CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    builders[futures[future]] = future.result()
+                    done_count += 1
+                if done and progress_callback:
+                    progress_callback(done_count * 100.0 / len(part_urls))
+                if is_canceled and is_canceled():
+                    return None
+        finally:
+            # Concluídas todas as partes não há o que esperar; no cancelamento ou em
+            # erro, as partes em andamento terminam sozinhas e são descartadas.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        merged = SidraLookupBuilder(output_mode=output_mode)
+        for builder in builders:
+            merged.merge(builder)
+        return merged
+
+    def _fetch_builder(self, url: str, stream: bool = True, force_refresh: bool = False,
+                       output_mode: str = OUTPUT_DEFAULT):
+        """
+        Baixa (ou lê do cache) uma única URL e repassa as linhas a um construtor de lookup.
+
+        :return: SidraLookupBuilder com as linhas da resposta ou None se ela não tem cabeçalho.
+        """
+        cached = self.cache.lookup(url) if self.cache else None
+        if cached and not force_refresh and self.cache.is_fresh(cached):
+            if QGIS_AVAILABLE:
+                QgsMessageLog.logMessage(f"Usando resposta em cache para: {url}", "SIDRA Connector", Qgis.Info)
+            return self._parse_body(self.cache.iter_body(cached), cached['content_type'], stream, output_mode)
+
+        request_headers = {}
+        if cached and not force_refresh:
+            request_headers = self.cache.validation_headers(cached)
+
         try:
-            response = requests.get(final_url, timeout=30)
+            response = get_session().get(url, timeout=30, stream=stream, headers=request_headers)
             response.raise_for_status()
         except requests.exceptions.Timeout:
-            raise TimeoutError(f"Timeout na requisição à API SIDRA: {final_url}")
+            raise TimeoutError(f"Timeout na requisição à API SIDRA: {url}")
         except requests.exceptions.ConnectionError:
-            raise ConnectionError(f"Erro de conexão com a API SIDRA: {final_url}")
+            raise ConnectionError(f"Erro de conexão com a API SIDRA: {url}")
         except requests.exceptions.HTTPError as e:
-            raise requests.exceptions.HTTPError(f"Erro HTTP na API SIDRA: {e.response.status_code} - {final_url}")
+            raise requests.exceptions.HTTPError(f"Erro HTTP na API SIDRA: {e.response.status_code} - {url}")
         except requests.exceptions.RequestException as e:
             raise requests.exceptions.RequestException(f"Erro na requisição à API SIDRA: {e}")
-        
-        if response.headers.get('Content-Type', '').startswith('application/xml'):
-            df = self._parse_xml(response.text)
-        else:
-            data = response.json()
-            if not data or len(data) <= 1:
-                return {}, {}
-            
-            header = data[0]
-            rows = data[1:]
-            
-            df = pd.DataFrame(rows, columns=header.keys())
-            
-            column_mapping = {k: v for k, v in header.items()}
+
+        if cached and response.status_code == 304:
+            response.close()
+            self.cache.mark_revalidated(cached)
             if QGIS_AVAILABLE:
-                QgsMessageLog.logMessage(f"Mapeamento de colunas: {column_mapping}", "SIDRA Connector", Qgis.Info)
-        
-        sidra_data_dict, header_info = self._convert_dataframe_to_dict(df)
-        return sidra_data_dict, header_info
+                QgsMessageLog.logMessage(f"Resposta em cache revalidada pelo servidor: {url}", "SIDRA Connector", Qgis.Info)
+            return self._parse_body(self.cache.iter_body(cached), cached['content_type'], stream, output_mode)
 
-    def _parse_xml(self, xml_string: str) -> pd.DataFrame:
+        with response:
+            chunks = response.iter_content(chunk_size=constants.CHUNK_SIZE)
+            if self.cache:
+                chunks = self.cache.store_stream(url, response.headers, chunks)
+            return self._parse_body(chunks, response.headers.get('Content-Type', ''), stream, output_mode)
+
+    def _parse_body(self, chunks, content_type: str, stream: bool = True, output_mode: str = OUTPUT_DEFAULT):
+        """
+        Analisa o corpo de uma resposta (da rede ou do cache) conforme o seu formato.
+
+        :param chunks: Iterável com os blocos de bytes da resposta.
+        :param content_type: O cabeçalho Content-Type da resposta.
+        :param stream: Se False, a resposta JSON é carregada inteira antes da conversão.
+        :param output_mode: Formato do lookup: OUTPUT_DEFAULT, OUTPUT_WIDE ou OUTPUT_LONG.
+        :return: SidraLookupBuilder com as linhas da resposta ou None se ela não tem cabeçalho.
+        """
+        chunks = iter(chunks)
+        try:
+            if content_type.startswith('application/xml'):
+                result = self._parse_xml_stream(chunks, output_mode)
+            elif stream:
+                result = self._parse_json_stream(chunks, output_mode)
+            else:
+                result = self._parse_json(b''.join(chunks), output_mode)
+
+            # Consome o que sobrou após o fim do documento para que o cache grave a resposta inteira.
+            for _ in chunks:
+                pass
+            return result
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+
+    def _parse_json(self, body: bytes, output_mode: str = OUTPUT_DEFAULT) -> tuple:
+        """
+        Analisa uma resposta JSON do SIDRA carregada inteira em memória.
+
+        :param body: O corpo da resposta.
+        :param output_mode: Formato do lookup: OUTPUT_DEFAULT, OUTPUT_WIDE ou OUTPUT_LONG.
+        :return: SidraLookupBuilder com as linhas da resposta ou None se ela não tem cabeçalho.
         """
-        Analisa uma string XML da resposta da API do SIDRA e a converte em um DataFrame.
+        data = json.loads(body)
+        if not data:
+            return None
+
+        header = data[0]
+        rows = data[1:]
+
+        df = pd.DataFrame(rows, columns=header.keys())
+
+        column_mapping = {k: v for k, v in header.items()}
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Mapeamento de colunas: {column_mapping}", "SIDRA Connector", Qgis.Info)
+
+        builder = SidraLookupBuilder(output_mode=output_mode, header=header)
+        builder.add_dataframe(df)
+        return builder
+
+    def _parse_json_stream(self, byte_chunks, output_mode: str = OUTPUT_DEFAULT) -> tuple:
+        """
+        Analisa incrementalmente uma resposta JSON do SIDRA, repassando as linhas ao
+        construtor de lookup em blocos à medida que são lidas.
+
+        :param byte_chunks: Iterável de blocos de bytes da resposta.
+        :param output_mode: Formato do lookup: OUTPUT_DEFAULT, OUTPUT_WIDE ou OUTPUT_LONG.
+        :return: SidraLookupBuilder com as linhas da resposta ou None se ela não tem cabeçalho.
+        """
+        items = _iter_json_array(byte_chunks)
+        header = next(items, None)
+        if not header:
+            return None
+
+        columns = list(header.keys())
+        if QGIS_AVAILABLE:
+            QgsMessageLog.logMessage(f"Mapeamento de colunas: {dict(header)}", "SIDRA Connector", Qgis.Info)
+
+        builder = SidraLookupBuilder(output_mode=output_mode, header=header)
+        batch = []
+        for row in items:
+            batch.append(row)
+            if len(batch) >= constants.STREAM_CHUNK_ROWS:
+                builder.add_rows(batch, columns)
+                batch = []
+        builder.add_rows(batch, columns)
+        return builder
+
+    def _parse_xml(self, xml_string: str) -> tuple:
+        """
+        Analisa uma string XML da resposta da API do SIDRA.
 
         :param xml_string: A string XML a ser analisada.
-        :return: Um DataFrame do pandas contendo os dados analisados.
+        :return: Tupla (sidra_data_dict, header_info)
         """
-        root = ET.fromstring(xml_string)
-        
-        namespace = {'ns': 'http://schemas.datacontract.org/2004/07/IBGE.BTE.Tabela'}
-        all_rows = []
-        
-        header_element = root.find('ns:ValorDescritoPorSuasDimensoes', namespace)
-        if header_element is None:
-            return pd.DataFrame()
+        builder = self._parse_xml_stream([xml_string])
+        if builder is None:
+            return {}, {}
+        return builder.build()
 
-        header_map = {child.tag.split('}')[-1]: child.text for child in header_element}
-        
-        data_elements = root.findall('ns:ValorDescritoPorSuasDimensoes', namespace)[1:]
-        
-        for elem in data_elements:
-            row_data = {header_map[child.tag.split('}')[-1]]: child.text for child in elem}
-            all_rows.append(row_data)
-            
-        if not all_rows:
-            return pd.DataFrame()
+    def _parse_xml_stream(self, chunks, output_mode: str = OUTPUT_DEFAULT) -> tuple:
+        """
+        Analisa incrementalmente uma resposta XML do SIDRA com um parser de eventos.
 
-        df = pd.DataFrame(all_rows)
+        O primeiro elemento ValorDescritoPorSuasDimensoes é o cabeçalho e define a
+        coluna de código geográfico; os demais são lidos, repassados ao construtor
+        de lookup em blocos e descartados em seguida, sem montar a árvore completa.
 
-        geo_code_col = None
-        
+        :param chunks: Iterável de blocos (bytes ou str) do documento XML.
+        :param output_mode: Formato do lookup: OUTPUT_DEFAULT, OUTPUT_WIDE ou OUTPUT_LONG.
+        :return: SidraLookupBuilder com as linhas da resposta ou None se ela não tem cabeçalho.
+        """
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        root = None
+        builder = None
+        columns = None
+        batch = []
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                    continue
+                if elem.tag != _XML_ROW_TAG:
+                    continue
+
+                fields = {child.tag.split('}')[-1]: child.text for child in elem}
+                elem.clear()
+                root.clear()
+
+                if builder is None:
+                    columns = list(fields.keys())
+                    builder = SidraLookupBuilder(
+                        geo_code_col=self._find_xml_geo_code_col(fields),
+                        output_mode=output_mode,
+                        header=fields
+                    )
+                    continue
+
+                batch.append(fields)
+                if len(batch) >= constants.STREAM_CHUNK_ROWS:
+                    builder.add_rows(batch, columns)
+                    batch = []
+        parser.close()
+
+        if builder is not None:
+            builder.add_rows(batch, columns)
+        return builder
+
+    def _find_xml_geo_code_col(self, header_map: dict) -> str:
+        """
+        Identifica, pelo cabeçalho do XML, a dimensão que contém o código geográfico.
+
+        :param header_map: Dicionário {código da coluna: descrição} do elemento de cabeçalho.
+        :return: O código da coluna geográfica (ex.: 'D1C').
+        """
         # Lista de todos os níveis territoriais do IBGE
         niveis_geograficos = [
             'brasil',
@@ -140,17 +943,9 @@ class SidraApiClient:
             dim_code = f'D{i}C'
 
             if header_map.get(dim_name) and any(k in header_map[dim_name].lower() for k in niveis_geograficos):
-                geo_code_col = header_map.get(dim_code)
-                break
+                return dim_code
 
-        if geo_code_col is None:
-            raise ValueError("Erro: Não foi possível identificar a coluna de código geográfico no cabeçalho do XML.")
-        
-        if geo_code_col in df.columns:
-            df.rename(columns={geo_code_col: 'geo_code'}, inplace=True)
-        
-        sidra_data_dict, header_info = self._convert_dataframe_to_dict(df)
-        return sidra_data_dict, header_info
+        raise ValueError("Erro: Não foi possível identificar a coluna de código geográfico no cabeçalho do XML.")
 
     def _convert_dataframe_to_dict(self, df: pd.DataFrame) -> tuple:
         """
@@ -159,144 +954,6 @@ class SidraApiClient:
         :param df: DataFrame com os dados do SIDRA
         :return: Tupla (sidra_data_dict, header_info)
         """
-        if QGIS_AVAILABLE:
-            QgsMessageLog.logMessage(f"Iniciando conversão do DataFrame. Shape: {df.shape}", "SIDRA Connector", Qgis.Info)
-            QgsMessageLog.logMessage(f"Colunas disponíveis: {list(df.columns)}", "SIDRA Connector", Qgis.Info)
-        
-        if df.empty:
-            if QGIS_AVAILABLE:
-                QgsMessageLog.logMessage("DataFrame vazio recebido da API SIDRA", "SIDRA Connector", Qgis.Warning)
-            return {}, {}
-        
-        sidra_data_dict = {}
-        header_info = {}
-        
-        excluded_cols = {
-            'geo_code', 'D1C', 'D1N', 'D2C', 'D2N', 'D3C', 'D3N', 'D4C', 'D4N',
-            'NC', 'NN', 'MC', 'MN'
-        }
-        
-        value_cols = []
-        if 'V' in df.columns:
-            value_cols.append('V')
-        
-        for col in df.columns:
-            if col not in excluded_cols and col not in value_cols:
-                value_cols.append(col)
-        
-        if QGIS_AVAILABLE:
-            QgsMessageLog.logMessage(f"Colunas de valores identificadas: {value_cols}", "SIDRA Connector", Qgis.Info)
-        
-        if not df.empty:
-            first_row = df.iloc[0]
-            for col in df.columns:
-                if col.endswith('N'):
-                    header_info[col] = first_row[col] if pd.notna(first_row[col]) else col
-        
-        geo_code_col = None
-        
-        if 'geo_code' not in df.columns:
-            if QGIS_AVAILABLE:
-                QgsMessageLog.logMessage("Coluna 'geo_code' não encontrada. Tentando identificar coluna geográfica...", "SIDRA Connector", Qgis.Warning)
-            
-            if 'D1C' in df.columns:
-                geo_code_col = 'D1C'
-                if QGIS_AVAILABLE:
-                    QgsMessageLog.logMessage("Usando coluna 'D1C' como código geográfico", "SIDRA Connector", Qgis.Info)
-            else:
-                geo_candidates = [col for col in df.columns if col.endswith('C') and any(dim in col for dim in ['D1', 'D2', 'D3', 'D4'])]
-                if geo_candidates:
-                    geo_code_col = geo_candidates[0]
-                    if QGIS_AVAILABLE:
-                        QgsMessageLog.logMessage(f"Usando coluna '{geo_code_col}' como código geográfico", "SIDRA Connector", Qgis.Info)
-                else:
-                    if QGIS_AVAILABLE:
-                        QgsMessageLog.logMessage("Nenhuma coluna geográfica identificada", "SIDRA Connector", Qgis.Critical)
-                    return {}, header_info
-            
-            df = df.rename(columns={geo_code_col: 'geo_code'})
-        else:
-            geo_code_col = 'geo_code'
-        
-        rows_processed = 0
-        
-        variable_column = None
-        variable_candidates = ['D4N', 'D3N', 'D2N', 'D5N', 'D6N', 'D7N']
-        
-        for candidate in variable_candidates:
-            if candidate in df.columns:
-                unique_values = df[candidate].nunique()
-                if unique_values > 1:
-                    variable_column = candidate
-                    break
-        
-        has_value_column = 'V' in df.columns       # Valor
-        
-        if QGIS_AVAILABLE:
-            QgsMessageLog.logMessage(f"Coluna de variável identificada: {variable_column}", "SIDRA Connector", Qgis.Info)
-            QgsMessageLog.logMessage(f"Tem coluna de valor (V): {has_value_column}", "SIDRA Connector", Qgis.Info)
-        
-        if variable_column and has_value_column:
-            for _, row in df.iterrows():
-                if 'geo_code' in row and pd.notna(row['geo_code']):
-                    geo_code = str(row['geo_code']).strip()
-                    variable_name = str(row[variable_column]).strip() if pd.notna(row[variable_column]) else 'Valor'
-                    value = row['V']
-                    
-                    if geo_code not in sidra_data_dict:
-                        sidra_data_dict[geo_code] = {}
-                    
-                    try:
-                        if pd.notna(value):
-                            value_str = str(value).replace(',', '.')
-                            if value_str.replace('.', '').replace('-', '').isdigit():
-                                processed_value = float(value_str)
-                            else:
-                                processed_value = str(value)
-                        else:
-                            processed_value = None
-                    except (ValueError, TypeError):
-                        processed_value = str(value) if pd.notna(value) else None
-
-                    var_key = variable_name
-                    counter = 1
-                    while var_key in sidra_data_dict[geo_code]:
-                        var_key = f"{variable_name}_{counter}"
-                        counter += 1
-                    
-                    sidra_data_dict[geo_code][var_key] = processed_value
-                    rows_processed += 1
-        
-        else:
-            if QGIS_AVAILABLE:
-                QgsMessageLog.logMessage("Usando lógica de fallback - sem agrupamento por variável", "SIDRA Connector", Qgis.Info)
-            
-            for _, row in df.iterrows():
-                if 'geo_code' in row and pd.notna(row['geo_code']):
-                    geo_code = str(row['geo_code']).strip()
-                    
-                    row_data = {}
-                    for col in value_cols:
-                        if pd.notna(row[col]):
-                            try:
-                                value_str = str(row[col]).replace(',', '.')
-                                if value_str.replace('.', '').replace('-', '').isdigit():
-                                    row_data[col] = float(value_str)
-                                else:
-                                    row_data[col] = str(row[col])
-                            except (ValueError, TypeError):
-                                row_data[col] = str(row[col])
-                    
-                    if row_data:
-                        sidra_data_dict[geo_code] = row_data
-                        rows_processed += 1
-        
-        if QGIS_AVAILABLE:
-            QgsMessageLog.logMessage(f"Conversão concluída: {len(sidra_data_dict)} registros geográficos, {rows_processed} linhas processadas", "SIDRA Connector", Qgis.Info)
-            if len(sidra_data_dict) > 0:
-                sample_key = next(iter(sidra_data_dict.keys()))
-                sample_data = sidra_data_dict[sample_key]
-                variables = list(sample_data.keys())
-                QgsMessageLog.logMessage(f"Exemplo de dados: geo_code={sample_key}, variáveis={variables}", "SIDRA Connector", Qgis.Info)
-        
-        return sidra_data_dict, header_info
+        builder = SidraLookupBuilder()
+        builder.add_dataframe(df)
+        return builder.build()
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo com as consultas ao catálogo local de tabelas do SIDRA (agregados_ibge.db).
+"""
+
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from bisect import bisect_left
+from urllib.request import pathname2url
+
+SEARCH_LIMIT = 50
+CACHE_SIZE_KIB = 8192
+MMAP_SIZE = 64 * 1024 * 1024
+PROGRESS_HANDLER_STEPS = 1000  # Instruções da VM do SQLite entre verificações de cancelamento
+PREFIX_CACHE_SIZE = 512
+
+# Ranking bm25 do índice em memória: pesos das palavras do nome da tabela e do
+# nome do grupo, e os parâmetros k1 e b usuais.
+NAME_WEIGHT = 10.0
+GROUP_WEIGHT = 1.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+LIKE_SEARCH_QUERY = """
+    SELECT a.id, a.nome, g.nome as grupo_nome
+    FROM agregados a
+    JOIN grupos g ON a.grupo_id = g.id
+    WHERE a.nome LIKE ? OR g.nome LIKE ?
+    ORDER BY a.nome
+    LIMIT ?
+"""
+
+# Sinais diacríticos combinantes (acentos, til, cedilha) após a decomposição NFKD.
+COMBINING_MARKS = re.compile('[\u0300-\u036f]')
+
+# Todas as tabelas, já em ordem alfabética, para o índice em memória.
+INDEX_LOAD_QUERY = """
+    SELECT a.id, a.nome, g.nome as grupo_nome
+    FROM agregados a
+    JOIN grupos g ON a.grupo_id = g.id
+    ORDER BY a.nome, a.id
+"""
+
+
+class SearchCanceled(Exception):
+    """
+    Busca interrompida porque uma consulta mais recente foi solicitada.
+    """
+
+
+def normalize_text(text):
+    """
+    Normaliza um texto para a busca: minúsculas e sem acentos, de modo que
+    "populacao" encontra "população".
+    """
+    return COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text.casefold()))
+
+
+def tokenize(text):
+    """
+    Normaliza um texto e o divide em palavras.
+    """
+    return re.findall(r'\w+', normalize_text(text))
+
+
+class TableSearchIndex:
+    """
+    Índice invertido em memória do catálogo de tabelas, para a busca enquanto
+    o usuário digita.
+
+    As palavras normalizadas de todas as tabelas ficam em uma lista ordenada,
+    onde os prefixos são localizados por busca binária, e cada palavra aponta
+    para as tabelas que a contêm, com o número de ocorrências. Cada palavra
+    digitada é tratada como prefixo e todas precisam estar presentes. Os
+    resultados são ordenados por relevância (bm25), com as palavras do nome da
+    tabela pesando mais que as do nome do grupo, e depois em ordem alfabética.
+
+    Quando a nova consulta apenas estende a anterior ("pop" → "popu" ou
+    "pop" → "pop resid"), o resultado anterior é refinado em vez de recalculado.
+    """
+
+    def __init__(self, rows):
+        """
+        Construtor.
+        :param rows: Tuplas (id, nome, grupo_nome) em ordem alfabética de nome.
+        """
+        self.rows = list(rows)
+        postings = {}
+        group_tokens = {}
+        self._doc_norms = []
+
+        for doc, (_, table_name, group_name) in enumerate(self.rows):
+            if group_name not in group_tokens:
+                group_tokens[group_name] = tokenize(group_name)
+            name_tokens = tokenize(table_name)
+            weights = {}
+            for token in name_tokens:
+                weights[token] = weights.get(token, 0.0) + NAME_WEIGHT
+            for token in group_tokens[group_name]:
+                weights[token] = weights.get(token, 0.0) + GROUP_WEIGHT
+            for token, weight in weights.items():
+                postings.setdefault(token, {})[doc] = weight
+            self._doc_norms.append(len(name_tokens) + len(group_tokens[group_name]))
+
+        # Normalização do bm25 pelo tamanho da tabela (nome + grupo) em relação à média.
+        average_length = sum(self._doc_norms) / len(self._doc_norms) if self._doc_norms else 1.0
+        self._doc_norms = [
+            BM25_K1 * (1 - BM25_B + BM25_B * length / average_length) for length in self._doc_norms
+        ]
+        self.tokens = sorted(postings)
+        self._postings = [postings[token] for token in self.tokens]
+        self._prefix_cache = {}
+        self._last_query = None
+
+    @classmethod
+    def from_connection(cls, conn):
+        """
+        Carrega o índice a partir das tabelas agregados/grupos do catálogo.
+        """
+        return cls(conn.execute(INDEX_LOAD_QUERY).fetchall())
+
+    def _prefix_range(self, prefix):
+        """
+        Retorna o intervalo [início, fim) das palavras iniciadas pelo prefixo.
+        """
+        start = bisect_left(self.tokens, prefix)
+        return start, bisect_left(self.tokens, prefix + '\U0010ffff', start)
+
+    def _prefix_docs(self, prefix):
+        """
+        Retorna as tabelas com alguma palavra iniciada pelo prefixo, no nome ou
+        no grupo, a frequência ponderada do prefixo em cada uma e o seu idf.
+        """
+        cached = self._prefix_cache.get(prefix)
+        if cached is not None:
+            return cached
+
+        start, end = self._prefix_range(prefix)
+        frequencies = {}
+        for token_postings in self._postings[start:end]:
+            for doc, weight in token_postings.items():
+                frequencies[doc] = frequencies.get(doc, 0.0) + weight
+        # idf do bm25, limitado a um mínimo positivo: um prefixo presente em mais
+        # da metade das tabelas não pode reduzir a pontuação.
+        total = len(self.rows)
+        idf = max(math.log((total - len(frequencies) + 0.5) / (len(frequencies) + 0.5)), 1e-6)
+
+        if len(self._prefix_cache) >= PREFIX_CACHE_SIZE:
+            self._prefix_cache.clear()
+        cached = self._prefix_cache[prefix] = (frozenset(frequencies), frequencies, idf)
+        return cached
+
+    def _rank(self, matched, query, limit):
+        """
+        Ordena as tabelas encontradas pelo bm25 da consulta e, no empate, pelo nome.
+        """
+        terms = [self._prefix_docs(prefix)[1:] for prefix in query]
+        factor = BM25_K1 + 1
+
+        def score(doc):
+            norm = self._doc_norms[doc]
+            total = 0.0
+            for frequencies, idf in terms:
+                frequency = frequencies[doc]
+                total += idf * frequency * factor / (frequency + norm)
+            return -total, doc
+
+        return heapq.nsmallest(limit, matched, key=score)
+
+    def search(self, search_term, limit=SEARCH_LIMIT):
+        """
+        Busca tabelas pelo nome da tabela ou do grupo.
+
+        Args:
+            search_term (str): Texto digitado pelo usuário
+            limit (int): Número máximo de resultados
+
+        Returns:
+            list: Lista de tuplas (id, nome, grupo_nome), da mais relevante para a menos
+        """
+        query = tokenize(search_term)
+        if not query:
+            return []
+
+        matched = None
+        pending = query
+        if self._last_query is not None:
+            last_query, last_matched = self._last_query
+            if len(query) >= len(last_query) and all(
+                token.startswith(last_token) for last_token, token in zip(last_query, query)
+            ):
+                matched = last_matched
+                pending = [
+                    token for position, token in enumerate(query)
+                    if position >= len(last_query) or token != last_query[position]
+                ]
+
+        for prefix in pending:
+            docs = self._prefix_docs(prefix)[0]
+            matched = docs if matched is None else matched & docs
+        self._last_query = (query, matched)
+
+        return [self.rows[doc] for doc in self._rank(matched, query, limit)]
+
+
+def search_tables(conn, search_term, limit=SEARCH_LIMIT):
+    """
+    Busca tabelas pelo nome da tabela ou do grupo diretamente no banco, com LIKE.
+
+    Args:
+        conn (sqlite3.Connection): Conexão com o catálogo
+        search_term (str): Texto digitado pelo usuário
+        limit (int): Número máximo de resultados
+
+    Returns:
+        list: Lista de tuplas (id, nome, grupo_nome)
+    """
+    search_pattern = f"%{search_term}%"
+    return conn.execute(LIKE_SEARCH_QUERY, (search_pattern, search_pattern, limit)).fetchall()
+
+
+class TableCatalog:
+    """
+    Conexão única e somente leitura com o catálogo de tabelas, compartilhada por
+    todas as buscas da sessão.
+
+    O banco é aberto em modo URI imutável (mode=ro&immutable=1), o que dispensa
+    travas de arquivo, com cache de páginas e mmap ajustados. As consultas usam
+    sempre o mesmo texto SQL e por isso são reaproveitadas do cache de comandos
+    preparados do sqlite3.
+
+    Por padrão o catálogo é lido uma única vez para um índice em memória, que
+    ordena os resultados por relevância, e as buscas seguintes não acessam o
+    banco. Sem ele (in_memory=False) a busca usa LIKE no banco, em ordem alfabética.
+    """
+
+    def __init__(self, db_path, in_memory=True):
+        """
+        Construtor.
+        :param db_path: Caminho para o arquivo agregados_ibge.db.
+        :param in_memory: Se True, as buscas usam o índice em memória (TableSearchIndex),
+            carregado do banco na primeira busca.
+        """
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+
+        self.db_path = db_path
+        self.in_memory = in_memory
+        self._index = None
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro&immutable=1",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=32
+        )
+        self.conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+        self.conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        self.conn.execute("PRAGMA query_only = 1")
+
+    def search(self, search_term, limit=SEARCH_LIMIT, is_canceled=None):
+        """
+        Busca tabelas pelo nome da tabela ou do grupo.
+
+        Args:
+            search_term (str): Texto digitado pelo usuário
+            limit (int): Número máximo de resultados
+            is_canceled (callable): Função consultada durante a execução; quando
+                retorna True a consulta é interrompida pelo SQLite
+
+        Returns:
+            list: Lista de tuplas (id, nome, grupo_nome)
+
+        Raises:
+            SearchCanceled: Se a busca foi interrompida por is_canceled
+        """
+        with self._lock:
+            if self.in_memory:
+                if is_canceled is not None and is_canceled():
+                    raise SearchCanceled(search_term)
+                return self._search_index().search(search_term, limit)
+
+            if is_canceled is None:
+                return search_tables(self.conn, search_term, limit)
+
+            if is_canceled():
+                raise SearchCanceled(search_term)
+            self.conn.set_progress_handler(lambda: 1 if is_canceled() else 0, PROGRESS_HANDLER_STEPS)
+            try:
+                return search_tables(self.conn, search_term, limit)
+            except sqlite3.OperationalError:
+                if is_canceled():
+                    raise SearchCanceled(search_term)
+                raise
+            finally:
+                self.conn.set_progress_handler(None, 0)
+
+    def _search_index(self):
+        """
+        Retorna o índice em memória, carregando-o do banco na primeira chamada.
+        """
+        if self._index is None:
+            self._index = TableSearchIndex.from_connection(self.conn)
+        return self._index
+
+    def close(self):
+        """
+        Fecha a conexão com o banco.
+        """
+        with self._lock:
+            self.conn.close()
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(db_path):
+    """
+    Retorna o catálogo compartilhado de um banco, abrindo a conexão na primeira chamada.
+
+    Args:
+        db_path (str): Caminho para o arquivo agregados_ibge.db
+
+    Returns:
+        TableCatalog: Catálogo pronto para consultas
+    """
+    key = os.path.abspath(db_path)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = TableCatalog(key)
+        return catalog
+
+
+def close_catalogs():
+    """
+    Fecha todas as conexões abertas com catálogos (ao descarregar o plugin).
+    """
+    with _catalogs_lock:
+        for catalog in _catalogs.values():
+            catalog.close()
+        _catalogs.clear()
@@ -0,0 +1,92 @@
+"""
+Compara o tempo da união dos dados do SIDRA pelo caminho em lotes (padrão)
+com o caminho original pelo buffer de edição.
+
+Executar com o Python do QGIS (ou no console Python do QGIS), a partir da
+pasta que contém o plugin:
+
+    python sidra_connector/dev/benchmark_join.py [n_feicoes] [n_variaveis]
+
+Ainda não há resultados registrados: o script não foi executado em um ambiente
+com QGIS, portanto não há medição que indique qual dos dois caminhos é mais
+rápido. Ao executá-lo, registre aqui os tempos e a versão do QGIS.
+"""
+import os
+import sys
+import time
+
+from qgis.core import QgsApplication, QgsFeature, QgsField, QgsGeometry, QgsRectangle, QgsVectorLayer
+from qgis.PyQt.QtCore import QVariant
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sidra_connector.core.data_joiner import DataJoiner
+
+
+def criar_camada(n_feicoes, vertices=64):
+    """
+    Cria uma camada de memória com polígonos de `vertices` vértices e o campo CD_MUN.
+    """
+    layer = QgsVectorLayer("Polygon?crs=EPSG:4674", "malha_teste", "memory")
+    provider = layer.dataProvider()
+    provider.addAttributes([QgsField("CD_MUN", QVariant.String), QgsField("NM_MUN", QVariant.String)])
+    layer.updateFields()
+
+    lado = int(n_feicoes ** 0.5) + 1
+    feicoes = []
+    for i in range(n_feicoes):
+        x, y = i % lado, i // lado
+        geometria = QgsGeometry.fromRect(QgsRectangle(x, y, x + 0.9, y + 0.9)).densifyByCount(vertices // 4)
+        feicao = QgsFeature(layer.fields())
+        feicao.setGeometry(geometria)
+        feicao.setAttributes([str(1100000 + i), f"Municipio {i}"])
+        feicoes.append(feicao)
+    provider.addFeatures(feicoes)
+    layer.updateExtents()
+    return layer
+
+
+def criar_dados(n_feicoes, n_variaveis):
+    """
+    Cria um dicionário de lookup no formato de SidraApiClient.fetch_and_parse.
+    """
+    return {
+        str(1100000 + i): {f"Variavel {v}": float(i * v) for v in range(n_variaveis)}
+        for i in range(0, n_feicoes, 2)
+    }
+
+
+def medir(joiner, bulk):
+    inicio = time.perf_counter()
+    resultado = joiner.join_data(bulk=bulk)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    n_feicoes = int(sys.argv[1]) if len(sys.argv) > 1 else 5570
+    n_variaveis = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    layer = criar_camada(n_feicoes)
+    joiner = DataJoiner(layer, "CD_MUN", criar_dados(n_feicoes, n_variaveis), {})
+
+    tempo_edicao, (camada_edicao, unidas_edicao, _, _) = medir(joiner, bulk=False)
+    tempo_lotes, (camada_lotes, unidas_lotes, _, _) = medir(joiner, bulk=True)
+
+    iguais = unidas_edicao == unidas_lotes and all(
+        a.attributes() == b.attributes()
+        for a, b in zip(camada_edicao.getFeatures(), camada_lotes.getFeatures())
+    )
+
+    print(f"{n_feicoes} feições, {n_variaveis} variáveis")
+    print(f"Buffer de edição: {tempo_edicao:.2f} s")
+    print(f"Em lotes:         {tempo_lotes:.2f} s ({tempo_edicao / tempo_lotes:.1f}x)")
+    print(f"Resultados iguais: {iguais}")
+
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
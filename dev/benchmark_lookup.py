@@ -0,0 +1,175 @@
+"""
+Compara o tempo da conversão de uma resposta do SIDRA em dicionário de lookup
+pelo SidraLookupBuilder (vetorizado) com a conversão original, linha a linha
+com DataFrame.iterrows().
+
+Não depende do QGIS. Executar a partir da pasta que contém o plugin:
+
+    python sidra_connector/dev/benchmark_lookup.py [n_municipios] [n_variaveis] [n_periodos]
+
+Resultado com os valores padrão (5570 municípios × 4 variáveis × 5 períodos =
+111.400 linhas), Python 3.11 e pandas 3.0:
+
+    Linha a linha: 9.04 s
+    Vetorizado:    0.62 s (14.6x)
+    Resultados iguais: True
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sidra_connector.core.sidra_api_client import SidraLookupBuilder
+
+COLUNAS = ['NC', 'NN', 'MC', 'MN', 'V', 'D1C', 'D1N', 'D2C', 'D2N', 'D3C', 'D3N']
+
+# Valores especiais do SIDRA que não são números
+VALORES_ESPECIAIS = ['-', '...', 'X', '..']
+
+
+def criar_resposta(n_municipios, n_variaveis, n_periodos):
+    """
+    Cria um DataFrame no formato da resposta JSON do SIDRA (sem a linha de cabeçalho).
+
+    Cada município repete o nome da variável uma vez por período (chaves repetidas,
+    numeradas _1, _2... no lookup), há valores especiais, valores ausentes e linhas
+    sem código geográfico.
+    """
+    linhas = []
+    for i in range(n_municipios):
+        codigo = str(1100000 + i) if i % 97 else None
+        for v in range(n_variaveis):
+            for p in range(n_periodos):
+                posicao = len(linhas)
+                if posicao % 53 == 0:
+                    valor = VALORES_ESPECIAIS[posicao % len(VALORES_ESPECIAIS)]
+                elif posicao % 61 == 0:
+                    valor = None
+                elif posicao % 2:
+                    valor = f"{posicao * 1.5:.1f}".replace('.', ',')
+                else:
+                    valor = str(posicao)
+                linhas.append({
+                    'NC': '6', 'NN': 'Município', 'MC': '45', 'MN': 'Pessoas', 'V': valor,
+                    'D1C': codigo, 'D1N': f'Município {i}',
+                    'D2C': str(2010 + p), 'D2N': str(2010 + p),
+                    'D3C': str(93 + v), 'D3N': f' Variável {v} ',
+                })
+    return pd.DataFrame(linhas, columns=COLUNAS)
+
+
+def _valor_por_linha(valor):
+    try:
+        if pd.notna(valor):
+            texto = str(valor).replace(',', '.')
+            if texto.replace('.', '').replace('-', '').isdigit():
+                return float(texto)
+            return str(valor)
+        return None
+    except (ValueError, TypeError):
+        return str(valor) if pd.notna(valor) else None
+
+
+def converter_por_linha(df):
+    """
+    Conversão original de SidraApiClient._convert_dataframe_to_dict, linha a linha,
+    sem as mensagens de log. Serve de referência para o SidraLookupBuilder.
+
+    :return: Tupla (sidra_data_dict, header_info)
+    """
+    if df.empty:
+        return {}, {}
+
+    sidra_data_dict = {}
+    header_info = {}
+    excluded_cols = {
+        'geo_code', 'D1C', 'D1N', 'D2C', 'D2N', 'D3C', 'D3N', 'D4C', 'D4N',
+        'NC', 'NN', 'MC', 'MN'
+    }
+    value_cols = ['V'] if 'V' in df.columns else []
+    for col in df.columns:
+        if col not in excluded_cols and col not in value_cols:
+            value_cols.append(col)
+
+    first_row = df.iloc[0]
+    for col in df.columns:
+        if col.endswith('N'):
+            header_info[col] = first_row[col] if pd.notna(first_row[col]) else col
+
+    if 'geo_code' not in df.columns:
+        if 'D1C' in df.columns:
+            geo_code_col = 'D1C'
+        else:
+            geo_candidates = [col for col in df.columns if col.endswith('C') and any(dim in col for dim in ['D1', 'D2', 'D3', 'D4'])]
+            if not geo_candidates:
+                return {}, header_info
+            geo_code_col = geo_candidates[0]
+        df = df.rename(columns={geo_code_col: 'geo_code'})
+
+    variable_column = None
+    for candidate in ['D4N', 'D3N', 'D2N', 'D5N', 'D6N', 'D7N']:
+        if candidate in df.columns and df[candidate].nunique() > 1:
+            variable_column = candidate
+            break
+
+    if variable_column and 'V' in df.columns:
+        for _, row in df.iterrows():
+            if pd.notna(row['geo_code']):
+                geo_code = str(row['geo_code']).strip()
+                variable_name = str(row[variable_column]).strip() if pd.notna(row[variable_column]) else 'Valor'
+                geo_entry = sidra_data_dict.setdefault(geo_code, {})
+                var_key = variable_name
+                counter = 1
+                while var_key in geo_entry:
+                    var_key = f"{variable_name}_{counter}"
+                    counter += 1
+                geo_entry[var_key] = _valor_por_linha(row['V'])
+    else:
+        for _, row in df.iterrows():
+            if pd.notna(row['geo_code']):
+                geo_code = str(row['geo_code']).strip()
+                row_data = {}
+                for col in value_cols:
+                    if pd.notna(row[col]):
+                        row_data[col] = _valor_por_linha(row[col])
+                if row_data:
+                    sidra_data_dict[geo_code] = row_data
+
+    return sidra_data_dict, header_info
+
+
+def converter_vetorizado(df):
+    """
+    Conversão pelo SidraLookupBuilder, com a resposta em um único bloco.
+    """
+    builder = SidraLookupBuilder()
+    builder.add_dataframe(df)
+    return builder.build()
+
+
+def main():
+    n_municipios = int(sys.argv[1]) if len(sys.argv) > 1 else 5570
+    n_variaveis = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    n_periodos = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    df = criar_resposta(n_municipios, n_variaveis, n_periodos)
+
+    inicio = time.perf_counter()
+    original = converter_por_linha(df)
+    tempo_linhas = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    vetorizado = converter_vetorizado(df)
+    tempo_vetorizado = time.perf_counter() - inicio
+
+    print(f"{len(df)} linhas ({n_municipios} municípios × {n_variaveis} variáveis × {n_periodos} períodos)")
+    print(f"Linha a linha: {tempo_linhas:.2f} s")
+    print(f"Vetorizado:    {tempo_vetorizado:.2f} s ({tempo_linhas / tempo_vetorizado:.1f}x)")
+    print(f"Resultados iguais: {original == vetorizado}")
+
+
+if __name__ == "__main__":
+    main()
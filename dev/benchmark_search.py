@@ -0,0 +1,120 @@
+"""
+Mede a latência da busca de tabelas a cada tecla digitada no construtor de
+consultas, comparando a consulta LIKE original com o índice em memória do
+TableCatalog (que também ordena os resultados por relevância).
+
+Cada termo é digitado letra a letra (a partir de 2 caracteres, como no
+diálogo) e cada prefixo é buscado na mesma ordem em que o diálogo faria. A
+latência percebida soma a espera do debounce adaptativo (SEARCH_DEBOUNCE_MIN +
+3 × média das buscas, limitada a SEARCH_DEBOUNCE_MAX) ao tempo da busca.
+
+Não depende do QGIS. Executar a partir da pasta que contém o plugin:
+
+    python sidra_connector/dev/benchmark_search.py [repeticoes]
+
+Resultado com agregados_ibge.db (8946 tabelas, 180 teclas por repetição),
+5 repetições, Python 3.11 e SQLite 3.40:
+
+    Carga do índice em memória: 365 ms
+    Busca         mediana      p95     máx.   espera   latência p95
+    LIKE          8.73 ms 12.75 ms 24.07 ms    66 ms       78.8 ms
+    Em memória    0.73 ms  3.75 ms  7.43 ms    43 ms       46.8 ms
+
+Antes do ranking bm25 no índice em memória, a busca FTS5 do banco (mediana
+3.76 ms, p95 14.17 ms) era a única com ordenação por relevância; o índice em
+memória a substitui com o mesmo critério (bm25, nome da tabela com peso 10 e
+nome do grupo com peso 1) e menor latência.
+"""
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sidra_connector.core.table_catalog import LIKE_SEARCH_QUERY, SEARCH_LIMIT, TableCatalog
+from sidra_connector.utils import constants
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'agregados_ibge.db')
+
+TERMOS = [
+    'populacao residente',
+    'produto interno bruto dos municipios',
+    'censo agropecuario estabelecimentos',
+    'pesquisa nacional por amostra de domicilios',
+    'índice de preços ao consumidor',
+    'rendimento medio mensal',
+]
+
+
+def prefixos(termo):
+    """
+    Textos do campo de busca enquanto o termo é digitado, a partir de 2 caracteres.
+    """
+    return [termo[:fim].strip() for fim in range(2, len(termo) + 1) if len(termo[:fim].strip()) >= 2]
+
+
+def busca_like(conn):
+    """
+    Busca original do diálogo: LIKE com curingas nos dois lados.
+    """
+    def buscar(termo):
+        padrao = f"%{termo}%"
+        return conn.execute(LIKE_SEARCH_QUERY, (padrao, padrao, SEARCH_LIMIT)).fetchall()
+    return buscar
+
+
+def medir(buscar, repeticoes):
+    """
+    Digita todos os termos e retorna o tempo de cada busca, em ms.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        for termo in TERMOS:
+            for texto in prefixos(termo):
+                inicio = time.perf_counter()
+                buscar(texto)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def espera(media_ms):
+    """
+    Espera do debounce adaptativo, como em QueryBuilderDialog.search_delay.
+    """
+    return int(min(constants.SEARCH_DEBOUNCE_MIN + 3 * media_ms, constants.SEARCH_DEBOUNCE_MAX))
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    conn = sqlite3.connect(DB_PATH)
+    catalogo_memoria = TableCatalog(DB_PATH)
+    # O índice em memória é carregado na primeira busca; a carga é medida à parte.
+    inicio = time.perf_counter()
+    catalogo_memoria.search('ibge')
+    carga = (time.perf_counter() - inicio) * 1000
+
+    buscas = [
+        ('LIKE', busca_like(conn)),
+        ('Em memória', catalogo_memoria.search),
+    ]
+
+    total = conn.execute("SELECT COUNT(*) FROM agregados").fetchone()[0]
+    print(f"{total} tabelas, {sum(len(prefixos(t)) for t in TERMOS)} teclas por repetição, {repeticoes} repetições")
+    print(f"Carga do índice em memória: {carga:.0f} ms")
+    print(f"{'Busca':<12} {'mediana':>8} {'p95':>8} {'máx.':>8} {'espera':>8} {'latência p95':>14}")
+    for nome, buscar in buscas:
+        tempos = medir(buscar, repeticoes)
+        p95 = statistics.quantiles(tempos, n=20)[-1]
+        atraso = espera(statistics.fmean(tempos))
+        print(f"{nome:<12} {statistics.median(tempos):5.2f} ms {p95:5.2f} ms {max(tempos):5.2f} ms "
+              f"{atraso:5d} ms {atraso + p95:10.1f} ms")
+
+    conn.close()
+    catalogo_memoria.close()
+
+
+if __name__ == "__main__":
+    main()
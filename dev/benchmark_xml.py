@@ -0,0 +1,118 @@
+"""
+Compara o tempo e o pico de memória da leitura de uma resposta XML do SIDRA pelo
+parser incremental (SidraApiClient._parse_xml_stream) com a leitura original,
+que montava a árvore inteira (ET.fromstring + findall + DataFrame).
+
+Não depende do QGIS. Executar a partir da pasta que contém o plugin:
+
+    python sidra_connector/dev/benchmark_xml.py [n_linhas]
+
+O pico de memória é medido com tracemalloc e inclui a conversão em lookup.
+Resultado com 100.000 linhas (22,9 MB de XML), Python 3.11 e pandas 3.0:
+
+    Árvore inteira: 3.39 s, pico de 283 MB
+    Incremental:    2.85 s, pico de 18 MB
+    Resultados iguais: True
+
+O tempo total é semelhante nos dois caminhos (variou entre 2,9 e 4,0 s em
+execuções repetidas); o ganho está no pico de memória.
+"""
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sidra_connector.core.sidra_api_client import SidraApiClient, SidraLookupBuilder
+
+NAMESPACE = 'http://schemas.datacontract.org/2004/07/IBGE.BTE.Tabela'
+CABECALHO = {
+    'D1C': 'Município (Código)', 'D1N': 'Município', 'D2C': 'Variável (Código)', 'D2N': 'Variável',
+    'D3C': 'Ano (Código)', 'D3N': 'Ano', 'MC': 'Unidade de Medida (Código)', 'MN': 'Unidade de Medida',
+    'NC': 'Nível Territorial (Código)', 'NN': 'Nível Territorial', 'V': 'Valor',
+}
+
+
+def _elemento(campos):
+    return '<ValorDescritoPorSuasDimensoes>' + ''.join(
+        f'<{chave}>{campos[chave]}</{chave}>' for chave in sorted(campos)
+    ) + '</ValorDescritoPorSuasDimensoes>'
+
+
+def criar_xml(n_linhas):
+    """
+    Cria uma resposta XML do SIDRA com `n_linhas` valores (municípios × 4 variáveis × 5 anos).
+    """
+    partes = [f'<ArrayOfValorDescritoPorSuasDimensoes xmlns="{NAMESPACE}">', _elemento(CABECALHO)]
+    for i in range(n_linhas):
+        municipio, resto = divmod(i, 20)
+        variavel, ano = divmod(resto, 5)
+        partes.append(_elemento({
+            'D1C': str(1100000 + municipio), 'D1N': f'Município {municipio}',
+            'D2C': str(93 + variavel), 'D2N': f'Variável {variavel}',
+            'D3C': str(2010 + ano), 'D3N': str(2010 + ano),
+            'MC': '45', 'MN': 'Pessoas', 'NC': '6', 'NN': 'Município', 'V': str(i * 3),
+        }))
+    partes.append('</ArrayOfValorDescritoPorSuasDimensoes>')
+    return ''.join(partes).encode('utf-8')
+
+
+def ler_arvore_inteira(body):
+    """
+    Leitura original do XML: árvore completa, lista de dicionários e DataFrame.
+    As colunas mantêm os códigos (D1C, V...) para que o lookup seja comparável.
+    """
+    root = ET.fromstring(body)
+    namespace = {'ns': NAMESPACE}
+    elementos = root.findall('ns:ValorDescritoPorSuasDimensoes', namespace)
+    linhas = [{child.tag.split('}')[-1]: child.text for child in elem} for elem in elementos[1:]]
+    df = pd.DataFrame(linhas)
+    builder = SidraLookupBuilder(geo_code_col='D1C')
+    builder.add_dataframe(df)
+    return builder.build()
+
+
+def ler_incremental(body):
+    """
+    Leitura pelo parser incremental, em blocos como os da resposta HTTP.
+    """
+    blocos = (body[inicio:inicio + 65536] for inicio in range(0, len(body), 65536))
+    builder = SidraApiClient(1)._parse_xml_stream(blocos)
+    return builder.build()
+
+
+def medir(funcao, body):
+    """
+    Mede o tempo de uma leitura e, em uma segunda execução (tracemalloc deixa o
+    código bem mais lento), o pico de memória em MB.
+    """
+    inicio = time.perf_counter()
+    resultado = funcao(body)
+    tempo = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    funcao(body)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return tempo, pico / (1024 * 1024), resultado
+
+
+def main():
+    n_linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    body = criar_xml(n_linhas)
+
+    tempo_arvore, pico_arvore, arvore = medir(ler_arvore_inteira, body)
+    tempo_incremental, pico_incremental, incremental = medir(ler_incremental, body)
+
+    print(f"{n_linhas} linhas, {len(body) / (1024 * 1024):.1f} MB de XML")
+    print(f"Árvore inteira: {tempo_arvore:.2f} s, pico de {pico_arvore:.0f} MB")
+    print(f"Incremental:    {tempo_incremental:.2f} s, pico de {pico_incremental:.0f} MB")
+    print(f"Resultados iguais: {arvore == incremental}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from qgis.core import QgsProject, QgsVectorLayer, QgsWkbTypes, Qgis, QgsMessageLog
+from qgis.core import QgsProject, QgsVectorLayer, QgsWkbTypes, Qgis, QgsMessageLog, QgsRelation
 import os
 import shutil
 
@@ -19,6 +19,16 @@ def get_layer_fields(layer):
         return []
     return [field.name() for field in layer.fields()]
 
+def get_project_layer(layer_id):
+    """
+    Retorna a camada do projeto com o id informado, ou None se ela foi removida
+    do projeto ou deixou de ser válida.
+    """
+    layer = QgsProject.instance().mapLayer(layer_id)
+    if layer is None or not layer.isValid():
+        return None
+    return layer
+
 def add_layer_to_project(layer):
     """
     Adiciona uma camada ao projeto QGIS atual.
@@ -28,6 +38,62 @@ def add_layer_to_project(layer):
         return True
     return False
 
+def add_attribute_join(target_layer, attribute_layer, join_info):
+    """
+    Adiciona ao projeto uma camada de atributos e a une à camada alvo.
+
+    Uniões anteriores da camada alvo com uma camada de mesmo nome (consultas
+    repetidas) são removidas, junto com a camada de atributos antiga.
+    """
+    if not (attribute_layer and attribute_layer.isValid()):
+        return False
+
+    project = QgsProject.instance()
+    for old_join in list(target_layer.vectorJoins()):
+        old_layer = old_join.joinLayer()
+        if old_layer is not None and old_layer.name() == attribute_layer.name():
+            target_layer.removeJoin(old_join.joinLayerId())
+            project.removeMapLayer(old_layer.id())
+
+    project.addMapLayer(attribute_layer)
+    if not target_layer.addJoin(join_info):
+        return False
+    target_layer.triggerRepaint()
+    return True
+
+def add_related_table(target_layer, table_layer, join_field_name):
+    """
+    Adiciona ao projeto uma tabela sem geometria e a relaciona (um-para-muitos) à
+    camada alvo pelo campo de união, que tem o mesmo nome nas duas camadas.
+
+    Relações anteriores da camada alvo com uma tabela de mesmo nome são removidas,
+    junto com a tabela antiga.
+    """
+    if not (table_layer and table_layer.isValid()):
+        return False
+
+    project = QgsProject.instance()
+    relation_manager = project.relationManager()
+    for old_relation in relation_manager.referencedRelations(target_layer):
+        old_table = old_relation.referencingLayer()
+        if old_table is not None and old_table.name() == table_layer.name():
+            relation_manager.removeRelation(old_relation)
+            project.removeMapLayer(old_table.id())
+
+    project.addMapLayer(table_layer)
+
+    relation = QgsRelation()
+    relation.setId(f"sidra_{table_layer.id()}")
+    relation.setName(table_layer.name())
+    relation.setReferencingLayer(table_layer.id())
+    relation.setReferencedLayer(target_layer.id())
+    relation.addFieldPair(join_field_name, join_field_name)
+    if not relation.isValid():
+        QgsMessageLog.logMessage(f"Relação inválida entre '{table_layer.name()}' e '{target_layer.name()}': {relation.validationError()}", "SIDRA Connector", Qgis.Warning)
+        return False
+    relation_manager.addRelation(relation)
+    return True
+
 def load_vector_layer(path, name):
     """
     Carrega uma camada vetorial a partir de um caminho.
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Conversão das malhas baixadas (shapefile) para um GeoPackage indexado, união das
+malhas de várias UFs e geração de versões simplificadas, mais leves, das malhas.
+"""
+
+import os
+import re
+import sqlite3
+
+from qgis.core import (
+    QgsVectorLayer, QgsVectorFileWriter, QgsCoordinateTransformContext, QgsFeedback,
+    QgsGeometry, QgsGeometryCollection, QgsWkbTypes, QgsFeature, QgsCoordinateTransform, QgsProject, QgsFields
+)
+
+from ..utils import constants
+
+# Colunas de código geográfico das malhas do IBGE (CD_MUN, CD_UF, CD_RGI, CD_REGIAO...)
+_GEOCODE_COLUMN = re.compile(r'^cd_', re.IGNORECASE)
+
+
+def convert_to_geopackage(source_path, target_path, table_name, progress_callback=None, is_canceled=None):
+    """
+    Converte uma malha para GeoPackage, com índice espacial (R-tree), índices nas
+    colunas de código geográfico e estatísticas do SQLite (ANALYZE).
+
+    Pode ser chamada fora da thread principal: a camada de origem é aberta e
+    descartada na própria função.
+
+    :param source_path: Caminho do shapefile (ou caminho /vsizip/).
+    :param target_path: Caminho do .gpkg a criar.
+    :param table_name: Nome da tabela no GeoPackage.
+    :param progress_callback: Função opcional para relatar o progresso (0 a 100).
+    :param is_canceled: Função opcional que interrompe a conversão quando retorna True.
+    :return: O caminho do GeoPackage ou None se a conversão foi cancelada.
+    """
+    source = QgsVectorLayer(source_path, table_name, "ogr")
+    if not source.isValid():
+        raise IOError(f"Não foi possível abrir a malha para conversão: {source_path}")
+
+    feedback = QgsFeedback()
+
+    def on_progress(progress):
+        if is_canceled and is_canceled():
+            feedback.cancel()
+        elif progress_callback:
+            progress_callback(progress)
+
+    feedback.progressChanged.connect(on_progress)
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = table_name
+    options.fileEncoding = 'UTF-8'
+    options.layerOptions = ['SPATIAL_INDEX=YES']
+    options.feedback = feedback
+
+    if hasattr(QgsVectorFileWriter, 'writeAsVectorFormatV3'):
+        result = QgsVectorFileWriter.writeAsVectorFormatV3(source, target_path, QgsCoordinateTransformContext(), options)
+    else:
+        result = QgsVectorFileWriter.writeAsVectorFormatV2(source, target_path, QgsCoordinateTransformContext(), options)
+    error, message = result[0], result[1]
+    del source
+
+    if feedback.isCanceled():
+        _remove_geopackage(target_path)
+        return None
+    if error != QgsVectorFileWriter.NoError:
+        _remove_geopackage(target_path)
+        raise IOError(f"Falha ao converter a malha para GeoPackage: {message}")
+
+    index_geocode_columns(target_path, table_name)
+    return target_path
+
+
+def merge_to_geopackage(source_paths, target_path, table_name, progress_callback=None, is_canceled=None):
+    """
+    Une as malhas de várias localidades (ex.: os municípios de cada UF) em um único
+    GeoPackage indexado, como convert_to_geopackage.
+
+    Os campos e o sistema de coordenadas são os da primeira malha; os atributos das
+    demais são copiados pelo nome do campo e as geometrias reprojetadas se preciso.
+    A chave primária das origens (o fid dos GeoPackages do cache) não é copiada: o
+    GeoPackage unido numera as suas feições.
+
+    :param source_paths: Caminhos das malhas (shapefile, /vsizip/ ou GeoPackage).
+    :param target_path: Caminho do .gpkg a criar.
+    :param table_name: Nome da tabela no GeoPackage.
+    :param progress_callback: Função opcional para relatar o progresso (0 a 100).
+    :param is_canceled: Função opcional que interrompe a união quando retorna True.
+    :return: O caminho do GeoPackage ou None se a união foi cancelada.
+    """
+    sources = []
+    for path in source_paths:
+        layer = QgsVectorLayer(path, table_name, "ogr")
+        if not layer.isValid():
+            raise IOError(f"Não foi possível abrir a malha para a união: {path}")
+        sources.append(layer)
+
+    fields = _attribute_fields(sources[0])
+    crs = sources[0].crs()
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = table_name
+    options.fileEncoding = 'UTF-8'
+    options.layerOptions = ['SPATIAL_INDEX=YES']
+    writer = QgsVectorFileWriter.create(
+        target_path, fields, QgsWkbTypes.multiType(sources[0].wkbType()),
+        crs, QgsCoordinateTransformContext(), options
+    )
+
+    total = max(sum(layer.featureCount() for layer in sources), 1)
+    written = 0
+    try:
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise IOError(f"Falha ao criar a malha unida: {writer.errorMessage()}")
+
+        for layer in sources:
+            source_fields = layer.fields()
+            field_map = [source_fields.indexOf(field.name()) for field in fields]
+            transform = None
+            if layer.crs() != crs:
+                transform = QgsCoordinateTransform(layer.crs(), crs, QgsProject.instance())
+
+            for source_feature in layer.getFeatures():
+                if is_canceled and is_canceled():
+                    break
+                feature = QgsFeature(fields)
+                feature.setAttributes([
+                    source_feature.attribute(index) if index >= 0 else None for index in field_map
+                ])
+                if source_feature.hasGeometry():
+                    geometry = source_feature.geometry()
+                    if transform:
+                        geometry.transform(transform)
+                    geometry.convertToMultiType()
+                    feature.setGeometry(geometry)
+                if not writer.addFeature(feature):
+                    raise IOError(f"Falha ao gravar a malha unida: {writer.errorMessage()}")
+
+                written += 1
+                if progress_callback and written % 500 == 0:
+                    progress_callback(90 * written / total)
+    except Exception:
+        del writer
+        _remove_geopackage(target_path)
+        raise
+    del writer
+    del sources
+
+    if is_canceled and is_canceled():
+        _remove_geopackage(target_path)
+        return None
+
+    index_geocode_columns(target_path, table_name)
+    if progress_callback:
+        progress_callback(100)
+    return target_path
+
+
+def _attribute_fields(layer):
+    """
+    Retorna os campos de atributos de uma camada, sem a chave primária do provedor
+    nem um campo fid, que colidiriam com o fid do GeoPackage de destino.
+    """
+    primary_keys = set(layer.primaryKeyAttributes())
+    fields = QgsFields()
+    for index, field in enumerate(layer.fields()):
+        if index not in primary_keys and field.name().lower() != 'fid':
+            fields.append(field)
+    return fields
+
+
+def simplify_to_geopackage(source_path, target_path, table_name, tolerance, progress_callback=None, is_canceled=None):
+    """
+    Gera uma versão simplificada de uma malha em um GeoPackage indexado.
+
+    Com o QGIS 3.36 ou superior (GEOS 3.12), a malha é simplificada como uma
+    cobertura (simplifyCoverageVW): as divisas compartilhadas entre unidades vizinhas
+    são simplificadas uma única vez, sem abrir buracos nem sobreposições. Nas versões
+    anteriores, cada feição é simplificada com preservação da sua topologia, e as
+    divisas de unidades vizinhas podem divergir ligeiramente.
+
+    :param source_path: Caminho da malha original (shapefile, /vsizip/ ou GeoPackage).
+    :param target_path: Caminho do .gpkg a criar.
+    :param table_name: Nome da tabela no GeoPackage.
+    :param tolerance: Tolerância da simplificação em metros; convertida para graus se
+                      a malha estiver em coordenadas geográficas.
+    :param progress_callback: Função opcional para relatar o progresso (0 a 100).
+    :param is_canceled: Função opcional que interrompe a simplificação quando retorna True.
+    :return: O caminho do GeoPackage ou None se a simplificação foi cancelada.
+    """
+    source = QgsVectorLayer(source_path, table_name, "ogr")
+    if not source.isValid():
+        raise IOError(f"Não foi possível abrir a malha para simplificação: {source_path}")
+    if source.crs().isGeographic():
+        tolerance = tolerance / constants.METERS_PER_DEGREE
+
+    features = []
+    total = max(source.featureCount(), 1)
+    for feature in source.getFeatures():
+        if is_canceled and is_canceled():
+            return None
+        features.append(feature)
+        if progress_callback and len(features) % 500 == 0:
+            progress_callback(30 * len(features) / total)
+
+    with_geometry = [feature for feature in features if feature.hasGeometry()]
+    geometries = [feature.geometry() for feature in with_geometry]
+    simplified = _simplify_coverage(geometries, tolerance)
+    if simplified is None:
+        simplified = []
+        for index, geometry in enumerate(geometries):
+            if is_canceled and is_canceled():
+                return None
+            simplified.append(geometry.simplify(tolerance))
+            if progress_callback and index % 500 == 0:
+                progress_callback(30 + 50 * index / len(geometries))
+    if is_canceled and is_canceled():
+        return None
+
+    for feature, geometry in zip(with_geometry, simplified):
+        if geometry.isEmpty():
+            # Unidades menores que a tolerância mantêm a geometria original.
+            geometry = feature.geometry()
+        geometry.convertToMultiType()
+        feature.setGeometry(geometry)
+    if progress_callback:
+        progress_callback(80)
+
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = table_name
+    options.fileEncoding = 'UTF-8'
+    options.layerOptions = ['SPATIAL_INDEX=YES']
+    writer = QgsVectorFileWriter.create(
+        target_path, source.fields(), QgsWkbTypes.multiType(source.wkbType()),
+        source.crs(), QgsCoordinateTransformContext(), options
+    )
+    try:
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise IOError(f"Falha ao criar a malha simplificada: {writer.errorMessage()}")
+        if not writer.addFeatures(features):
+            raise IOError(f"Falha ao gravar a malha simplificada: {writer.errorMessage()}")
+    except Exception:
+        del writer
+        _remove_geopackage(target_path)
+        raise
+    del writer
+    del source
+
+    index_geocode_columns(target_path, table_name)
+    if progress_callback:
+        progress_callback(100)
+    return target_path
+
+
+def _simplify_coverage(geometries, tolerance):
+    """
+    Simplifica as geometrias como uma cobertura poligonal (QGIS 3.36+).
+
+    :return: As geometrias simplificadas, na mesma ordem, ou None se a simplificação
+             de cobertura não está disponível ou falhou (ex.: cobertura inválida).
+    """
+    if not geometries or not hasattr(QgsGeometry, 'simplifyCoverageVW'):
+        return None
+
+    collection = QgsGeometryCollection()
+    for geometry in geometries:
+        collection.addGeometry(geometry.constGet().clone())
+    result = QgsGeometry(collection).simplifyCoverageVW(tolerance, False)
+    if result.isNull() or result.constGet().numGeometries() != len(geometries):
+        return None
+    parts = result.constGet()
+    return [QgsGeometry(parts.geometryN(index).clone()) for index in range(parts.numGeometries())]
+
+
+def index_geocode_columns(gpkg_path, table_name):
+    """
+    Cria índices nas colunas de código geográfico (CD_*) de uma tabela do
+    GeoPackage e atualiza as estatísticas usadas pelo planejador do SQLite.
+
+    :return: Lista com as colunas indexadas.
+    """
+    conn = sqlite3.connect(gpkg_path)
+    try:
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+        indexed = [column for column in columns if _GEOCODE_COLUMN.match(column)]
+        with conn:
+            for column in indexed:
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{table_name}_{column.lower()}" '
+                    f'ON "{table_name}" ("{column}")'
+                )
+        try:
+            conn.execute('ANALYZE')
+        except sqlite3.OperationalError:
+            # SQLite sem o módulo R-tree não abre a tabela do índice espacial.
+            conn.execute(f'ANALYZE "{table_name}"')
+        return indexed
+    finally:
+        conn.close()
+
+
+def _remove_geopackage(path):
+    """
+    Apaga um GeoPackage incompleto e os seus ficheiros auxiliares do SQLite.
+    """
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -1,13 +1,57 @@
 # -*- coding: utf-8 -*-
 
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsApplication, QgsVectorLayer
-from qgis.PyQt.QtCore import pyqtSignal
+from qgis.PyQt.QtCore import pyqtSignal, QCoreApplication
 
-from ..core.sidra_api_client import SidraApiClient
-from ..core.mesh_downloader import MeshDownloader, fetch_available_years
-from .layer_manager import load_vector_layer, add_layer_to_project
+from ..core.sidra_api_client import SidraApiClient, OUTPUT_DEFAULT
+from ..core.http_cache import ResponseCache
+from ..core.batch_fetcher import fetch_batch, merge_batch_results
+from ..core.api_helpers import prefetch_metadata, get_metadata_from_api
+from ..core.mesh_downloader import MeshDownloader, fetch_available_years, load_cached_years, store_cached_years
+from ..core.mesh_cache import MeshCache
+from .mesh_converter import convert_to_geopackage, merge_to_geopackage, simplify_to_geopackage
+from .layer_manager import load_vector_layer, add_layer_to_project, add_attribute_join, add_related_table, get_project_layer
+from ..utils.paths import get_cache_dir
+from ..utils import constants
 
 active_tasks = []
+_response_cache = None
+_mesh_cache = None
+
+def get_response_cache():
+    """Retorna o cache persistente das respostas da API SIDRA, criado na primeira chamada."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(get_cache_dir('respostas_sidra'))
+    return _response_cache
+
+def get_mesh_cache():
+    """Retorna o cache persistente das malhas do IBGE, criado na primeira chamada."""
+    global _mesh_cache
+    if _mesh_cache is None:
+        _mesh_cache = MeshCache(get_cache_dir('malhas'))
+    return _mesh_cache
+
+def get_years_cache_path():
+    """Retorna o caminho do cache da lista de anos das malhas do IBGE."""
+    return os.path.join(get_cache_dir('malhas'), 'anos_malhas.json')
+
+def get_cached_mesh_years():
+    """
+    Retorna a lista de anos das malhas guardada em cache, para preencher a interface
+    sem acessar a rede.
+    :return: Tupla (lista de anos, expirada) ou None se não há cache.
+    """
+    cached = load_cached_years(get_years_cache_path())
+    if not cached:
+        return None
+    saved_at, years = cached
+    return years, time.time() - saved_at >= constants.MESH_YEARS_CACHE_TTL
 
 def cancel_all_tasks():
     """Cancela todas as tarefas ativas na lista."""
@@ -17,7 +61,10 @@ def cancel_all_tasks():
     active_tasks.clear()
 
 class FetchAvailableYearsTask(QgsTask):
-    """Tarefa para buscar os anos de malhas disponíveis no site do IBGE."""
+    """
+    Tarefa para buscar os anos de malhas disponíveis no site do IBGE e guardá-los
+    em cache. Se o site estiver inacessível, a lista em cache é usada, mesmo expirada.
+    """
     yearsReady = pyqtSignal(list)
     fetchError = pyqtSignal(str)
 
@@ -27,12 +74,23 @@ class FetchAvailableYearsTask(QgsTask):
         self.years = []
 
     def run(self):
+        cache_path = get_years_cache_path()
         try:
             self.years = fetch_available_years()
-            return True
         except Exception as e:
-            self.exception = str(e)
-            return False
+            cached = load_cached_years(cache_path)
+            if not cached:
+                self.exception = str(e)
+                return False
+            QgsMessageLog.logMessage(f'Usando a lista de anos das malhas em cache: {e}', 'SIDRA Connector', Qgis.Warning)
+            self.years = cached[1]
+            return True
+
+        try:
+            store_cached_years(cache_path, self.years)
+        except OSError as e:
+            QgsMessageLog.logMessage(f'Não foi possível gravar o cache de anos das malhas: {e}', 'SIDRA Connector', Qgis.Warning)
+        return True
 
     def finished(self, result):
         if self in active_tasks:
@@ -44,14 +102,36 @@ class FetchAvailableYearsTask(QgsTask):
             self.fetchError.emit(error_message)
 
 
+class PrefetchMetadataTask(QgsTask):
+    """Tarefa para buscar antecipadamente os metadados de tabelas do SIDRA."""
+
+    def __init__(self, table_ids):
+        super().__init__('A buscar metadados de tabelas do SIDRA', QgsTask.CanCancel)
+        self.table_ids = list(table_ids)
+        self.fetched = 0
+
+    def run(self):
+        self.fetched = prefetch_metadata(self.table_ids, self.isCanceled)
+        return not self.isCanceled()
+
+    def finished(self, result):
+        if self in active_tasks:
+            active_tasks.remove(self)
+        if self.fetched:
+            QgsMessageLog.logMessage(f'Metadados de {self.fetched} tabela(s) guardados em cache.', 'SIDRA Connector', Qgis.Info)
+
+
 class FetchSidraDataTask(QgsTask):
     """Tarefa para buscar dados da API SIDRA em segundo plano."""
     dataReady = pyqtSignal(dict, dict)
     fetchError = pyqtSignal(str)
 
-    def __init__(self, url):
+    def __init__(self, url, force_refresh=False, output_mode=OUTPUT_DEFAULT):
         super().__init__(f'A procurar dados da API SIDRA', QgsTask.CanCancel)
         self.url = url
+        self.force_refresh = force_refresh
+        self.output_mode = output_mode
+        self.cache = get_response_cache()
         self.exception = None
         self.sidra_data = None
         self.header_info = None
@@ -59,8 +139,14 @@ class FetchSidraDataTask(QgsTask):
     def run(self):
         QgsMessageLog.logMessage(f'A iniciar busca de dados de: {self.url}', 'SIDRA Connector', Qgis.Info)
         try:
-            client = SidraApiClient(self.url)
-            self.sidra_data, self.header_info = client.fetch_and_parse()
+            client = SidraApiClient(self.url, cache=self.cache)
+            self.sidra_data, self.header_info = client.fetch_and_parse(
+                force_refresh=self.force_refresh,
+                output_mode=self.output_mode,
+                metadata_loader=get_metadata_from_api,
+                progress_callback=self.setProgress,
+                is_canceled=self.isCanceled
+            )
             
             # Log adicional para debug
             if isinstance(self.sidra_data, dict):
@@ -72,6 +158,8 @@ class FetchSidraDataTask(QgsTask):
                 QgsMessageLog.logMessage(f'Dados recebidos têm tipo incorreto: {type(self.sidra_data)}', 'SIDRA Connector', Qgis.Warning)
             
             return True
+        except InterruptedError:
+            return False
         except Exception as e:
             self.exception = str(e)
             QgsMessageLog.logMessage(f'Erro na busca de dados: {e}', 'SIDRA Connector', Qgis.Critical)
@@ -86,43 +174,255 @@ class FetchSidraDataTask(QgsTask):
             error_message = self.exception if self.exception else 'A tarefa foi cancelada.'
             self.fetchError.emit(error_message)
 
+class FetchSidraBatchTask(QgsTask):
+    """Tarefa para buscar várias consultas da API SIDRA ao mesmo tempo e combiná-las."""
+    batchReady = pyqtSignal(dict, dict, list)
+    fetchError = pyqtSignal(str)
+
+    def __init__(self, urls, force_refresh=False, output_mode=OUTPUT_DEFAULT):
+        super().__init__(f'A procurar dados de {len(urls)} consultas da API SIDRA', QgsTask.CanCancel)
+        self.urls = list(urls)
+        self.force_refresh = force_refresh
+        self.output_mode = output_mode
+        self.cache = get_response_cache()
+        self.exception = None
+        self.sidra_data = None
+        self.header_info = None
+        self.failures = []
+
+    def _on_query_done(self, done_count, result):
+        if result.ok:
+            QgsMessageLog.logMessage(f'Consulta {done_count}/{len(self.urls)} concluída: {len(result.sidra_data)} registros de {result.url}', 'SIDRA Connector', Qgis.Info)
+        else:
+            QgsMessageLog.logMessage(f'Consulta {done_count}/{len(self.urls)} falhou: {result.url} - {result.error}', 'SIDRA Connector', Qgis.Warning)
+        self.setProgress(done_count * 100.0 / len(self.urls))
+
+    def run(self):
+        QgsMessageLog.logMessage(f'A iniciar busca em lote de {len(self.urls)} consultas', 'SIDRA Connector', Qgis.Info)
+        try:
+            results = fetch_batch(
+                self.urls,
+                cache=self.cache,
+                force_refresh=self.force_refresh,
+                output_mode=self.output_mode,
+                metadata_loader=get_metadata_from_api,
+                progress_callback=self._on_query_done,
+                is_canceled=self.isCanceled
+            )
+            if self.isCanceled():
+                return False
+
+            self.failures = [f'{result.url}: {result.error}' for result in results if result.error]
+            if not any(result.ok for result in results):
+                self.exception = 'Nenhuma consulta do lote foi concluída. ' + '; '.join(self.failures)
+                return False
+
+            self.sidra_data, self.header_info = merge_batch_results(results)
+            return True
+        except Exception as e:
+            self.exception = str(e)
+            QgsMessageLog.logMessage(f'Erro na busca de dados em lote: {e}', 'SIDRA Connector', Qgis.Critical)
+            return False
+
+    def finished(self, result):
+        if self in active_tasks:
+            active_tasks.remove(self)
+        if result and self.sidra_data is not None:
+            self.batchReady.emit(self.sidra_data, self.header_info, self.failures)
+        else:
+            error_message = self.exception if self.exception else 'A tarefa foi cancelada.'
+            self.fetchError.emit(error_message)
+
+class JoinSidraDataTask(QgsTask):
+    """Tarefa para unir os dados do SIDRA a uma camada em segundo plano."""
+    joinReady = pyqtSignal(QgsVectorLayer, int, list, list)
+    joinError = pyqtSignal(str)
+
+    def __init__(self, joiner, virtual=False):
+        super().__init__(f'A unir dados do SIDRA à camada {joiner.target_name}', QgsTask.CanCancel)
+        self.joiner = joiner
+        self.virtual = virtual
+        self.exception = None
+        self.new_layer = None
+        self.join_count = 0
+        self.unmatched = []
+        self.layer_keys = []
+
+    def run(self):
+        try:
+            if self.joiner.is_long_format():
+                result = self.joiner.join_long(self.setProgress, self.isCanceled)
+            elif self.virtual:
+                result = self.joiner.join_virtual(self.setProgress, self.isCanceled)
+            else:
+                result = self.joiner.join_data(progress_callback=self.setProgress, is_canceled=self.isCanceled)
+            if result is None:
+                return False
+
+            self.new_layer, self.join_count, self.unmatched, self.layer_keys = result
+            # A camada foi criada nesta thread; passa para a thread principal antes de ir ao projeto.
+            self.new_layer.moveToThread(QCoreApplication.instance().thread())
+            return True
+        except Exception as e:
+            self.exception = str(e)
+            QgsMessageLog.logMessage(f'Erro na união dos dados: {e}', 'SIDRA Connector', Qgis.Critical)
+            return False
+
+    def finished(self, result):
+        if self in active_tasks:
+            active_tasks.remove(self)
+        if result and self.new_layer:
+            if self.joiner.is_long_format() or self.virtual:
+                # A camada alvo pode ter sido removida do projeto durante a união.
+                target_layer = get_project_layer(self.joiner.target_layer_id)
+                if target_layer is None:
+                    self.joinError.emit(f"A camada '{self.joiner.target_name}' foi removida do projeto durante a união.")
+                    return
+            if self.joiner.is_long_format():
+                if self.join_count > 0:
+                    add_related_table(target_layer, self.new_layer, self.joiner.join_field_name)
+            elif not self.virtual:
+                add_layer_to_project(self.new_layer)
+            elif self.join_count > 0:
+                add_attribute_join(target_layer, self.new_layer, self.joiner.create_join_info(self.new_layer))
+            self.joinReady.emit(self.new_layer, self.join_count, self.unmatched, self.layer_keys)
+        else:
+            error_message = self.exception if self.exception else 'A união dos dados foi cancelada.'
+            self.joinError.emit(error_message)
+
 class DownloadAndLoadLayerTask(QgsTask):
-    """Tarefa para baixar, extrair e carregar um shapefile."""
+    """Tarefa para baixar, extrair e carregar um shapefile, reaproveitando o cache de malhas."""
     layerReady = pyqtSignal(QgsVectorLayer)
     downloadError = pyqtSignal(str)
 
-    def __init__(self, url, layer_name):
+    # Parcela do progresso de cada etapa posterior ao download (conversão, simplificação)
+    POST_STEP_SHARE = 20
+
+    def __init__(self, url, layer_name, cache_key=None, from_zip=False, to_geopackage=False, tolerance=None):
         super().__init__(f'A baixar malha: {layer_name}', QgsTask.CanCancel)
         self.url = url
         self.layer_name = layer_name
+        self.cache_key = cache_key
+        self.from_zip = from_zip
+        self.to_geopackage = to_geopackage
+        self.tolerance = tolerance
         self.exception = None
         self.downloader = None
+        self.staging_dir = None
         self.new_layer = None
 
     def run(self):
         try:
-            self.downloader = MeshDownloader(self.url)
-            
-            def progress_update(progress):
-                self.setProgress(progress)
+            cache = get_mesh_cache() if self.cache_key else None
 
-            shapefile_path = self.downloader.download_and_extract(progress_update)
-            
-            if self.isCanceled():
+            mesh_path = None
+            if self.tolerance and cache:
+                mesh_path = cache.lookup(*self._simplified_key())
+            if not mesh_path:
+                mesh_path = self._original_mesh(cache)
+                if mesh_path and self.tolerance:
+                    mesh_path = self._simplify(cache, mesh_path)
+            else:
+                QgsMessageLog.logMessage(f'Malha simplificada carregada do cache: {mesh_path}', 'SIDRA Connector', Qgis.Info)
+            if not mesh_path:
                 return False
 
-            self.new_layer = load_vector_layer(shapefile_path, self.layer_name)
+            self.new_layer = load_vector_layer(mesh_path, self.layer_name)
             return self.new_layer.isValid()
 
         except Exception as e:
             self.exception = str(e)
             return False
 
+    def _simplified_key(self):
+        """Chave de cache da versão simplificada da malha."""
+        ano, localidade, tipo = self.cache_key
+        return ano, localidade, f'{tipo}@{self.tolerance}m'
+
+    def _step_progress(self, start, end):
+        """Retorna uma função que mapeia o progresso (0 a 100) de uma etapa para o intervalo [start, end]."""
+        return lambda progress: self.setProgress(start + progress * (end - start) / 100)
+
+    def _original_mesh(self, cache):
+        """
+        Obtém a malha original, do cache ou baixando-a, convertida para GeoPackage se
+        pedido. Retorna o caminho da malha ou None se a tarefa foi cancelada.
+        """
+        post_steps = bool(self.to_geopackage) + bool(self.tolerance)
+        download_end = 100 - post_steps * self.POST_STEP_SHARE
+
+        shapefile_path = cache.lookup(*self.cache_key) if cache else None
+        if shapefile_path:
+            QgsMessageLog.logMessage(f'Malha carregada do cache: {shapefile_path}', 'SIDRA Connector', Qgis.Info)
+        else:
+            part_path = None
+            if cache:
+                self.staging_dir = cache.staging_dir(*self.cache_key)
+                part_path = cache.partial_path(*self.cache_key)
+            self.downloader = MeshDownloader(self.url, self.staging_dir, part_path)
+
+            shapefile_path = self.downloader.download_and_extract(
+                self._step_progress(0, download_end), self.isCanceled, self.from_zip
+            )
+
+            if self.isCanceled():
+                return None
+
+            if cache:
+                shapefile_path = cache.commit(*self.cache_key, self.url, self.staging_dir, shapefile_path)
+                self.staging_dir = None
+
+        if self.to_geopackage and not shapefile_path.lower().endswith('.gpkg'):
+            progress = self._step_progress(download_end, download_end + self.POST_STEP_SHARE)
+            return self._convert(cache, self.cache_key, shapefile_path, progress, convert_to_geopackage)
+        return shapefile_path
+
+    def _simplify(self, cache, mesh_path):
+        """
+        Gera a versão simplificada da malha e a guarda no cache ao lado da original.
+        Retorna o caminho da malha simplificada ou None se a tarefa foi cancelada.
+        """
+        def simplify(source, target, table_name, progress, is_canceled):
+            return simplify_to_geopackage(source, target, table_name, self.tolerance, progress, is_canceled)
+
+        progress = self._step_progress(100 - self.POST_STEP_SHARE, 100)
+        key = self._simplified_key() if cache else None
+        return self._convert(cache, key, mesh_path, progress, simplify, suffix=f'_{self.tolerance}m')
+
+    def _convert(self, cache, key, source_path, progress, converter, suffix='', table_name=None):
+        """
+        Converte a malha com `converter` para um GeoPackage e, com cache, o registra
+        sob `key`. Retorna o caminho do GeoPackage ou None se foi cancelada.
+        """
+        if table_name is None:
+            table_name = os.path.splitext(os.path.basename(source_path))[0]
+        if cache:
+            self.staging_dir = cache.staging_dir(*key)
+            target_dir = self.staging_dir
+        elif self.downloader:
+            target_dir = self.downloader.temp_dir_path
+        else:
+            target_dir = os.path.dirname(source_path)
+        target_path = os.path.join(target_dir, f'{table_name}{suffix}.gpkg')
+
+        QgsMessageLog.logMessage(f'A gerar a malha em GeoPackage: {target_path}', 'SIDRA Connector', Qgis.Info)
+        gpkg_path = converter(source_path, target_path, table_name, progress, self.isCanceled)
+        if gpkg_path is None:
+            return None
+
+        if cache:
+            gpkg_path = cache.commit(*key, self.url, self.staging_dir, gpkg_path)
+            self.staging_dir = None
+        return gpkg_path
+
     def finished(self, result):
         if self in active_tasks:
             active_tasks.remove(self)
-        
-        if self.downloader:
+
+        # Sem cache, os ficheiros ficam no diretório temporário enquanto a camada os usa.
+        if self.staging_dir:
+            get_mesh_cache().discard(self.staging_dir)
+        elif self.downloader and not self.cache_key and not result:
             self.downloader.cleanup()
 
         if result and self.new_layer:
@@ -134,6 +434,97 @@ class DownloadAndLoadLayerTask(QgsTask):
                 error_message = "Download da malha cancelado."
             self.downloadError.emit(error_message)
 
+class DownloadAndMergeMeshesTask(DownloadAndLoadLayerTask):
+    """
+    Tarefa para baixar as malhas de várias UFs em paralelo, reaproveitando o cache
+    de cada uma, e uni-las em uma única camada (GeoPackage guardado no cache).
+    """
+
+    def __init__(self, meshes, layer_name, cache_key, from_zip=False, tolerance=None):
+        """
+        :param meshes: Lista de tuplas (url, cache_key) com a malha de cada UF.
+        :param cache_key: Chave (ano, localidades, tipo) da malha unida no cache.
+        """
+        super().__init__(' '.join(url for url, _ in meshes), layer_name, cache_key, from_zip, False, tolerance)
+        self.meshes = meshes
+
+    def _original_mesh(self, cache):
+        merged_path = cache.lookup(*self.cache_key)
+        if merged_path:
+            QgsMessageLog.logMessage(f'Malha unida carregada do cache: {merged_path}', 'SIDRA Connector', Qgis.Info)
+            return merged_path
+
+        download_end = 100 - (1 + bool(self.tolerance)) * self.POST_STEP_SHARE
+        mesh_paths = self._fetch_meshes(cache, self._step_progress(0, download_end))
+        if mesh_paths is None:
+            return None
+
+        progress = self._step_progress(download_end, download_end + self.POST_STEP_SHARE)
+        return self._convert(cache, self.cache_key, mesh_paths, progress, merge_to_geopackage, table_name=self.layer_name)
+
+    def _fetch_meshes(self, cache, progress):
+        """
+        Obtém as malhas das UFs, no máximo constants.MESH_MAX_PARALLEL_DOWNLOADS ao
+        mesmo tempo, relatando o progresso médio. A falha de uma malha interrompe as
+        demais. Retorna os caminhos na ordem de self.meshes ou None se foi cancelada.
+        """
+        mesh_progress = [0] * len(self.meshes)
+        stop = threading.Event()
+
+        def is_canceled():
+            return stop.is_set() or self.isCanceled()
+
+        workers = max(1, min(constants.MESH_MAX_PARALLEL_DOWNLOADS, len(self.meshes)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._fetch_mesh, cache, url, key, index, mesh_progress, is_canceled)
+                for index, (url, key) in enumerate(self.meshes)
+            ]
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.2)
+                if any(future.exception() for future in done) or self.isCanceled():
+                    stop.set()
+                progress(sum(mesh_progress) / len(mesh_progress))
+
+        if self.isCanceled():
+            return None
+        # Relata o erro original, não as interrupções que ele causou nas demais malhas.
+        errors = [future.exception() for future in futures if future.exception()]
+        for error in errors:
+            if not isinstance(error, InterruptedError):
+                raise error
+        if errors:
+            raise errors[0]
+        return [future.result() for future in futures]
+
+    def _fetch_mesh(self, cache, url, key, index, mesh_progress, is_canceled):
+        """
+        Obtém a malha de uma UF do cache ou baixando-a (em uma thread do executor).
+        """
+        mesh_path = cache.lookup(*key)
+        if mesh_path:
+            mesh_progress[index] = 100
+            return mesh_path
+
+        staging_dir = cache.staging_dir(*key)
+        try:
+            downloader = MeshDownloader(url, staging_dir, cache.partial_path(*key))
+
+            def progress_update(progress):
+                mesh_progress[index] = progress
+
+            mesh_path = downloader.download_and_extract(progress_update, is_canceled, self.from_zip)
+            if is_canceled():
+                raise InterruptedError("Download da malha cancelado.")
+            # As malhas das outras UFs da união não podem sair do cache antes dela.
+            mesh_path = cache.commit(*key, url, staging_dir, mesh_path, keep=[other for _, other in self.meshes])
+            staging_dir = None
+            mesh_progress[index] = 100
+            return mesh_path
+        finally:
+            cache.discard(staging_dir)
+
 def run_fetch_years_task(on_success, on_error):
     """Inicia a tarefa para buscar os anos disponíveis."""
     task = FetchAvailableYearsTask()
@@ -142,17 +533,60 @@ def run_fetch_years_task(on_success, on_error):
     active_tasks.append(task)
     QgsApplication.taskManager().addTask(task)
 
-def run_fetch_task(url, on_success, on_error):
+def run_prefetch_metadata_task(table_ids):
+    """Inicia a tarefa de busca antecipada de metadados e a retorna."""
+    task = PrefetchMetadataTask(table_ids)
+    active_tasks.append(task)
+    QgsApplication.taskManager().addTask(task)
+    return task
+
+def run_fetch_task(url, on_success, on_error, force_refresh=False, output_mode=OUTPUT_DEFAULT):
     """Inicia a tarefa de busca de dados do SIDRA."""
-    task = FetchSidraDataTask(url)
+    task = FetchSidraDataTask(url, force_refresh, output_mode)
     task.dataReady.connect(on_success)
     task.fetchError.connect(on_error)
     active_tasks.append(task)
     QgsApplication.taskManager().addTask(task)
 
-def run_download_task(url, layer_name, on_success, on_error):
-    """Inicia a tarefa de download de malha."""
-    task = DownloadAndLoadLayerTask(url, layer_name)
+def run_batch_fetch_task(urls, on_success, on_error, force_refresh=False, output_mode=OUTPUT_DEFAULT):
+    """Inicia a tarefa de busca em lote de várias consultas do SIDRA."""
+    task = FetchSidraBatchTask(urls, force_refresh, output_mode)
+    task.batchReady.connect(on_success)
+    task.fetchError.connect(on_error)
+    active_tasks.append(task)
+    QgsApplication.taskManager().addTask(task)
+
+def run_join_task(joiner, on_success, on_error, virtual=False):
+    """Inicia a tarefa de união dos dados do SIDRA à camada."""
+    task = JoinSidraDataTask(joiner, virtual)
+    task.joinReady.connect(on_success)
+    task.joinError.connect(on_error)
+    active_tasks.append(task)
+    QgsApplication.taskManager().addTask(task)
+
+def run_download_task(url, layer_name, on_success, on_error, cache_key=None, from_zip=False, to_geopackage=False,
+                      tolerance=None):
+    """
+    Inicia a tarefa de download de malha.
+    :param cache_key: Tupla opcional (ano, localidade, tipo) da malha no cache persistente.
+    :param from_zip: Se True, a malha é lida diretamente do zip (/vsizip/), sem extração.
+    :param to_geopackage: Se True, a malha é convertida em um GeoPackage indexado antes de ser carregada.
+    :param tolerance: Tolerância em metros para carregar uma versão simplificada da malha (None = original).
+    """
+    task = DownloadAndLoadLayerTask(url, layer_name, cache_key, from_zip, to_geopackage, tolerance)
+    task.layerReady.connect(on_success)
+    task.downloadError.connect(on_error)
+    active_tasks.append(task)
+    QgsApplication.taskManager().addTask(task)
+
+def run_merge_download_task(meshes, layer_name, on_success, on_error, cache_key, from_zip=False, tolerance=None):
+    """
+    Inicia a tarefa de download e união das malhas de várias UFs.
+    :param meshes: Lista de tuplas (url, cache_key) com a malha de cada UF.
+    :param cache_key: Tupla (ano, localidades, tipo) da malha unida no cache persistente.
+    :param tolerance: Tolerância em metros para carregar uma versão simplificada da malha (None = original).
+    """
+    task = DownloadAndMergeMeshesTask(meshes, layer_name, cache_key, from_zip, tolerance)
     task.layerReady.connect(on_success)
     task.downloadError.connect(on_error)
     active_tasks.append(task)
@@ -5,6 +5,9 @@ from qgis.PyQt.QtWidgets import QAction
 from qgis.PyQt.QtGui import QIcon
 from .ui.main_dialog import SidraConnectorDialog
 from .gis.task_manager import active_tasks, cancel_all_tasks
+from .core.table_catalog import close_catalogs
+from .core.join_key_index import clear_key_indexes
+from .core.http_session import close_session
 
 class SidraConnector:
     """
@@ -34,10 +37,14 @@ class SidraConnector:
 
     def unload(self):
         """
-        Remove o item de menu e a ação quando o plugin é descarregado
-        e cancela todas as tarefas ativas.
+        Remove o item de menu e a ação quando o plugin é descarregado,
+        cancela todas as tarefas ativas, fecha o catálogo de tabelas, descarta
+        os índices de chaves de união e fecha as conexões HTTP abertas.
         """
         cancel_all_tasks()
+        close_catalogs()
+        clear_key_indexes()
+        close_session()
         self.iface.removePluginMenu(u'&SIDRA Connector', self.action)
         self.iface.removeToolBarIcon(self.action)
 
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Configuração dos testes.
+
+A pasta do plugin é registrada como o pacote `sidra_connector`, como o QGIS faz
+ao carregá-lo, para que os imports relativos dos módulos funcionem sem instalar
+o plugin. Testes que dependem do QGIS usam pytest.importorskip('qgis.core').
+"""
+
+import http.server
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'sidra_connector' not in sys.modules:
+    _package = types.ModuleType('sidra_connector')
+    _package.__path__ = [PLUGIN_DIR]
+    sys.modules['sidra_connector'] = _package
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def http_server():
+    """
+    Inicia servidores HTTP locais com o handler informado e retorna a URL base.
+    Os servidores são encerrados ao fim do teste.
+    """
+    servers = []
+
+    def start(handler_class):
+        server = _Server(('127.0.0.1', 0), handler_class)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de metadados: revalidação pela versão (períodos) da tabela (depende do QGIS).
+"""
+
+import http.server
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from sidra_connector.core import api_helpers
+from sidra_connector.utils import constants
+
+
+@pytest.fixture
+def api_metadados(http_server, tmp_path, monkeypatch):
+    """
+    Servidor com os metadados e a lista de períodos de uma tabela; o teste pode
+    publicar períodos novos ou derrubar o servidor. Cada pedido é registado.
+    """
+    estado = {'periodos': ['2021', '2022'], 'fora_do_ar': False, 'pedidos': []}
+    trava = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            with trava:
+                estado['pedidos'].append(self.path.split('?')[0])
+                periodos = list(estado['periodos'])
+            if estado['fora_do_ar']:
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if self.path.endswith('/periodos'):
+                dados = [{'id': periodo} for periodo in periodos]
+            else:
+                dados = {'Periodos': {'Periodos': [{'Codigo': int(periodo)} for periodo in periodos]}}
+            corpo = json.dumps(dados).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    base = http_server(Handler)
+    monkeypatch.setattr(api_helpers, 'METADATA_URL', base + '/metadados/{tabela_id}')
+    monkeypatch.setattr(api_helpers, 'PERIODS_URL', base + '/agregados/{tabela_id}/periodos')
+    monkeypatch.setattr(api_helpers, 'get_cache_dir', lambda nome: str(tmp_path))
+    monkeypatch.setattr(api_helpers, '_metadata_cache', {})
+    return estado
+
+
+def _periodos(metadata):
+    return [periodo['Codigo'] for periodo in metadata['Periodos']['Periodos']]
+
+
+def test_versao_inalterada_nao_baixa_metadados(api_metadados):
+    api_helpers.get_metadata_from_api('9514')
+    api_metadados['pedidos'].clear()
+
+    metadata = api_helpers.get_metadata_from_api('9514', revalidate=True)
+
+    assert _periodos(metadata) == [2021, 2022]
+    assert api_metadados['pedidos'] == ['/agregados/9514/periodos']
+
+
+def test_novo_periodo_baixa_metadados(api_metadados):
+    api_helpers.get_metadata_from_api('9514')
+    api_metadados['periodos'].append('2023')
+
+    # Dentro do prazo de validade e sem revalidar, o cache é usado como está.
+    assert _periodos(api_helpers.get_metadata_from_api('9514')) == [2021, 2022]
+    assert _periodos(api_helpers.get_metadata_from_api('9514', revalidate=True)) == [2021, 2022, 2023]
+
+
+def test_cache_expirado_e_revalidado(api_metadados, monkeypatch):
+    api_helpers.get_metadata_from_api('9514')
+    api_metadados['periodos'].append('2023')
+    monkeypatch.setattr(constants, 'METADATA_CACHE_TTL', 0)
+
+    assert _periodos(api_helpers.get_metadata_from_api('9514')) == [2021, 2022, 2023]
+
+
+def test_sem_conexao_usa_o_cache(api_metadados):
+    api_helpers.get_metadata_from_api('9514')
+    api_metadados['fora_do_ar'] = True
+
+    assert _periodos(api_helpers.get_metadata_from_api('9514', revalidate=True)) == [2021, 2022]
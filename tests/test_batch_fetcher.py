@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Busca em lote: prefixo das colunas por tabela e cancelamento sem esperar as
+requisições em andamento.
+"""
+
+import http.server
+import threading
+import time
+
+import pytest
+
+from sidra_connector.core.batch_fetcher import BatchResult, fetch_batch, merge_batch_results
+
+
+def _resultado(url, tabela, dados=None, erro=None):
+    result = BatchResult(url)
+    result.table_code = tabela
+    result.sidra_data = dados
+    result.header_info = {'field_aliases': {}} if dados is not None else None
+    result.error = erro
+    return result
+
+
+def test_prefixo_mesmo_com_uma_consulta_bem_sucedida():
+    results = [
+        _resultado('u1', 9514, {'11': {'2022': 10.0}}),
+        _resultado('u2', 6579, erro='Timeout'),
+    ]
+    dados, info = merge_batch_results(results)
+
+    assert dados == {'11': {'t9514_2022': 10.0}}
+    assert info['field_aliases'] == {'t9514_2022': 'Tabela 9514 - 2022'}
+    assert info['tables'] == [9514]
+
+
+def test_mesma_tabela_duas_vezes():
+    results = [
+        _resultado('u1', 9514, {'11': {'2022': 1.0}}),
+        _resultado('u2', 9514, {'11': {'2022': 2.0}}),
+    ]
+    dados, _ = merge_batch_results(results)
+    assert dados == {'11': {'t9514_2022': 1.0, 't9514_2_2022': 2.0}}
+
+
+@pytest.fixture
+def api_lenta(http_server):
+    """
+    Servidor que só responde quando liberado (ao fim do teste).
+    """
+    liberar = threading.Event()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            liberar.wait(10)
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    yield http_server(Handler)
+    liberar.set()
+
+
+def test_cancelamento_nao_espera_requisicoes_em_andamento(api_lenta):
+    urls = [f'{api_lenta}/values/t/{tabela}/n3/all/v/93/p/2022' for tabela in (9514, 6579, 4714)]
+    inicio = time.monotonic()
+    results = fetch_batch(urls, is_canceled=lambda: time.monotonic() - inicio > 0.5)
+
+    assert time.monotonic() - inicio < 3
+    assert not any(result.ok for result in results)
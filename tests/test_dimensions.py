@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Reconhecimento de variável, período e classificações pelo cabeçalho da resposta.
+"""
+
+import pytest
+
+from sidra_connector.core.sidra_api_client import OUTPUT_WIDE, SidraLookupBuilder, _dimension_role
+
+
+@pytest.mark.parametrize('descricao, papel', [
+    ('Variável', 'v'),
+    ('Ano', 'p'),
+    ('Mês', 'p'),
+    ('Trimestre Móvel', 'p'),
+    ('Anos de estudo', 'c'),
+    ('Ano de fundação', 'c'),
+    ('Mês de referência da pesquisa', 'c'),
+    ('Trimestres do ano', 'c'),
+    ('Sexo', 'c'),
+    (None, ''),
+])
+def test_papel_da_dimensao(descricao, papel):
+    assert _dimension_role(descricao) == papel
+
+
+def test_classificacao_iniciada_por_ano_no_formato_largo():
+    cabecalho = {
+        'D1C': 'Unidade da Federação (Código)', 'D1N': 'Unidade da Federação',
+        'D2N': 'Variável', 'D3N': 'Ano', 'D4N': 'Anos de estudo',
+    }
+    colunas = ['D1C', 'D1N', 'D2C', 'D2N', 'D3C', 'D3N', 'D4C', 'D4N', 'V']
+    linhas = [
+        ['11', 'Rondônia', '93', 'População', '2022', '2022', '1568', 'Sem instrução', '10'],
+        ['11', 'Rondônia', '93', 'População', '2022', '2022', '1569', '1 a 3 anos', '20'],
+    ]
+    builder = SidraLookupBuilder(geo_code_col='D1C', output_mode=OUTPUT_WIDE, header=cabecalho)
+    builder.add_rows(linhas, colunas)
+    dados, info = builder.build()
+
+    assert dados == {'11': {'v93_p2022_c1568': 10.0, 'v93_p2022_c1569': 20.0}}
+    assert info['field_aliases']['v93_p2022_c1569'] == 'População - 2022 - 1 a 3 anos'
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistente das respostas da API SIDRA (core/http_cache.py).
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+from sidra_connector.core import http_cache
+from sidra_connector.core.http_cache import ResponseCache
+
+URL = 'https://apisidra.ibge.gov.br/values/t/9514/n3/all/v/93/p/2022'
+
+
+def _store(cache, url, body):
+    chunks = cache.store_stream(url, {'Content-Type': 'application/json'}, [body])
+    return b''.join(chunks)
+
+
+def _indexed(cache):
+    conn = sqlite3.connect(cache.index_path)
+    try:
+        return {row[0] for row in conn.execute("SELECT chave FROM entradas")}
+    finally:
+        conn.close()
+
+
+def _bodies(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.endswith('.body'))
+
+
+@pytest.fixture
+def arquivo_aberto(monkeypatch):
+    """
+    Simula o Windows, onde um arquivo aberto por outro leitor não pode ser
+    substituído nem removido.
+    """
+    bloqueados = set()
+    remove, replace = os.remove, os.replace
+
+    def fake_remove(path):
+        if path in bloqueados:
+            raise PermissionError(13, 'arquivo em uso', path)
+        remove(path)
+
+    def fake_replace(src, dst):
+        if dst in bloqueados:
+            raise PermissionError(13, 'arquivo em uso', dst)
+        replace(src, dst)
+
+    monkeypatch.setattr(http_cache.os, 'remove', fake_remove)
+    monkeypatch.setattr(http_cache.os, 'replace', fake_replace)
+    return bloqueados
+
+
+def test_grava_e_le(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert _store(cache, URL, b'[{"V": "Valor"}]') == b'[{"V": "Valor"}]'
+    entry = cache.lookup(URL.replace('https', 'http') + '/')
+    assert entry and cache.is_fresh(entry)
+    assert b''.join(cache.iter_body(entry)) == b'[{"V": "Valor"}]'
+
+
+def test_substituicao_de_corpo_aberto_mantem_entrada_antiga(tmp_path, arquivo_aberto):
+    cache = ResponseCache(str(tmp_path))
+    _store(cache, URL, b'antigo')
+    entry = cache.lookup(URL)
+    arquivo_aberto.add(cache._body_path(entry['key']))
+
+    _store(cache, URL, b'novo e maior')
+
+    entry = cache.lookup(URL)
+    assert entry['size'] == len(b'antigo')
+    assert b''.join(cache.iter_body(entry)) == b'antigo'
+    assert not [name for name in os.listdir(cache.cache_dir) if name.endswith('.part')]
+
+
+def test_remocao_de_corpo_aberto_mantem_a_entrada(tmp_path, arquivo_aberto):
+    cache = ResponseCache(str(tmp_path), max_bytes=10)
+    _store(cache, URL + '/a', b'123456')
+    aberto = cache._body_path(cache.key_for(URL + '/a'))
+    arquivo_aberto.add(aberto)
+
+    _store(cache, URL + '/b', b'abcdef')
+
+    # A entrada aberta não pôde ser removida: continua no índice e no disco, e a
+    # recém-gravada também fica, mesmo acima do limite.
+    key_a, key_b = cache.key_for(URL + '/a'), cache.key_for(URL + '/b')
+    assert _indexed(cache) == {key_a, key_b}
+    assert os.path.exists(aberto)
+
+    arquivo_aberto.clear()
+    _store(cache, URL + '/c', b'ghijkl')
+    assert _indexed(cache) == {cache.key_for(URL + '/c')}
+    assert _bodies(cache) == [cache.key_for(URL + '/c') + '.body']
+
+
+def test_resposta_recem_gravada_nao_e_removida(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10)
+    _store(cache, URL + '/a', b'123456')
+    _store(cache, URL + '/b', b'resposta maior que o limite')
+
+    # A mais antiga sai; a que acabou de ser gravada fica, mesmo sozinha acima do limite.
+    assert _indexed(cache) == {cache.key_for(URL + '/b')}
+    entry = cache.lookup(URL + '/b')
+    assert b''.join(cache.iter_body(entry)) == b'resposta maior que o limite'
+
+
+def test_abertura_remove_orfaos(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    _store(cache, URL, b'corpo')
+    orfao = os.path.join(str(tmp_path), 'f' * 40 + '.body')
+    parcial_antigo = os.path.join(str(tmp_path), 'e' * 40 + '.body.1234.part')
+    parcial_recente = os.path.join(str(tmp_path), 'd' * 40 + '.body.5678.part')
+    for path in (orfao, parcial_antigo, parcial_recente):
+        with open(path, 'wb') as f:
+            f.write(b'x')
+    os.utime(parcial_antigo, (0, 0))
+
+    ResponseCache(str(tmp_path))
+
+    assert not os.path.exists(orfao)
+    assert not os.path.exists(parcial_antigo)
+    assert os.path.exists(parcial_recente)
+    assert _bodies(cache) == [cache.key_for(URL) + '.body']
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Limite de conexões da sessão HTTP compartilhada diante do paralelismo aninhado.
+"""
+
+import http.server
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sidra_connector.core import http_session
+from sidra_connector.utils import constants
+
+
+@pytest.fixture
+def sessao():
+    http_session.close_session()
+    yield http_session.get_session()
+    http_session.close_session()
+
+
+@pytest.mark.parametrize('externas, internas', [
+    (constants.BATCH_MAX_CONCURRENT_QUERIES, constants.SIDRA_MAX_PARALLEL_REQUESTS),
+    (constants.MESH_MAX_PARALLEL_DOWNLOADS, constants.MESH_DOWNLOAD_SEGMENTS),
+])
+def test_niveis_aninhados_nao_sao_serializados(http_server, sessao, externas, internas):
+    # Cada requisição só é respondida quando todas estão em andamento ao mesmo tempo.
+    barreira = threading.Barrier(externas * internas, timeout=5)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                barreira.wait()
+                status = 200
+            except threading.BrokenBarrierError:
+                status = 409
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    url = http_server(Handler)
+
+    def consulta(_):
+        with ThreadPoolExecutor(max_workers=internas) as executor:
+            return list(executor.map(lambda parte: sessao.get(url, timeout=10).status_code, range(internas)))
+
+    with ThreadPoolExecutor(max_workers=externas) as executor:
+        status = [code for codes in executor.map(consulta, range(externas)) for code in codes]
+
+    assert status == [200] * (externas * internas)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Equivalência do SidraLookupBuilder com a conversão original, linha a linha.
+"""
+
+import pandas as pd
+import pytest
+
+from sidra_connector.core.sidra_api_client import SidraLookupBuilder
+from sidra_connector.dev.benchmark_lookup import COLUNAS, converter_por_linha, criar_resposta
+
+
+def _linha(geo, variavel, periodo, valor):
+    return {
+        'NC': '6', 'NN': 'Município', 'MC': '45', 'MN': 'Pessoas', 'V': valor,
+        'D1C': geo, 'D1N': f'Município {geo}', 'D2C': periodo, 'D2N': periodo,
+        'D3C': '93', 'D3N': variavel,
+    }
+
+
+def _converter_em_blocos(df, tamanho):
+    builder = SidraLookupBuilder()
+    rows = df.to_dict('records')
+    for start in range(0, len(rows), tamanho):
+        builder.add_rows(rows[start:start + tamanho], list(df.columns))
+    return builder.build()
+
+
+def _converter(df):
+    builder = SidraLookupBuilder()
+    builder.add_dataframe(df)
+    return builder.build()
+
+
+@pytest.fixture
+def resposta_com_repeticoes():
+    linhas = [
+        _linha('3550308', 'População', '2010', '11253503'),
+        _linha('3550308', 'População', '2022', '11451245'),
+        _linha('3550308', ' Área ', '2022', '1521,11'),
+        _linha(' 3304557 ', 'População', '2010', '-'),
+        _linha('3304557', 'População', '2022', None),
+        _linha('3304557', 'Área', '2022', '...'),
+        _linha(None, 'População', '2010', '10'),
+        _linha('5300108', None, '2010', 'X'),
+        _linha('5300108', None, '2022', '-12,5'),
+        _linha('5300108', 'Área', '2022', '1.2.3'),
+    ]
+    return pd.DataFrame(linhas, columns=COLUNAS)
+
+
+def test_chaves_repetidas_e_valores_ausentes(resposta_com_repeticoes):
+    esperado = converter_por_linha(resposta_com_repeticoes)
+    assert _converter(resposta_com_repeticoes) == esperado
+
+    dados = esperado[0]
+    assert dados['3550308'] == {'População': 11253503.0, 'População_1': 11451245.0, 'Área': 1521.11}
+    assert dados['3304557'] == {'População': '-', 'População_1': None, 'Área': '...'}
+    assert dados['5300108'] == {'Valor': 'X', 'Valor_1': -12.5, 'Área': '1.2.3'}
+
+
+@pytest.mark.parametrize('tamanho', [1, 3, 7])
+def test_blocos_equivalem_a_resposta_inteira(resposta_com_repeticoes, tamanho):
+    assert _converter_em_blocos(resposta_com_repeticoes, tamanho) == converter_por_linha(resposta_com_repeticoes)
+
+
+def test_sufixo_coincide_com_variavel_real():
+    linhas = [
+        _linha('1', 'Taxa', '2010', '1'),
+        _linha('1', 'Taxa_1', '2010', '2'),
+        _linha('1', 'Taxa', '2022', '3'),
+        _linha('1', 'Taxa', '2023', '4'),
+    ]
+    df = pd.DataFrame(linhas, columns=COLUNAS)
+    esperado = converter_por_linha(df)
+    assert _converter(df) == esperado
+    assert esperado[0]['1'] == {'Taxa': 1.0, 'Taxa_1': 2.0, 'Taxa_2': 3.0, 'Taxa_3': 4.0}
+
+
+def test_sem_coluna_de_variavel_usa_fallback():
+    linhas = [
+        {'D1C': '11', 'D1N': 'Rondônia', 'V': '10,5', 'Extra': 'a'},
+        {'D1C': '12', 'D1N': 'Acre', 'V': None, 'Extra': '7'},
+        {'D1C': '13', 'D1N': 'Amazonas', 'V': None, 'Extra': None},
+        {'D1C': '11', 'D1N': 'Rondônia', 'V': '3', 'Extra': None},
+    ]
+    df = pd.DataFrame(linhas, columns=['D1C', 'D1N', 'V', 'Extra'])
+    esperado = converter_por_linha(df)
+    assert _converter(df) == esperado
+    assert esperado[0] == {'11': {'V': 3.0}, '12': {'Extra': 7.0}}
+
+
+def test_resposta_sintetica_grande():
+    df = criar_resposta(300, 3, 4)
+    assert _converter(df) == converter_por_linha(df)
+    assert _converter_em_blocos(df, 500) == converter_por_linha(df)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Limite de tamanho do cache de malhas durante a união de várias UFs e limpeza
+concorrente com o descarte de downloads.
+"""
+
+import os
+import threading
+
+import pytest
+
+from sidra_connector.core import mesh_cache
+from sidra_connector.core.mesh_cache import MeshCache
+
+UFS = [('2022', uf, 'Municipios') for uf in ('RO', 'AC', 'AM')]
+
+
+def _gravar(cache, chave, keep=()):
+    staging_dir = cache.staging_dir(*chave)
+    shapefile = os.path.join(staging_dir, 'malha.shp')
+    with open(shapefile, 'wb') as f:
+        f.write(b'x' * 1000)
+    return cache.commit(*chave, f'https://ibge/{chave[1]}.zip', staging_dir, shapefile, keep=keep)
+
+
+def test_sem_protecao_remove_malha_mais_antiga(tmp_path):
+    cache = MeshCache(str(tmp_path), max_bytes=2500)
+    for chave in UFS:
+        _gravar(cache, chave)
+
+    assert cache.lookup(*UFS[0]) is None
+    assert cache.lookup(*UFS[1]) and cache.lookup(*UFS[2])
+
+
+def test_malhas_da_mesma_uniao_ficam_no_cache(tmp_path):
+    cache = MeshCache(str(tmp_path), max_bytes=2500)
+    caminhos = [_gravar(cache, chave, keep=UFS) for chave in UFS]
+
+    assert [cache.lookup(*chave) for chave in UFS] == caminhos
+    assert all(os.path.exists(caminho) for caminho in caminhos)
+
+    # Fora da união, o limite volta a valer na gravação seguinte.
+    _gravar(cache, ('2022', 'RR', 'Municipios'))
+    assert sum(cache.lookup(*chave) is not None for chave in UFS) == 1
+
+
+@pytest.mark.parametrize('mesma_instancia', [True, False])
+def test_commit_concorrente_com_discard(tmp_path, monkeypatch, mesma_instancia):
+    cache = MeshCache(str(tmp_path))
+    outro = cache if mesma_instancia else MeshCache(str(tmp_path))
+    descartado = outro.staging_dir('2022', 'AC', 'Municipios')
+    listdir = os.listdir
+    threads = []
+
+    def listdir_com_discard(path):
+        # O discard acontece entre a listagem e a verificação de cada entrada
+        # na limpeza feita pelo commit.
+        nomes = listdir(path)
+        if os.path.basename(descartado) in nomes:
+            thread = threading.Thread(target=outro.discard, args=(descartado,))
+            thread.start()
+            threads.append(thread)
+            # Na mesma instância o discard espera o commit terminar.
+            thread.join(0.5)
+        return nomes
+
+    monkeypatch.setattr(mesh_cache.os, 'listdir', listdir_com_discard)
+    caminho = _gravar(cache, UFS[0])
+
+    assert cache.lookup(*UFS[0]) == caminho
+    for thread in threads:
+        thread.join(5)
+    assert not os.path.exists(descartado)
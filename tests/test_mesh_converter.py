@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+União de malhas de várias UFs em um GeoPackage (depende do QGIS).
+"""
+
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import (
+    QgsApplication, QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsFeature,
+    QgsField, QgsFields, QgsGeometry, QgsVectorFileWriter, QgsVectorLayer, QgsWkbTypes
+)
+from qgis.PyQt.QtCore import QVariant
+
+from sidra_connector.gis.mesh_converter import merge_to_geopackage
+
+
+@pytest.fixture(scope='module')
+def qgis_app():
+    app = QgsApplication([], False)
+    app.initQgis()
+    yield app
+    app.exitQgis()
+
+
+def _criar_malha(path, codigos):
+    """
+    Grava um GeoPackage com um quadrado por município, como as malhas do cache
+    (com a coluna fid numerada a partir de 1).
+    """
+    fields = QgsFields()
+    fields.append(QgsField('CD_MUN', QVariant.String))
+    fields.append(QgsField('NM_MUN', QVariant.String))
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = 'municipios'
+    writer = QgsVectorFileWriter.create(
+        path, fields, QgsWkbTypes.MultiPolygon, QgsCoordinateReferenceSystem('EPSG:4674'),
+        QgsCoordinateTransformContext(), options
+    )
+    assert writer.hasError() == QgsVectorFileWriter.NoError, writer.errorMessage()
+    for position, codigo in enumerate(codigos):
+        feature = QgsFeature(fields)
+        feature.setAttributes([codigo, f'Município {codigo}'])
+        x = float(position)
+        feature.setGeometry(QgsGeometry.fromWkt(
+            f'MULTIPOLYGON((({x} 0, {x + 1} 0, {x + 1} 1, {x} 1, {x} 0)))'
+        ))
+        assert writer.addFeature(feature)
+    del writer
+    return path
+
+
+def test_uniao_de_dois_geopackages(qgis_app, tmp_path):
+    ro = _criar_malha(str(tmp_path / 'ro.gpkg'), ['1100015', '1100023'])
+    ac = _criar_malha(str(tmp_path / 'ac.gpkg'), ['1200013', '1200054', '1200104'])
+    assert 'fid' in QgsVectorLayer(ro, 'ro', 'ogr').fields().names()
+
+    target = merge_to_geopackage([ro, ac], str(tmp_path / 'unida.gpkg'), 'municipios')
+
+    merged = QgsVectorLayer(target, 'unida', 'ogr')
+    assert merged.isValid()
+    assert merged.fields().names() == ['fid', 'CD_MUN', 'NM_MUN']
+    assert sorted(feature['CD_MUN'] for feature in merged.getFeatures()) == [
+        '1100015', '1100023', '1200013', '1200054', '1200104'
+    ]
+    assert len({feature.id() for feature in merged.getFeatures()}) == 5
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Download das malhas em segmentos (Range) contra um servidor local: retomada de
+um download interrompido, If-Range quando o ficheiro muda e servidor sem Range.
+"""
+
+import http.server
+import io
+import os
+import random
+import re
+import threading
+import zipfile
+
+import pytest
+
+from sidra_connector.core.mesh_downloader import MeshDownloader
+from sidra_connector.utils import constants
+
+
+def _zip_malha(semente):
+    """
+    Cria um zip (sem compressão, para ter um tamanho previsível) com um shapefile falso.
+    """
+    gerador = random.Random(semente)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+        zip_file.writestr('BR_UF_2022/malha.shp', gerador.randbytes(200 * 1024))
+        zip_file.writestr('BR_UF_2022/malha.dbf', gerador.randbytes(20 * 1024))
+        zip_file.writestr('BR_UF_2022/leiame.txt', b'outro ficheiro')
+    return buffer.getvalue()
+
+
+def _conteudo_shp(dados):
+    with zipfile.ZipFile(io.BytesIO(dados)) as zip_file:
+        return zip_file.read('BR_UF_2022/malha.shp')
+
+
+@pytest.fixture(autouse=True)
+def segmentos_pequenos(monkeypatch):
+    monkeypatch.setattr(constants, 'MESH_SEGMENT_MIN_BYTES', 32 * 1024)
+    monkeypatch.setattr(constants, 'HTTP_BACKOFF_FACTOR', 0.01)
+    # Blocos menores que os segmentos, para que o recebido antes de um corte seja gravado.
+    monkeypatch.setattr(constants, 'CHUNK_SIZE', 4096)
+
+
+@pytest.fixture
+def servidor_malhas(http_server):
+    """
+    Servidor de ficheiros com suporte opcional a Range e If-Range. O estado pode ser
+    alterado pelo teste; cada pedido é registado como (Range, If-Range, bytes enviados).
+    """
+    estado = {
+        'dados': _zip_malha(1), 'etag': '"v1"', 'aceita_range': True,
+        'cortar': False, 'mudar_apos_sonda': None, 'pedidos': [],
+    }
+    trava = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            with trava:
+                dados, etag = estado['dados'], estado['etag']
+                cortar = estado['cortar']
+            pedido_range = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            match = re.match(r'bytes=(\d+)-(\d*)$', pedido_range or '')
+
+            if not estado['aceita_range'] or not match or (if_range and if_range != etag):
+                status, inicio, fim = 200, 0, len(dados) - 1
+            else:
+                status = 206
+                inicio = int(match.group(1))
+                fim = min(int(match.group(2)), len(dados) - 1) if match.group(2) else len(dados) - 1
+            corpo = dados[inicio:fim + 1]
+            enviado = corpo
+            if status == 206 and cortar and pedido_range != 'bytes=0-0':
+                # Conexão cai no meio do segmento.
+                enviado = corpo[:len(corpo) // 2]
+
+            self.send_response(status)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(corpo)))
+            if estado['aceita_range']:
+                self.send_header('Accept-Ranges', 'bytes')
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {inicio}-{fim}/{len(dados)}')
+            self.end_headers()
+            self.wfile.write(enviado)
+
+            with trava:
+                estado['pedidos'].append((pedido_range, if_range, len(enviado)))
+                if pedido_range == 'bytes=0-0' and estado['mudar_apos_sonda']:
+                    estado['dados'], estado['etag'] = estado['mudar_apos_sonda']
+                    estado['mudar_apos_sonda'] = None
+
+        def log_message(self, *args):
+            pass
+
+    return http_server(Handler) + '/malha.zip', estado
+
+
+def _baixar(url, tmp_path, nome):
+    downloader = MeshDownloader(url, str(tmp_path / nome), part_path=str(tmp_path / 'malha.zip.part'))
+    os.makedirs(downloader.temp_dir_path, exist_ok=True)
+    return downloader.download_and_extract()
+
+
+def _ler(caminho):
+    with open(caminho, 'rb') as f:
+        return f.read()
+
+
+def test_retoma_segmento_interrompido(servidor_malhas, tmp_path):
+    url, estado = servidor_malhas
+    estado['cortar'] = True
+    with pytest.raises(ConnectionError):
+        _baixar(url, tmp_path, 'tentativa1')
+    assert os.path.exists(tmp_path / 'malha.zip.part.json')
+
+    estado['cortar'] = False
+    estado['pedidos'].clear()
+    shp = _baixar(url, tmp_path, 'tentativa2')
+
+    assert _ler(shp) == _conteudo_shp(estado['dados'])
+    assert os.path.exists(os.path.join(os.path.dirname(shp), 'malha.dbf'))
+    assert not os.path.exists(os.path.join(os.path.dirname(shp), 'leiame.txt'))
+    # Apenas o que faltava foi pedido, a partir do ponto em que cada segmento parou.
+    segmentos = [pedido for pedido in estado['pedidos'] if pedido[0] != 'bytes=0-0']
+    assert segmentos and all(if_range == '"v1"' for _, if_range, _ in segmentos)
+    assert sum(enviado for _, _, enviado in segmentos) < len(estado['dados']) // 4
+    assert not os.path.exists(tmp_path / 'malha.zip.part')
+    assert not os.path.exists(tmp_path / 'malha.zip.part.json')
+
+
+def test_ficheiro_alterado_entre_tentativas(servidor_malhas, tmp_path):
+    url, estado = servidor_malhas
+    estado['cortar'] = True
+    with pytest.raises(ConnectionError):
+        _baixar(url, tmp_path, 'tentativa1')
+
+    estado.update(cortar=False, dados=_zip_malha(2), etag='"v2"')
+    shp = _baixar(url, tmp_path, 'tentativa2')
+
+    # O estado salvo era de outra versão: o download recomeça do zero.
+    assert _ler(shp) == _conteudo_shp(_zip_malha(2))
+
+
+def test_ficheiro_alterado_durante_download(servidor_malhas, tmp_path):
+    url, estado = servidor_malhas
+    estado['mudar_apos_sonda'] = (_zip_malha(2), '"v2"')
+
+    # If-Range com a ETag antiga: o servidor responde 200 com o ficheiro novo.
+    with pytest.raises(OSError, match='pedido parcial'):
+        _baixar(url, tmp_path, 'tentativa1')
+    assert any(if_range == '"v1"' for _, if_range, _ in estado['pedidos'])
+    assert not os.path.exists(tmp_path / 'malha.zip.part')
+    assert not os.path.exists(tmp_path / 'malha.zip.part.json')
+
+    shp = _baixar(url, tmp_path, 'tentativa2')
+    assert _ler(shp) == _conteudo_shp(_zip_malha(2))
+
+
+def test_servidor_sem_range(servidor_malhas, tmp_path):
+    url, estado = servidor_malhas
+    estado['aceita_range'] = False
+
+    shp = _baixar(url, tmp_path, 'malha')
+
+    assert _ler(shp) == _conteudo_shp(estado['dados'])
+    assert len(estado['pedidos']) == 1
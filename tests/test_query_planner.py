@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Divisão de consultas acima do limite de valores: as partes, baixadas de um
+servidor local que imita a API SIDRA, devem reproduzir a consulta inteira.
+"""
+
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+from sidra_connector.core.query_planner import SidraQuery, estimate_cells, split_query
+from sidra_connector.core.sidra_api_client import OUTPUT_DEFAULT, OUTPUT_LONG, OUTPUT_WIDE, SidraApiClient
+from sidra_connector.utils import constants
+
+UFS = {'11': 'Rondônia', '12': 'Acre', '13': 'Amazonas'}
+PERIODOS = ['2019', '2020', '2021', '2022']
+METADADOS = {
+    'Variaveis': [
+        {'Id': 93, 'Nome': 'População residente', 'VariaveisDerivadas': [
+            {'Id': 1000093, 'Nome': 'População residente - percentual do total geral'},
+        ]},
+        {'Id': 1000, 'Nome': 'Domicílios', 'VariaveisDerivadas': []},
+        {'Id': 614, 'Nome': 'Área', 'VariaveisDerivadas': [
+            {'Id': 1000614, 'Nome': 'Área - percentual do total geral'},
+        ]},
+    ],
+    'Periodos': {'Periodos': [{'Codigo': int(periodo)} for periodo in PERIODOS]},
+    'Classificacoes': [],
+}
+VARIAVEIS = {
+    str(variavel['Id']): (variavel['Nome'], [(str(d['Id']), d['Nome']) for d in variavel['VariaveisDerivadas']])
+    for variavel in METADADOS['Variaveis']
+}
+CABECALHO = {
+    'NC': 'Nível Territorial (Código)', 'NN': 'Nível Territorial',
+    'MC': 'Unidade de Medida (Código)', 'MN': 'Unidade de Medida', 'V': 'Valor',
+    'D1C': 'Unidade da Federação (Código)', 'D1N': 'Unidade da Federação',
+    'D2C': 'Variável (Código)', 'D2N': 'Variável',
+    'D3C': 'Ano (Código)', 'D3N': 'Ano',
+}
+
+
+def _variaveis(selecao):
+    """
+    Resolve a seleção de variáveis como a API: 'all' inclui as derivadas logo
+    após a variável de origem, 'allxp' as exclui.
+    """
+    nomes = {}
+    for codigo, (nome, derivadas) in VARIAVEIS.items():
+        nomes[codigo] = nome
+        if selecao != 'allxp':
+            nomes.update(derivadas)
+    if selecao in ('all', 'allxp'):
+        return list(nomes.items())
+    todas = dict(nomes)
+    for _, derivadas in VARIAVEIS.values():
+        todas.update(derivadas)
+    return [(codigo, todas[codigo]) for codigo in selecao.split(',')]
+
+
+def _resposta(path):
+    query = SidraQuery('http://sidra' + path)
+    ufs = list(UFS) if query.value('n3') == 'all' else query.value('n3').split(',')
+    periodos = PERIODOS if query.value('p') == 'all' else query.value('p').split(',')
+    linhas = [CABECALHO]
+    for uf in ufs:
+        for codigo, nome in _variaveis(query.value('v')):
+            for periodo in periodos:
+                linhas.append({
+                    'NC': '3', 'NN': 'Unidade da Federação', 'MC': '45', 'MN': 'Pessoas',
+                    'V': str(int(uf) * 1000 + int(codigo) % 1000 + int(periodo) % 100),
+                    'D1C': uf, 'D1N': UFS[uf], 'D2C': codigo, 'D2N': nome,
+                    'D3C': periodo, 'D3N': periodo,
+                })
+    return linhas
+
+
+@pytest.fixture
+def api_sidra(http_server):
+    """
+    Servidor que imita a API de valores do SIDRA; guarda os caminhos requisitados.
+    """
+    requisicoes = []
+    trava = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            with trava:
+                requisicoes.append(self.path)
+            corpo = json.dumps(_resposta(self.path)).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    return http_server(Handler), requisicoes
+
+
+def _buscar(url, output_mode):
+    return SidraApiClient(url).fetch_and_parse(output_mode=output_mode, metadata_loader=lambda tabela: METADADOS)
+
+
+@pytest.mark.parametrize('output_mode', [OUTPUT_DEFAULT, OUTPUT_WIDE, OUTPUT_LONG])
+@pytest.mark.parametrize('variaveis', ['all', 'allxp', '93,1000093,614'])
+def test_partes_reproduzem_a_consulta_inteira(api_sidra, monkeypatch, output_mode, variaveis):
+    base, requisicoes = api_sidra
+    url = f'{base}/values/t/9999/n3/all/v/{variaveis}/p/all'
+
+    inteira = _buscar(url, output_mode)
+    assert len(requisicoes) == 1
+
+    monkeypatch.setattr(constants, 'SIDRA_CELL_LIMIT', 4)
+    dividida = _buscar(url, output_mode)
+
+    assert len(requisicoes) > 2
+    if output_mode == OUTPUT_LONG:
+        # As linhas de cada código chegam na ordem das partes; o conteúdo é o mesmo.
+        dividida = ({geo: sorted(linhas) for geo, linhas in dividida[0].items()}, dividida[1])
+        inteira = ({geo: sorted(linhas) for geo, linhas in inteira[0].items()}, inteira[1])
+    assert dividida == inteira
+
+
+def test_allxp_nao_inclui_derivadas(api_sidra, monkeypatch):
+    base, requisicoes = api_sidra
+    monkeypatch.setattr(constants, 'SIDRA_CELL_LIMIT', 1)
+    _buscar(f'{base}/values/t/9999/n3/11/v/allxp/p/2022', OUTPUT_DEFAULT)
+
+    variaveis = sorted(SidraQuery('http://sidra' + path).value('v') for path in requisicoes)
+    assert variaveis == ['1000', '614', '93']
+
+
+def test_estimativa_inclui_variaveis_derivadas():
+    query = SidraQuery('https://apisidra.ibge.gov.br/values/t/9999/n3/11/v/all/p/2022')
+    assert estimate_cells(query, METADADOS) == 5
+    assert estimate_cells(query.replace('v', 'allxp'), METADADOS) == 3
+
+
+def test_selecao_all_desconhecida_nao_e_dividida():
+    query = SidraQuery('https://apisidra.ibge.gov.br/values/t/9999/n3/11/v/allxyz/p/2022')
+    assert split_query(query, METADADOS, limit=1) == [query]
+
+
+@pytest.fixture
+def api_sidra_lenta(http_server):
+    """
+    Servidor que imita a API SIDRA mas só responde quando liberado (ao fim do teste).
+    """
+    liberar = threading.Event()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            liberar.wait(10)
+            corpo = json.dumps(_resposta(self.path)).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    yield http_server(Handler)
+    liberar.set()
+
+
+def test_cancelamento_com_partes_em_andamento(api_sidra_lenta, monkeypatch):
+    monkeypatch.setattr(constants, 'SIDRA_CELL_LIMIT', 4)
+    url = f'{api_sidra_lenta}/values/t/9999/n3/all/v/all/p/all'
+    inicio = time.monotonic()
+
+    with pytest.raises(InterruptedError):
+        SidraApiClient(url).fetch_and_parse(
+            metadata_loader=lambda tabela: METADADOS,
+            is_canceled=lambda: time.monotonic() - inicio > 0.5
+        )
+    assert time.monotonic() - inicio < 3
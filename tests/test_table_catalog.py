@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Busca no índice em memória do catálogo: prefixos sem acentos e ordenação por relevância.
+"""
+
+from sidra_connector.core.table_catalog import TableSearchIndex
+
+TABELAS = [
+    (1, 'Área plantada', 'Produção Agrícola Municipal'),
+    (2, 'Domicílios particulares', 'Censo Demográfico'),
+    (6, 'Pessoas ocupadas e empresas ativas', 'Cadastro Central de Empresas'),
+    (7, 'Pessoas ocupadas e pessoas desocupadas', 'Cadastro Central de Empresas'),
+    (3, 'População residente', 'Censo Demográfico'),
+    (4, 'População residente, por cor ou raça, e população indígena', 'Censo Demográfico'),
+    (5, 'Rendimento médio', 'Pesquisa sobre População'),
+]
+
+
+def _ids(resultados):
+    return [tabela_id for tabela_id, _, _ in resultados]
+
+
+def test_prefixos_sem_acentos():
+    indice = TableSearchIndex(TABELAS)
+    assert sorted(_ids(indice.search('popul resid'))) == [3, 4]
+    assert _ids(indice.search('area plant')) == [1]
+
+
+def test_nome_da_tabela_pesa_mais_que_o_grupo():
+    indice = TableSearchIndex(TABELAS)
+    # A tabela 5 só tem "população" no nome do grupo.
+    assert _ids(indice.search('popula'))[-1] == 5
+
+
+def test_mais_ocorrencias_vem_antes():
+    indice = TableSearchIndex(TABELAS)
+    # Sem o ranking, a tabela 6 viria antes por ordem alfabética.
+    assert _ids(indice.search('pessoas')) == [7, 6]
+    assert _ids(indice.search('pessoas ocup')) == [7, 6]
+
+
+def test_refinamento_da_consulta_anterior():
+    indice = TableSearchIndex(TABELAS)
+    assert _ids(indice.search('po')) == _ids(TableSearchIndex(TABELAS).search('po'))
+    assert _ids(indice.search('pop resid')) == _ids(TableSearchIndex(TABELAS).search('pop resid'))
+    assert _ids(indice.search('pop residente', limit=1)) == [3]
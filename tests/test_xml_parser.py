@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Leitura incremental das respostas XML do SIDRA, comparada à resposta JSON
+equivalente (tests/fixtures/sidra_t9514_n3_sexo.*).
+"""
+
+import os
+
+import pytest
+
+from sidra_connector.core.sidra_api_client import SidraApiClient, OUTPUT_DEFAULT, OUTPUT_WIDE, OUTPUT_LONG
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'sidra_t9514_n3_sexo')
+
+
+def _blocos(path, tamanho):
+    with open(path, 'rb') as f:
+        body = f.read()
+    return [body[start:start + tamanho] for start in range(0, len(body), tamanho)]
+
+
+def _converter(path, content_type, output_mode, tamanho=65536):
+    client = SidraApiClient(9514)
+    builder = client._parse_body(_blocos(path, tamanho), content_type, output_mode=output_mode)
+    return builder.build()
+
+
+@pytest.mark.parametrize('output_mode', [OUTPUT_DEFAULT, OUTPUT_WIDE, OUTPUT_LONG])
+def test_xml_equivale_ao_json(output_mode):
+    xml = _converter(FIXTURE + '.xml', 'application/xml; charset=utf-8', output_mode)
+    json_ = _converter(FIXTURE + '.json', 'application/json; charset=utf-8', output_mode)
+    assert xml == json_
+    assert len(xml[0]) == 27
+
+
+@pytest.mark.parametrize('tamanho', [1, 97, 4096])
+def test_xml_em_blocos_pequenos(tamanho):
+    inteiro = _converter(FIXTURE + '.xml', 'application/xml', OUTPUT_WIDE)
+    assert _converter(FIXTURE + '.xml', 'application/xml', OUTPUT_WIDE, tamanho) == inteiro
+
+
+def test_valores_do_xml():
+    dados, header_info = _converter(FIXTURE + '.xml', 'application/xml', OUTPUT_WIDE)
+    assert set(dados['35']) == {'v93_p2010_c4', 'v93_p2010_c5', 'v93_p2022_c4', 'v93_p2022_c5'}
+    assert dados['14']['v93_p2010_c4'] == '-'
+    assert dados['16']['v93_p2022_c5'] == '...'
+    assert isinstance(dados['35']['v93_p2022_c4'], float)
+    assert header_info['field_aliases']['v93_p2010_c4'] == 'População residente - 2010 - Homens'
+
+
+def test_xml_sem_coluna_geografica():
+    xml = (
+        '<ArrayOfValorDescritoPorSuasDimensoes xmlns="http://schemas.datacontract.org/2004/07/IBGE.BTE.Tabela">'
+        '<ValorDescritoPorSuasDimensoes><D1C>Ano (Código)</D1C><D1N>Ano</D1N><V>Valor</V></ValorDescritoPorSuasDimensoes>'
+        '</ArrayOfValorDescritoPorSuasDimensoes>'
+    )
+    with pytest.raises(ValueError):
+        SidraApiClient(9514)._parse_xml(xml)
@@ -4,9 +4,11 @@
 Este arquivo contém as definições de widgets personalizados para o plugin.
 """
 
-from qgis.PyQt import QtWidgets
+from qgis.PyQt import QtWidgets, QtCore
 from qgis.PyQt.QtCore import pyqtSignal
 
+from ..core.table_catalog import tokenize
+
 class RefreshableComboBox(QtWidgets.QComboBox):
     """
     Uma QComboBox que emite um sinal personalizado (aboutToShowPopup)
@@ -22,3 +24,272 @@ class RefreshableComboBox(QtWidgets.QComboBox):
         """
         self.aboutToShowPopup.emit()
         super(RefreshableComboBox, self).showPopup()
+
+
+class OptionListModel(QtCore.QAbstractListModel):
+    """
+    Modelo de lista para grandes quantidades de opções (tabelas, categorias,
+    períodos), exibido em uma QListView.
+
+    As opções ficam em listas simples e os textos só são montados quando a
+    view pede uma linha visível. O filtro guarda apenas as posições das opções
+    que passaram, e as opções marcadas sobrevivem às mudanças de filtro.
+    """
+
+    def __init__(self, options=None, label_func=None, checkable=False, parent=None):
+        """
+        Construtor.
+        :param options: Lista de opções; o primeiro elemento de cada tupla é o id.
+        :param label_func: Função que monta o texto exibido de uma opção.
+        :param checkable: Se True, as opções exibem uma caixa de marcação.
+        :param parent: Objeto pai.
+        """
+        super(OptionListModel, self).__init__(parent)
+        self.label_func = label_func or (lambda option: str(option[1]))
+        self.checkable = checkable
+        self._options = []
+        self._visible = []
+        self._search_keys = None
+        self._filter_tokens = []
+        self._checked = set()
+        if options:
+            self.set_options(options)
+
+    def set_options(self, options):
+        """
+        Substitui as opções do modelo, limpando filtro e marcações.
+        """
+        self.beginResetModel()
+        self._options = list(options)
+        self._visible = list(range(len(self._options)))
+        self._search_keys = None
+        self._filter_tokens = []
+        self._checked = set()
+        self.endResetModel()
+
+    def clear(self):
+        """
+        Remove todas as opções.
+        """
+        self.set_options([])
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._visible)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._visible):
+            return None
+
+        position = self._visible[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return self.label_func(self._options[position])
+        if role == QtCore.Qt.UserRole:
+            return self._options[position]
+        if role == QtCore.Qt.CheckStateRole and self.checkable:
+            return QtCore.Qt.Checked if position in self._checked else QtCore.Qt.Unchecked
+        return None
+
+    def option(self, index):
+        """
+        Retorna a opção de um índice da view.
+        """
+        return self.data(index, QtCore.Qt.UserRole)
+
+    def option_count(self):
+        """
+        Retorna o número total de opções, com ou sem filtro.
+        """
+        return len(self._options)
+
+    def set_filter(self, text):
+        """
+        Exibe apenas as opções que contêm todas as palavras do texto (sem
+        diferenciar maiúsculas e acentos).
+
+        Quando o novo texto apenas estende o anterior, filtra somente as
+        opções já visíveis.
+        """
+        tokens = tokenize(text)
+        if tokens == self._filter_tokens:
+            return
+
+        if self._search_keys is None:
+            self._search_keys = [' '.join(tokenize(self.label_func(option))) for option in self._options]
+
+        previous = self._filter_tokens
+        refines = bool(previous) and len(tokens) >= len(previous) and all(
+            token.startswith(old) for old, token in zip(previous, tokens)
+        )
+        candidates = self._visible if refines else range(len(self._options))
+        keys = self._search_keys
+
+        self.beginResetModel()
+        self._visible = [
+            position for position in candidates
+            if all(token in keys[position] for token in tokens)
+        ]
+        self._filter_tokens = tokens
+        self.endResetModel()
+
+    def toggle(self, index):
+        """
+        Inverte a marcação da opção de um índice.
+        """
+        if not self.checkable or not index.isValid():
+            return
+        position = self._visible[index.row()]
+        if position in self._checked:
+            self._checked.discard(position)
+        else:
+            self._checked.add(position)
+        self.dataChanged.emit(index, index, [QtCore.Qt.CheckStateRole])
+
+    def set_visible_checked(self, checked):
+        """
+        Marca ou desmarca todas as opções visíveis com o filtro atual.
+        """
+        if not self.checkable or not self._visible:
+            return
+        if checked:
+            self._checked.update(self._visible)
+        else:
+            self._checked.difference_update(self._visible)
+        self.dataChanged.emit(
+            self.index(0), self.index(len(self._visible) - 1), [QtCore.Qt.CheckStateRole]
+        )
+
+    def checked_options(self):
+        """
+        Retorna as opções marcadas, na ordem original.
+        """
+        return [self._options[position] for position in sorted(self._checked)]
+
+    def checked_count(self):
+        """
+        Retorna o número de opções marcadas.
+        """
+        return len(self._checked)
+
+
+def create_option_view(model, parent=None):
+    """
+    Cria uma QListView configurada para listas longas: linhas de altura
+    uniforme e layout em lotes, sem criar um item por linha.
+    """
+    view = QtWidgets.QListView(parent)
+    view.setModel(model)
+    view.setUniformItemSizes(True)
+    view.setLayoutMode(QtWidgets.QListView.Batched)
+    view.setBatchSize(200)
+    view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+    return view
+
+
+class OptionSelectionDialog(QtWidgets.QDialog):
+    """
+    Diálogo de seleção simples ou múltipla com filtro incremental, usado para
+    períodos, níveis territoriais, variáveis e categorias.
+    """
+
+    def __init__(self, title, options, single_selection=False, label_func=None, parent=None):
+        """
+        Construtor.
+        :param title: Título do diálogo.
+        :param options: Lista de tuplas (id, nome, info_extra).
+        :param single_selection: Se True, permite apenas uma seleção.
+        :param label_func: Função que monta o texto exibido de uma opção.
+        :param parent: Widget pai.
+        """
+        super(OptionSelectionDialog, self).__init__(parent)
+        self.single_selection = single_selection
+        self.setWindowTitle(title)
+        self.setFixedSize(500, 400)
+
+        layout = QtWidgets.QVBoxLayout(self)
+
+        self.le_filter = QtWidgets.QLineEdit()
+        self.le_filter.setPlaceholderText("Filtrar opções...")
+        self.le_filter.setClearButtonEnabled(True)
+        layout.addWidget(self.le_filter)
+
+        self.model = OptionListModel(options, label_func, checkable=not single_selection, parent=self)
+        self.view = create_option_view(self.model, self)
+        if single_selection:
+            self.view.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+            self.view.doubleClicked.connect(self.accept)
+        else:
+            self.view.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+            self.view.clicked.connect(self.on_item_clicked)
+        layout.addWidget(self.view)
+
+        # Botões
+        button_layout = QtWidgets.QHBoxLayout()
+        self.lbl_count = QtWidgets.QLabel()
+        button_layout.addWidget(self.lbl_count)
+        if not single_selection:
+            btn_check_all = QtWidgets.QPushButton("Marcar visíveis")
+            btn_uncheck_all = QtWidgets.QPushButton("Desmarcar visíveis")
+            btn_check_all.clicked.connect(lambda: self.set_visible_checked(True))
+            btn_uncheck_all.clicked.connect(lambda: self.set_visible_checked(False))
+            button_layout.addWidget(btn_check_all)
+            button_layout.addWidget(btn_uncheck_all)
+
+        btn_ok = QtWidgets.QPushButton("OK")
+        btn_cancel = QtWidgets.QPushButton("Cancelar")
+        btn_ok.setDefault(True)
+        button_layout.addStretch()
+        button_layout.addWidget(btn_cancel)
+        button_layout.addWidget(btn_ok)
+        layout.addLayout(button_layout)
+
+        btn_ok.clicked.connect(self.accept)
+        btn_cancel.clicked.connect(self.reject)
+        self.le_filter.textChanged.connect(self.on_filter_changed)
+        self.update_count()
+
+    def on_filter_changed(self, text):
+        """
+        Aplica o filtro digitado.
+        """
+        self.model.set_filter(text)
+        self.update_count()
+
+    def on_item_clicked(self, index):
+        """
+        Marca ou desmarca a opção clicada.
+        """
+        self.model.toggle(index)
+        self.update_count()
+
+    def set_visible_checked(self, checked):
+        """
+        Marca ou desmarca as opções visíveis.
+        """
+        self.model.set_visible_checked(checked)
+        self.update_count()
+
+    def update_count(self):
+        """
+        Atualiza o texto com o número de opções exibidas e marcadas.
+        """
+        text = f"{self.model.rowCount()} de {self.model.option_count()}"
+        if not self.single_selection:
+            text += f" · {self.model.checked_count()} marcada(s)"
+        self.lbl_count.setText(text)
+
+    def selected_options(self):
+        """
+        Retorna as opções escolhidas.
+
+        Returns:
+            list: Lista de tuplas selecionadas (vazia se nada foi escolhido)
+        """
+        if self.single_selection:
+            index = self.view.currentIndex()
+            selected = self.view.selectionModel().selectedIndexes()
+            if not selected or not index.isValid():
+                return []
+            return [self.model.option(index)]
+        return self.model.checked_options()
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 
-from qgis.core import Qgis, QgsVectorLayer
-from qgis.PyQt import QtWidgets
+import re
+from functools import partial
+
+from qgis.core import Qgis, QgsVectorLayer, QgsMessageLog
+from qgis.PyQt import QtWidgets, QtCore
 
 from .main_dialog_base_ui import Ui_SidraConnectorDialogBase
 from .query_builder_dialog import QueryBuilderDialog
 from ..gis import layer_manager, task_manager
 from ..core.data_joiner import DataJoiner
+from ..core.sidra_api_client import OUTPUT_DEFAULT, OUTPUT_WIDE, OUTPUT_LONG
 from ..utils import constants
 
 class SidraConnectorDialog(QtWidgets.QDialog, Ui_SidraConnectorDialogBase):
@@ -24,14 +28,92 @@ class SidraConnectorDialog(QtWidgets.QDialog, Ui_SidraConnectorDialogBase):
         self.iface = iface
         self.plugin_dir = plugin_dir
 
+        # Leitura da malha direto do zip, sem extrair os ficheiros
+        self.chk_mesh_from_zip = QtWidgets.QCheckBox("Ler a malha direto do .zip (sem extrair)")
+        self.chk_mesh_from_zip.setToolTip(
+            "Mantém apenas o .zip baixado e abre o shapefile dentro dele (/vsizip/), "
+            "ocupando metade do espaço em disco. A leitura pode ser um pouco mais lenta."
+        )
+
+        # Conversão da malha para GeoPackage com índices
+        self.chk_mesh_geopackage = QtWidgets.QCheckBox("Converter a malha para GeoPackage indexado")
+        self.chk_mesh_geopackage.setToolTip(
+            "Após o download, converte a malha em GeoPackage com índice espacial e índice no código "
+            "geográfico (CD_MUN, CD_UF...), acelerando uniões e a renderização. Feito em segundo plano."
+        )
+
+        # Resolução da malha: original ou versões simplificadas, mais leves
+        self.cb_resolucao_malha = QtWidgets.QComboBox()
+        self.cb_resolucao_malha.addItems(constants.MESH_RESOLUTIONS.keys())
+        self.cb_resolucao_malha.setToolTip(
+            "As versões simplificadas são geradas a partir da malha original e guardadas no cache. "
+            "São bem mais leves para mapas estaduais e nacionais."
+        )
+
+        # Seleção de várias UFs, baixadas em paralelo e unidas em uma só camada
+        self.chk_varias_ufs = QtWidgets.QCheckBox("Várias UFs")
+        self.chk_varias_ufs.setToolTip(
+            "Baixa apenas as malhas das UFs marcadas, ao mesmo tempo, e as une em uma única camada. "
+            "Mais rápido e leve do que a malha do Brasil inteiro."
+        )
+        self.cb_regiao_malha = QtWidgets.QComboBox()
+        self.cb_regiao_malha.addItem("Marcar região...")
+        self.cb_regiao_malha.addItems(constants.REGIOES_UFS.keys())
+        self.lst_ufs_malha = QtWidgets.QListWidget()
+        self.lst_ufs_malha.setMaximumHeight(120)
+
+        self.gridLayout_3.removeWidget(self.btn_download_malha)
+        self.gridLayout_3.addWidget(self.chk_varias_ufs, 3, 0)
+        self.gridLayout_3.addWidget(self.cb_regiao_malha, 3, 1)
+        self.gridLayout_3.addWidget(self.lst_ufs_malha, 4, 0, 1, 2)
+        self.gridLayout_3.addWidget(QtWidgets.QLabel("Resolução:"), 5, 0)
+        self.gridLayout_3.addWidget(self.cb_resolucao_malha, 5, 1)
+        self.gridLayout_3.addWidget(self.chk_mesh_from_zip, 6, 0, 1, 2)
+        self.gridLayout_3.addWidget(self.chk_mesh_geopackage, 7, 0, 1, 2)
+        self.gridLayout_3.addWidget(self.btn_download_malha, 8, 0, 1, 2)
+
         # Adicionar botão do assistente de busca
         self.btn_query_builder = QtWidgets.QPushButton("Montar API / Buscar Tabela...")
         self.verticalLayout_2.insertWidget(2, self.btn_query_builder)
         self.btn_query_builder.clicked.connect(self.open_query_builder)
 
+        # Opção para ignorar respostas da API guardadas em cache
+        self.chk_force_refresh = QtWidgets.QCheckBox("Ignorar cache e baixar os dados novamente")
+        self.chk_force_refresh.setToolTip(f"Consultas repetidas são servidas do cache local por até {constants.HTTP_CACHE_TTL // 3600} horas.")
+        self.verticalLayout_2.addWidget(self.chk_force_refresh)
+
+        # União virtual: mantém as geometrias na camada original
+        self.chk_virtual_join = QtWidgets.QCheckBox("União virtual (não copiar a camada)")
+        self.chk_virtual_join.setToolTip(
+            "Cria apenas uma tabela com os dados do SIDRA e a une à camada selecionada, "
+            "sem duplicar as geometrias. Indicado para malhas detalhadas."
+        )
+        self.verticalLayout_2.addWidget(self.chk_virtual_join)
+
+        # Formato das colunas do SIDRA na camada
+        output_layout = QtWidgets.QHBoxLayout()
+        output_layout.addWidget(QtWidgets.QLabel("Formato dos dados:"))
+        self.cb_output_mode = QtWidgets.QComboBox()
+        self.cb_output_mode.addItem("Padrão (uma coluna por variável/categoria)", OUTPUT_DEFAULT)
+        self.cb_output_mode.addItem("Largo (variável × período × categoria)", OUTPUT_WIDE)
+        self.cb_output_mode.addItem("Longo (tabela relacionada, uma linha por valor)", OUTPUT_LONG)
+        self.cb_output_mode.setToolTip(
+            "Largo: colunas nomeadas pelos códigos (ex.: v93_p2010_c6794), com o nome completo como alias.\n"
+            "Longo: tabela sem geometria ligada à camada por uma relação pelo código geográfico."
+        )
+        output_layout.addWidget(self.cb_output_mode)
+        self.verticalLayout_2.addLayout(output_layout)
+
+        self.le_api_url.setToolTip(
+            "URL da API SIDRA. Para unir várias tabelas de uma vez, separe as URLs com espaço ou ';'. "
+            "As colunas de cada tabela recebem o prefixo t<tabela>_."
+        )
+
         self.cb_target_layer.aboutToShowPopup.connect(self.populate_layers_combobox)
         self.cb_target_layer.currentIndexChanged.connect(self.on_layer_selection_changed)
         self.btn_download_malha.clicked.connect(self.handle_download_mesh)
+        self.chk_varias_ufs.toggled.connect(self.on_multi_uf_toggled)
+        self.cb_regiao_malha.activated.connect(self.on_region_selected)
         self.btn_fetch_join.clicked.connect(self.handle_fetch_and_join)
         
         self.populate_malha_comboboxes()
@@ -42,10 +124,81 @@ class SidraConnectorDialog(QtWidgets.QDialog, Ui_SidraConnectorDialogBase):
         """
         Popula as comboboxes relacionadas ao download de malhas territoriais.
         """
-        self.cb_ano_malha.addItems([str(y) for y in range(2024, 1999, -1)])
+        cached = task_manager.get_cached_mesh_years()
+        years, expired = cached if cached else (constants.MESH_YEARS_FALLBACK, True)
+        self.cb_ano_malha.addItems(years)
+        if expired:
+            task_manager.run_fetch_years_task(self.on_years_ready, self.on_years_error)
         self.cb_localidade_malha.addItems(constants.UFS.keys())
         self.cb_tipo_malha.addItems(constants.MALHAS.keys())
 
+        for nome, sigla in constants.UFS.items():
+            if sigla == "BR":
+                continue
+            item = QtWidgets.QListWidgetItem(nome)
+            item.setData(QtCore.Qt.UserRole, sigla)
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Unchecked)
+            self.lst_ufs_malha.addItem(item)
+        self.on_multi_uf_toggled(False)
+
+    def on_years_ready(self, years):
+        """
+        Atualiza os anos das malhas com a lista obtida do IBGE, mantendo o ano escolhido.
+        """
+        current = self.cb_ano_malha.currentText()
+        self.cb_ano_malha.blockSignals(True)
+        self.cb_ano_malha.clear()
+        self.cb_ano_malha.addItems(years)
+        index = self.cb_ano_malha.findText(current)
+        self.cb_ano_malha.setCurrentIndex(index if index != -1 else 0)
+        self.cb_ano_malha.blockSignals(False)
+
+    def on_years_error(self, error_message):
+        """
+        Mantém a lista de anos atual quando não foi possível consultá-la no IBGE.
+        """
+        QgsMessageLog.logMessage(f"Não foi possível atualizar os anos das malhas: {error_message}", "SIDRA Connector", Qgis.Warning)
+
+    def on_multi_uf_toggled(self, checked):
+        """
+        Alterna entre a seleção de uma localidade e a de várias UFs.
+        """
+        self.cb_localidade_malha.setEnabled(not checked)
+        self.cb_regiao_malha.setVisible(checked)
+        self.lst_ufs_malha.setVisible(checked)
+
+    def on_region_selected(self, index):
+        """
+        Marca as UFs da Grande Região escolhida, mantendo as já marcadas.
+        """
+        if index <= 0:
+            return
+        siglas = constants.REGIOES_UFS[self.cb_regiao_malha.itemText(index)]
+        for row in range(self.lst_ufs_malha.count()):
+            item = self.lst_ufs_malha.item(row)
+            if item.data(QtCore.Qt.UserRole) in siglas:
+                item.setCheckState(QtCore.Qt.Checked)
+        self.cb_regiao_malha.setCurrentIndex(0)
+
+    def checked_mesh_ufs(self):
+        """
+        Retorna as siglas das UFs marcadas na lista de várias UFs.
+        """
+        items = (self.lst_ufs_malha.item(row) for row in range(self.lst_ufs_malha.count()))
+        return [item.data(QtCore.Qt.UserRole) for item in items if item.checkState() == QtCore.Qt.Checked]
+
+    @staticmethod
+    def mesh_url(ano, localidade_sigla, malha_prefixo):
+        """
+        Monta a URL do zip de uma malha do IBGE (Brasil ou uma UF).
+        """
+        if localidade_sigla == "BR":
+            url_path = f"Brasil/{localidade_sigla}_{malha_prefixo}_{ano}.zip"
+        else:
+            url_path = f"UFs/{localidade_sigla}/{localidade_sigla}_{malha_prefixo}_{ano}.zip"
+        return constants.IBGE_MESH_BASE_URL.format(ano=ano) + url_path
+
     def populate_layers_combobox(self):
         """
         Popula a combobox de camadas com as camadas vetoriais do projeto.
@@ -96,18 +249,51 @@ class SidraConnectorDialog(QtWidgets.QDialog, Ui_SidraConnectorDialogBase):
         
         localidade_sigla = constants.UFS[localidade_nome]
         malha_prefixo = constants.MALHAS[malha_nome]
+        tolerancia = constants.MESH_RESOLUTIONS[self.cb_resolucao_malha.currentText()]
 
-        if localidade_sigla == "BR":
-            url_path = f"Brasil/{localidade_sigla}_{malha_prefixo}_{ano}.zip"
-        else:
-            url_path = f"UFs/{localidade_sigla}/{localidade_sigla}_{malha_prefixo}_{ano}.zip"
+        if self.chk_varias_ufs.isChecked():
+            siglas = self.checked_mesh_ufs()
+            if not siglas:
+                self.iface.messageBar().pushMessage("Erro", "Marque ao menos uma UF.", level=Qgis.Critical)
+                return
+            if len(siglas) > 1:
+                self.download_merged_meshes(ano, siglas, malha_prefixo, tolerancia)
+                return
+            localidade_sigla = siglas[0]
+            localidade_nome = next(nome for nome, sigla in constants.UFS.items() if sigla == localidade_sigla)
 
-        base_url = constants.IBGE_MESH_BASE_URL.format(ano=ano)
-        url = base_url + url_path
+        url = self.mesh_url(ano, localidade_sigla, malha_prefixo)
         layer_name = f"{malha_prefixo}_{localidade_nome}_{ano}".replace(" ", "_")
+        if tolerancia:
+            layer_name += f"_{tolerancia}m"
 
         self.iface.messageBar().pushMessage("Download", f"Iniciando download da malha: {layer_name}", level=Qgis.Info, duration=5)
-        task_manager.run_download_task(url, layer_name, self.on_download_success, self.on_download_error)
+        task_manager.run_download_task(
+            url, layer_name, self.on_download_success, self.on_download_error,
+            cache_key=(ano, localidade_sigla, malha_prefixo),
+            from_zip=self.chk_mesh_from_zip.isChecked(),
+            to_geopackage=self.chk_mesh_geopackage.isChecked(),
+            tolerance=tolerancia
+        )
+
+    def download_merged_meshes(self, ano, siglas, malha_prefixo, tolerancia):
+        """
+        Inicia o download paralelo das malhas de várias UFs e a sua união em uma camada.
+        """
+        meshes = [(self.mesh_url(ano, sigla, malha_prefixo), (ano, sigla, malha_prefixo)) for sigla in siglas]
+        layer_name = f"{malha_prefixo}_{'_'.join(siglas)}_{ano}"
+        if tolerancia:
+            layer_name += f"_{tolerancia}m"
+
+        self.iface.messageBar().pushMessage(
+            "Download", f"Iniciando download das malhas de {len(siglas)} UFs: {layer_name}", level=Qgis.Info, duration=5
+        )
+        task_manager.run_merge_download_task(
+            meshes, layer_name, self.on_download_success, self.on_download_error,
+            cache_key=(ano, '+'.join(sorted(siglas)), malha_prefixo),
+            from_zip=self.chk_mesh_from_zip.isChecked(),
+            tolerance=tolerancia
+        )
 
     def on_download_success(self, new_layer):
         """Callback de sucesso para o download."""
@@ -121,16 +307,17 @@ class SidraConnectorDialog(QtWidgets.QDialog, Ui_SidraConnectorDialogBase):
         """
         Inicia o processo de busca de dados da API e união à camada.
         """
-        api_url = self.le_api_url.text().strip()
+        api_urls = re.split(r'[\s;]+', self.le_api_url.text().strip())
+        api_urls = [url for url in api_urls if url]
         target_layer = self.cb_target_layer.currentData()
         join_field = self.cb_target_field.currentText()
 
         # Validações de entrada
-        if not api_url:
+        if not api_urls:
             self.iface.messageBar().pushMessage("Erro", "URL da API deve ser preenchida.", level=Qgis.Critical)
             return
             
-        if not api_url.startswith(('http://', 'https://')):
+        if not all(url.startswith(('http://', 'https://')) for url in api_urls):
             self.iface.messageBar().pushMessage("Erro", "URL deve começar com http:// ou https://", level=Qgis.Critical)
             return
             
@@ -142,8 +329,40 @@ class SidraConnectorDialog(QtWidgets.QDialog, Ui_SidraConnectorDialogBase):
             self.iface.messageBar().pushMessage("Erro", "Campo de união deve ser selecionado.", level=Qgis.Critical)
             return
 
+        output_mode = self.cb_output_mode.currentData()
+        if len(api_urls) > 1:
+            if output_mode == OUTPUT_LONG:
+                self.iface.messageBar().pushMessage("Erro", "O formato longo aceita apenas uma URL por vez.", level=Qgis.Critical)
+                return
+            self.iface.messageBar().pushMessage("SIDRA Connector", f"Buscando dados de {len(api_urls)} consultas na API...", level=Qgis.Info, duration=5)
+            task_manager.run_batch_fetch_task(
+                api_urls,
+                self.on_batch_fetch_success,
+                self.on_fetch_error,
+                force_refresh=self.chk_force_refresh.isChecked(),
+                output_mode=output_mode
+            )
+            return
+
         self.iface.messageBar().pushMessage("SIDRA Connector", "Buscando dados na API...", level=Qgis.Info, duration=5)
-        task_manager.run_fetch_task(api_url, self.on_fetch_success, self.on_fetch_error)
+        task_manager.run_fetch_task(
+            api_urls[0],
+            self.on_fetch_success,
+            self.on_fetch_error,
+            force_refresh=self.chk_force_refresh.isChecked(),
+            output_mode=output_mode
+        )
+
+    def on_batch_fetch_success(self, sidra_data, header_info, failures):
+        """Callback de sucesso para a busca em lote: avisa das consultas que falharam e une as demais."""
+        if failures:
+            self.iface.messageBar().pushMessage(
+                "Aviso",
+                f"{len(failures)} consulta(s) falharam e não serão unidas: " + "; ".join(failures),
+                level=Qgis.Warning,
+                duration=20
+            )
+        self.on_fetch_success(sidra_data, header_info)
 
     def on_fetch_success(self, sidra_data, header_info):
         """Callback de sucesso para a busca de dados."""
@@ -173,28 +392,66 @@ class SidraConnectorDialog(QtWidgets.QDialog, Ui_SidraConnectorDialogBase):
 
         try:
             joiner = DataJoiner(target_layer, join_field, sidra_data, header_info)
-            new_layer, join_count, unmatched, layer_keys = joiner.join_data()
-            
-            layer_manager.add_layer_to_project(new_layer)
-
-            if join_count > 0:
-                self.iface.messageBar().pushMessage("Sucesso", f"Cópia da camada criada com {join_count} feições unidas!", Qgis.Success)
-            else:
-                sidra_keys_sample = list(sidra_data.keys())[:5] if sidra_data else []
-                self.iface.messageBar().pushMessage(
-                    "Aviso", 
-                    f"Nenhuma correspondência encontrada. Verifique o formato dos códigos. "
-                    f"Exemplos da sua camada: {layer_keys}. "
-                    f"Exemplos dos dados SIDRA: {sidra_keys_sample}.",
-                    level=Qgis.Warning, 
-                    duration=20
-                )
         except ValueError as e:
             self.iface.messageBar().pushMessage("Erro de Validação", f"Dados inválidos: {e}", Qgis.Critical)
+            return
         except TypeError as e:
             self.iface.messageBar().pushMessage("Erro de Tipo", f"Erro no processamento dos dados: {e}", Qgis.Critical)
+            return
         except Exception as e:
             self.iface.messageBar().pushMessage("Erro", f"Falha no processamento ou união: {e}", Qgis.Critical)
+            return
+
+        # A união roda em segundo plano; on_join_success recebe o resultado na thread
+        # principal junto com o estado desta união, para que uniões simultâneas não
+        # se sobrescrevam.
+        is_virtual = self.chk_virtual_join.isChecked()
+        sidra_keys_sample = list(sidra_data.keys())[:5]
+        task_manager.run_join_task(
+            joiner,
+            partial(self.on_join_success, joiner, is_virtual, sidra_keys_sample),
+            self.on_join_error,
+            virtual=is_virtual
+        )
+
+    def on_join_success(self, joiner, is_virtual, sidra_keys_sample, new_layer, join_count, unmatched, layer_keys):
+        """
+        Callback de sucesso para a união dos dados.
+        :param joiner: DataJoiner da união concluída.
+        :param is_virtual: Se a união foi feita por junção virtual à camada alvo.
+        :param sidra_keys_sample: Exemplos de códigos dos dados do SIDRA, para a mensagem sem correspondências.
+        """
+        is_long = joiner.is_long_format()
+        if (is_long or is_virtual) and layer_manager.get_project_layer(joiner.target_layer_id) is None:
+            self.iface.messageBar().pushMessage(
+                "Aviso",
+                f"A camada '{joiner.target_name}' foi removida do projeto durante a união.",
+                level=Qgis.Warning,
+                duration=10
+            )
+            return
+
+        if join_count > 0:
+            if is_long:
+                success_message = f"Tabela '{new_layer.name()}' relacionada à camada '{joiner.target_name}': {join_count} feições correspondidas!"
+            elif is_virtual:
+                success_message = f"Dados do SIDRA unidos à camada '{joiner.target_name}': {join_count} feições correspondidas!"
+            else:
+                success_message = f"Cópia da camada criada com {join_count} feições unidas!"
+            self.iface.messageBar().pushMessage("Sucesso", success_message, Qgis.Success)
+        else:
+            self.iface.messageBar().pushMessage(
+                "Aviso", 
+                f"Nenhuma correspondência encontrada. Verifique o formato dos códigos. "
+                f"Exemplos da sua camada: {layer_keys}. "
+                f"Exemplos dos dados SIDRA: {sidra_keys_sample}.",
+                level=Qgis.Warning, 
+                duration=20
+            )
+
+    def on_join_error(self, error_message):
+        """Callback de erro para a união dos dados."""
+        self.iface.messageBar().pushMessage("Erro", f"Falha no processamento ou união: {error_message}", Qgis.Critical)
 
     def on_fetch_error(self, error_message):
         """Callback de erro para a busca de dados."""
@@ -8,7 +8,12 @@ import sqlite3
 from qgis.PyQt import QtWidgets, QtCore
 from qgis.core import QgsMessageLog, Qgis
 
-from ..core.api_helpers import get_metadata_from_api, montar_url_interativa
+from ..core.table_catalog import get_catalog, SEARCH_LIMIT
+from ..core.api_helpers import get_metadata_from_api, is_metadata_cached, montar_url_interativa
+from ..gis import task_manager
+from .search_worker import TableSearchWorker
+from .custom_widgets import OptionListModel, OptionSelectionDialog, create_option_view
+from ..utils import constants
 
 class QueryBuilderDialog(QtWidgets.QDialog):
     """
@@ -26,6 +31,11 @@ class QueryBuilderDialog(QtWidgets.QDialog):
         super(QueryBuilderDialog, self).__init__(parent)
         self.plugin_dir = plugin_dir
         self.generated_url = None
+        self.prefetch_task = None
+        self.prefetch_ids = []
+        self.search_worker = None
+        self.current_search = None
+        self.avg_search_ms = 0.0
         
         self.setup_ui()
         self.connect_signals()
@@ -61,7 +71,10 @@ class QueryBuilderDialog(QtWidgets.QDialog):
         self.lbl_status.setStyleSheet("color: gray; font-style: italic;")
         
         # Lista de resultados
-        self.list_results = QtWidgets.QListWidget()
+        self.results_model = OptionListModel(
+            label_func=lambda row: f"[{row[0]}] {row[1]} ({row[2]})", parent=self
+        )
+        self.list_results = create_option_view(self.results_model, self)
         self.list_results.setMaximumHeight(200)
         
         search_layout.addWidget(self.lbl_status)
@@ -103,24 +116,31 @@ class QueryBuilderDialog(QtWidgets.QDialog):
         self.search_timer.setSingleShot(True)
         self.search_timer.timeout.connect(self.perform_search)
         
+        # Timer para a busca antecipada de metadados dos primeiros resultados
+        self.prefetch_timer = QtCore.QTimer()
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.timeout.connect(self.prefetch_top_results)
+        
         # Conectar eventos
         self.le_search.textChanged.connect(self.on_search_text_changed)
         self.btn_clear.clicked.connect(self.clear_search)
-        self.list_results.itemDoubleClicked.connect(self.on_table_selected)
+        self.list_results.doubleClicked.connect(self.on_table_selected)
         self.btn_build_query.clicked.connect(self.build_query)
         self.btn_cancel.clicked.connect(self.reject)
         self.btn_ok.clicked.connect(self.accept)
 
-    def get_db_connection(self):
+    def get_catalog(self):
         """
-        Estabelece conexão com o banco de dados de agregados.
+        Obtém o catálogo de tabelas compartilhado, aberto uma única vez por sessão.
         
         Returns:
-            sqlite3.Connection: Conexão com o banco ou None em caso de erro
+            TableCatalog: Catálogo de tabelas ou None em caso de erro
         """
         db_path = os.path.join(self.plugin_dir, "agregados_ibge.db")
         
-        if not os.path.exists(db_path):
+        try:
+            return get_catalog(db_path)
+        except FileNotFoundError:
             QtWidgets.QMessageBox.critical(
                 self, 
                 "Erro", 
@@ -128,9 +148,6 @@ class QueryBuilderDialog(QtWidgets.QDialog):
                 "Certifique-se de que o arquivo agregados_ibge.db está na pasta do plugin."
             )
             return None
-            
-        try:
-            return sqlite3.connect(db_path)
         except sqlite3.Error as e:
             QtWidgets.QMessageBox.critical(
                 self, 
@@ -139,6 +156,43 @@ class QueryBuilderDialog(QtWidgets.QDialog):
             )
             return None
 
+    def get_search_worker(self):
+        """
+        Obtém o worker de busca, criando-o na primeira chamada.
+        
+        Returns:
+            TableSearchWorker: Worker de busca ou None se o catálogo não puder ser aberto
+        """
+        if self.search_worker is None:
+            catalog = self.get_catalog()
+            if not catalog:
+                return None
+            self.search_worker = TableSearchWorker(catalog, SEARCH_LIMIT)
+            self.search_worker.resultsReady.connect(self.on_search_results)
+            self.search_worker.searchFailed.connect(self.on_search_failed)
+        return self.search_worker
+
+    def cancel_search(self):
+        """
+        Cancela a busca em andamento, se houver.
+        """
+        self.current_search = None
+        if self.search_worker is not None:
+            self.search_worker.cancel()
+
+    def search_delay(self):
+        """
+        Calcula o tempo de espera após a digitação antes de buscar.
+        
+        A espera acompanha a duração média das últimas consultas: buscas rápidas
+        respondem quase imediatamente e buscas lentas esperam a digitação parar.
+        
+        Returns:
+            int: Tempo de espera em ms
+        """
+        delay = constants.SEARCH_DEBOUNCE_MIN + 3 * self.avg_search_ms
+        return int(min(delay, constants.SEARCH_DEBOUNCE_MAX))
+
     def on_search_text_changed(self):
         """
         Manipula a mudança no texto de busca com delay para evitar muitas consultas.
@@ -150,20 +204,22 @@ class QueryBuilderDialog(QtWidgets.QDialog):
         
         if len(search_text) < 2:
             # Limpar resultados se o texto for muito curto
-            self.list_results.clear()
+            self.cancel_search()
+            self.results_model.clear()
             self.lbl_status.setText("Digite pelo menos 2 caracteres para iniciar a busca...")
             self.lbl_status.setStyleSheet("color: gray; font-style: italic;")
             return
             
-        # Iniciar novo timer de 500ms
-        self.search_timer.start(500)
+        # Iniciar novo timer com espera proporcional à duração das buscas
+        self.search_timer.start(self.search_delay())
 
     def clear_search(self):
         """
         Limpa o campo de busca e os resultados.
         """
+        self.cancel_search()
         self.le_search.clear()
-        self.list_results.clear()
+        self.results_model.clear()
         self.lbl_status.setText("Digite pelo menos 2 caracteres para iniciar a busca...")
         self.lbl_status.setStyleSheet("color: gray; font-style: italic;")
 
@@ -188,7 +244,8 @@ class QueryBuilderDialog(QtWidgets.QDialog):
         """
     def search_tables(self, search_term=None):
         """
-        Realiza a busca de tabelas no banco de dados.
+        Solicita a busca de tabelas ao worker em segundo plano. Os resultados
+        chegam por on_search_results; uma busca mais nova cancela a anterior.
         
         Args:
             search_term (str): Termo de busca. Se None, usa o valor do campo de texto.
@@ -201,71 +258,123 @@ class QueryBuilderDialog(QtWidgets.QDialog):
             self.lbl_status.setStyleSheet("color: gray; font-style: italic;")
             return
 
-        conn = self.get_db_connection()
-        if not conn:
+        worker = self.get_search_worker()
+        if not worker:
             return
             
-        try:
-            cursor = conn.cursor()
-            
-            # Busca por nome da tabela ou grupo
-            query = """
-                SELECT a.id, a.nome, g.nome as grupo_nome 
-                FROM agregados a 
-                JOIN grupos g ON a.grupo_id = g.id 
-                WHERE a.nome LIKE ? OR g.nome LIKE ?
-                ORDER BY a.nome
-                LIMIT 50
-            """
-            
-            search_pattern = f"%{search_term}%"
-            cursor.execute(query, (search_pattern, search_pattern))
-            results = cursor.fetchall()
+        # Busca por nome da tabela ou grupo, ordenada por relevância (índice em memória)
+        self.current_search = worker.request_search(search_term)
+
+    def on_search_results(self, request_id, search_term, results, elapsed_ms):
+        """
+        Exibe os resultados de uma busca concluída pelo worker.
+        
+        Args:
+            request_id (int): Identificador do pedido de busca
+            search_term (str): Termo buscado
+            results (list): Lista de tuplas (id, nome, grupo_nome)
+            elapsed_ms (float): Duração da consulta em ms
+        """
+        if request_id != self.current_search:
+            return
+        self.current_search = None
+        self.avg_search_ms = 0.7 * self.avg_search_ms + 0.3 * elapsed_ms
             
-            # Limpar resultados anteriores
-            self.list_results.clear()
+        # Substituir os resultados anteriores
+        self.results_model.set_options(results)
+        
+        if results:
+            self.schedule_prefetch([row[0] for row in results[:constants.METADATA_PREFETCH_COUNT]])
             
-            if results:
-                for table_id, table_name, group_name in results:
-                    item = QtWidgets.QListWidgetItem(f"[{table_id}] {table_name} ({group_name})")
-                    item.setData(QtCore.Qt.UserRole, table_id)
-                    self.list_results.addItem(item)
-                
-                # Atualizar status
-                count = len(results)
-                max_text = " (mostrando primeiros 50)" if count == 50 else ""
-                self.lbl_status.setText(f"{count} resultado(s) encontrado(s){max_text}")
-                self.lbl_status.setStyleSheet("color: green;")
-            else:
-                self.lbl_status.setText("Nenhum resultado encontrado")
-                self.lbl_status.setStyleSheet("color: orange;")
-                
-        except sqlite3.Error as e:
-            self.lbl_status.setText(f"Erro na busca: {e}")
-            self.lbl_status.setStyleSheet("color: red;")
-            QtWidgets.QMessageBox.critical(
-                self, 
-                "Erro de Busca", 
-                f"Erro ao buscar no banco de dados: {e}"
-            )
-        finally:
-            conn.close()
+            # Atualizar status
+            count = len(results)
+            max_text = f" (mostrando primeiros {SEARCH_LIMIT})" if count == SEARCH_LIMIT else ""
+            self.lbl_status.setText(f"{count} resultado(s) encontrado(s){max_text}")
+            self.lbl_status.setStyleSheet("color: green;")
+        else:
+            self.lbl_status.setText("Nenhum resultado encontrado")
+            self.lbl_status.setStyleSheet("color: orange;")
+
+    def on_search_failed(self, request_id, error_message):
+        """
+        Exibe o erro de uma busca que falhou no worker.
+        
+        Args:
+            request_id (int): Identificador do pedido de busca
+            error_message (str): Mensagem de erro do SQLite
+        """
+        if request_id != self.current_search:
+            return
+        self.current_search = None
+        self.lbl_status.setText(f"Erro na busca: {error_message}")
+        self.lbl_status.setStyleSheet("color: red;")
+        QtWidgets.QMessageBox.critical(
+            self, 
+            "Erro de Busca", 
+            f"Erro ao buscar no banco de dados: {error_message}"
+        )
+
+    def schedule_prefetch(self, table_ids):
+        """
+        Agenda a busca antecipada dos metadados dos primeiros resultados, depois
+        que o usuário para de digitar.
+        
+        Args:
+            table_ids (list): IDs das tabelas, em ordem de exibição
+        """
+        self.prefetch_ids = table_ids
+        self.prefetch_timer.start(constants.METADATA_PREFETCH_DELAY)
+
+    def prefetch_top_results(self):
+        """
+        Busca em segundo plano os metadados ainda não guardados em cache.
+        """
+        pending = [table_id for table_id in self.prefetch_ids if not is_metadata_cached(table_id)]
+        if not pending:
+            return
+        
+        self.cancel_prefetch()
+        self.prefetch_task = task_manager.run_prefetch_metadata_task(pending)
+
+    def cancel_prefetch(self):
+        """
+        Cancela a busca antecipada em andamento, se houver.
+        """
+        self.prefetch_timer.stop()
+        try:
+            if self.prefetch_task and self.prefetch_task.isActive():
+                self.prefetch_task.cancel()
+        except RuntimeError:
+            # A tarefa já foi concluída e removida pelo gerenciador do QGIS.
+            pass
+        self.prefetch_task = None
+
+    def done(self, result):
+        """
+        Interrompe a busca antecipada e o worker de busca ao fechar o diálogo.
+        """
+        self.search_timer.stop()
+        self.cancel_prefetch()
+        if self.search_worker is not None:
+            self.search_worker.stop()
+            self.search_worker = None
+        super(QueryBuilderDialog, self).done(result)
 
-    def on_table_selected(self, item):
+    def on_table_selected(self, index):
         """
         Manipula a seleção de uma tabela da lista.
         
         Args:
-            item (QListWidgetItem): Item selecionado
+            index (QModelIndex): Índice da linha selecionada
         """
-        table_id = item.data(QtCore.Qt.UserRole)
+        row = self.results_model.option(index)
         
-        if table_id is None:
-            # Item inválido (como mensagem de "nenhum resultado")
+        if row is None:
+            # Índice inválido
             return
             
-        self.selected_table_id = table_id
-        self.lbl_selected_table.setText(f"Tabela selecionada: {item.text()}")
+        self.selected_table_id = row[0]
+        self.lbl_selected_table.setText(f"Tabela selecionada: {index.data()}")
         self.btn_build_query.setEnabled(True)
 
     def build_query(self):
@@ -276,8 +385,8 @@ class QueryBuilderDialog(QtWidgets.QDialog):
             QtWidgets.QMessageBox.warning(self, "Aviso", "Selecione uma tabela primeiro.")
             return
             
-        # Buscar metadados da tabela
-        metadata = get_metadata_from_api(str(self.selected_table_id))
+        # Buscar metadados da tabela, conferindo se a versão em cache ainda é a atual
+        metadata = get_metadata_from_api(str(self.selected_table_id), revalidate=True)
         
         if not metadata:
             QtWidgets.QMessageBox.critical(
@@ -397,55 +506,41 @@ class QueryBuilderDialog(QtWidgets.QDialog):
         Returns:
             list: Lista de tuplas selecionadas ou None se cancelado
         """
-        dialog = QtWidgets.QDialog(self)
-        dialog.setWindowTitle(title)
-        dialog.setFixedSize(500, 400)
-        
-        layout = QtWidgets.QVBoxLayout(dialog)
-        
-        # Lista de opções
-        list_widget = QtWidgets.QListWidget()
-        
-        for option in options:
-            item_id, item_name = option[0], option[1]
-            info_extra = f" ({option[2]})" if len(option) > 2 and option[2] else ""
-            
-            item = QtWidgets.QListWidgetItem(f"{item_name} (ID: {item_id}){info_extra}")
-            item.setData(QtCore.Qt.UserRole, option)
-            list_widget.addItem(item)
-        
-        if not single_selection:
-            list_widget.setSelectionMode(QtWidgets.QAbstractItemView.MultiSelection)
-        
-        layout.addWidget(list_widget)
-        
-        # Botões
-        button_layout = QtWidgets.QHBoxLayout()
-        btn_ok = QtWidgets.QPushButton("OK")
-        btn_cancel = QtWidgets.QPushButton("Cancelar")
-        
-        button_layout.addStretch()
-        button_layout.addWidget(btn_cancel)
-        button_layout.addWidget(btn_ok)
-        
-        layout.addLayout(button_layout)
-        
-        # Conectar sinais
-        btn_ok.clicked.connect(dialog.accept)
-        btn_cancel.clicked.connect(dialog.reject)
+        dialog = OptionSelectionDialog(
+            title,
+            options,
+            single_selection=single_selection,
+            label_func=self.format_option,
+            parent=self
+        )
         
         # Executar diálogo
         if dialog.exec_() == QtWidgets.QDialog.Accepted:
-            selected_items = list_widget.selectedItems()
+            selected_items = dialog.selected_options()
             
             if not selected_items:
                 QtWidgets.QMessageBox.warning(self, "Aviso", "Nenhum item selecionado.")
                 return None
                 
-            return [item.data(QtCore.Qt.UserRole) for item in selected_items]
+            return selected_items
         
         return None
 
+    @staticmethod
+    def format_option(option):
+        """
+        Monta o texto exibido de uma opção do diálogo de seleção.
+        
+        Args:
+            option (tuple): Tupla (id, nome, info_extra)
+            
+        Returns:
+            str: Texto da opção
+        """
+        item_id, item_name = option[0], option[1]
+        info_extra = f" ({option[2]})" if len(option) > 2 and option[2] else ""
+        return f"{item_name} (ID: {item_id}){info_extra}"
+
     def get_generated_url(self):
         """
         Retorna a URL gerada pelo assistente.
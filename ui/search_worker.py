@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Busca de tabelas do catálogo em uma thread separada da interface.
+"""
+
+import sqlite3
+import threading
+import time
+
+from qgis.PyQt import QtCore
+
+from ..core.table_catalog import SearchCanceled, SEARCH_LIMIT
+
+
+class TableSearchWorker(QtCore.QObject):
+    """
+    Executa as buscas no catálogo de tabelas em uma QThread própria.
+
+    Cada pedido recebe um número sequencial; um pedido mais novo cancela os
+    anteriores, inclusive a consulta que estiver em execução no SQLite (via
+    progress handler). Somente o resultado do pedido mais recente é emitido.
+    """
+
+    # id do pedido, termo buscado, resultados, duração da consulta (ms)
+    resultsReady = QtCore.pyqtSignal(int, str, list, float)
+    # id do pedido, mensagem de erro
+    searchFailed = QtCore.pyqtSignal(int, str)
+    _searchRequested = QtCore.pyqtSignal(int, str)
+
+    def __init__(self, catalog, limit=SEARCH_LIMIT):
+        """
+        Construtor.
+        :param catalog: TableCatalog usado nas consultas.
+        :param limit: Número máximo de resultados por busca.
+        """
+        super().__init__()
+        self.catalog = catalog
+        self.limit = limit
+        self._latest_request = 0
+        self._request_lock = threading.Lock()
+
+        self._thread = QtCore.QThread()
+        self.moveToThread(self._thread)
+        self._searchRequested.connect(self._run_search)
+        self._thread.start()
+
+    def request_search(self, search_term):
+        """
+        Agenda uma busca, cancelando as que ainda não terminaram.
+
+        Args:
+            search_term (str): Texto digitado pelo usuário
+
+        Returns:
+            int: Identificador do pedido, repetido nos sinais de resultado
+        """
+        with self._request_lock:
+            self._latest_request += 1
+            request_id = self._latest_request
+        self._searchRequested.emit(request_id, search_term)
+        return request_id
+
+    def cancel(self):
+        """
+        Cancela a busca em andamento e as que estiverem na fila.
+        """
+        with self._request_lock:
+            self._latest_request += 1
+
+    def is_stale(self, request_id):
+        """
+        Indica se um pedido foi superado por outro mais recente.
+        """
+        return request_id != self._latest_request
+
+    @QtCore.pyqtSlot(int, str)
+    def _run_search(self, request_id, search_term):
+        """
+        Executa uma busca na thread do worker.
+        """
+        if self.is_stale(request_id):
+            return
+
+        started = time.perf_counter()
+        try:
+            results = self.catalog.search(
+                search_term, self.limit, is_canceled=lambda: self.is_stale(request_id)
+            )
+        except SearchCanceled:
+            return
+        except sqlite3.Error as e:
+            if not self.is_stale(request_id):
+                self.searchFailed.emit(request_id, str(e))
+            return
+
+        if not self.is_stale(request_id):
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.resultsReady.emit(request_id, search_term, results, elapsed_ms)
+
+    def stop(self):
+        """
+        Cancela as buscas pendentes e encerra a thread do worker.
+        """
+        self.cancel()
+        self._thread.quit()
+        self._thread.wait()
@@ -15,6 +15,15 @@ UFS = {
     "Sergipe": "SE", "Tocantins": "TO"
 }
 
+# UFs de cada Grande Região, para marcar várias UFs de uma vez no download de malhas
+REGIOES_UFS = {
+    "Norte": ["AC", "AM", "AP", "PA", "RO", "RR", "TO"],
+    "Nordeste": ["AL", "BA", "CE", "MA", "PB", "PE", "PI", "RN", "SE"],
+    "Sudeste": ["ES", "MG", "RJ", "SP"],
+    "Sul": ["PR", "RS", "SC"],
+    "Centro-Oeste": ["DF", "GO", "MS", "MT"]
+}
+
 MALHAS = {
     "Municípios": "Municipios",
     "Unidades da Federação": "UF",
@@ -28,8 +37,78 @@ IBGE_MESH_BASE_URL_PARENT = "https://geoftp.ibge.gov.br/organizacao_do_territori
 
 IBGE_MESH_BASE_URL = IBGE_MESH_BASE_URL_PARENT + "municipio_{ano}/"
 
+# Anos das malhas: a lista do FTP do IBGE fica em cache; sem cache, usa-se o intervalo abaixo
+MESH_YEARS_CACHE_TTL = 7 * 24 * 60 * 60  # segundos
+MESH_YEARS_FALLBACK = [str(y) for y in range(2024, 1999, -1)]
+
 # Configurações de rede e performance
 API_TIMEOUT = 30
 DOWNLOAD_TIMEOUT = 300  
 MAX_RETRIES = 3  
 CHUNK_SIZE = 65536
+HTTP_BACKOFF_FACTOR = 0.5  # Espera base entre tentativas (s), dobrada a cada nova tentativa
+HTTP_BACKOFF_MAX = 30  # Espera máxima entre tentativas (s)
+STREAM_CHUNK_ROWS = 5000  # Linhas da resposta JSON do SIDRA processadas por bloco
+
+# Cache persistente das respostas da API SIDRA
+HTTP_CACHE_TTL = 24 * 60 * 60  # segundos
+HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Cache persistente das malhas do IBGE já extraídas
+MESH_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+MESH_DOWNLOAD_SEGMENTS = 4  # Segmentos baixados em paralelo quando o servidor aceita Range
+MESH_SEGMENT_MIN_BYTES = 8 * 1024 * 1024  # Tamanho mínimo de cada segmento
+MESH_PARTIAL_MAX_AGE = 7 * 24 * 60 * 60  # Downloads interrompidos são mantidos para retomada por (s)
+MESH_MAX_PARALLEL_DOWNLOADS = 3  # Malhas de UFs baixadas ao mesmo tempo na seleção de várias UFs
+
+# Resoluções das malhas: tolerância da simplificação em metros (None = malha original)
+MESH_RESOLUTIONS = {
+    "Original": None,
+    "Média (simplificada, ~100 m)": 100,
+    "Baixa (simplificada, ~500 m)": 500,
+}
+METERS_PER_DEGREE = 111320  # Comprimento aproximado de um grau no equador, para malhas em coordenadas geográficas
+
+# Cache e busca antecipada dos metadados das tabelas
+METADATA_CACHE_TTL = 7 * 24 * 60 * 60  # segundos; depois disso a versão da tabela é conferida
+METADATA_REVALIDATE_TIMEOUT = 5  # segundos para conferir a versão de uma tabela em cache
+METADATA_PREFETCH_COUNT = 5  # Primeiros resultados da busca com metadados buscados em segundo plano
+METADATA_PREFETCH_DELAY = 1500  # ms sem digitação antes de iniciar a busca antecipada
+
+# Busca de tabelas no assistente (debounce adaptativo, em ms)
+SEARCH_DEBOUNCE_MIN = 40
+SEARCH_DEBOUNCE_MAX = 400
+
+# União dos dados do SIDRA à camada
+JOIN_BATCH_SIZE = 1000  # Feições gravadas por chamada a dataProvider().addFeatures
+JOIN_PROGRESS_STEP = 500  # Feições entre atualizações de progresso e verificações de cancelamento
+
+# Divisão de consultas grandes à API SIDRA
+SIDRA_CELL_LIMIT = 100000  # Valores por requisição; acima disso a API rejeita a consulta
+SIDRA_MAX_PARALLEL_REQUESTS = 4  # Partes de uma consulta dividida baixadas ao mesmo tempo
+BATCH_MAX_CONCURRENT_QUERIES = 4  # Consultas de um lote (várias URLs) processadas ao mesmo tempo
+
+# Conexões simultâneas por servidor na sessão HTTP compartilhada; as demais aguardam
+# na fila. Os níveis de paralelismo são aninhados e cada um tem o seu limite, então
+# o pool comporta o maior produto entre eles:
+#   API SIDRA: BATCH_MAX_CONCURRENT_QUERIES consultas × SIDRA_MAX_PARALLEL_REQUESTS partes (16)
+#   Malhas:    MESH_MAX_PARALLEL_DOWNLOADS UFs × MESH_DOWNLOAD_SEGMENTS segmentos (12)
+HTTP_MAX_CONNECTIONS_PER_HOST = max(
+    BATCH_MAX_CONCURRENT_QUERIES * SIDRA_MAX_PARALLEL_REQUESTS,
+    MESH_MAX_PARALLEL_DOWNLOADS * MESH_DOWNLOAD_SEGMENTS,
+)
+
+# Unidades territoriais por nível do SIDRA (n1 Brasil, n2 Grandes Regiões, n3 UF,
+# n6 Município, n8 Mesorregião, n9 Microrregião), para estimar o tamanho de "all"
+NIVEIS_TERRITORIAIS_QTD = {'1': 1, '2': 5, '3': 27, '6': 5570, '8': 137, '9': 558}
+
+# Níveis contidos nas UFs, que podem ser divididos com "in n3 <códigos>"
+NIVEIS_DIVISIVEIS_POR_UF = ('6', '8', '9')
+
+# Municípios por UF (código IBGE da UF), usados para equilibrar a divisão por UF
+MUNICIPIOS_POR_UF = {
+    '11': 52, '12': 22, '13': 62, '14': 15, '15': 144, '16': 16, '17': 139,
+    '21': 217, '22': 224, '23': 184, '24': 167, '25': 223, '26': 185, '27': 102,
+    '28': 75, '29': 417, '31': 853, '32': 78, '33': 92, '35': 645,
+    '41': 399, '42': 295, '43': 497, '50': 79, '51': 141, '52': 246, '53': 1
+}
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+"""
+Funções para localizar os diretórios de dados do plugin no perfil do QGIS.
+"""
+
+import os
+from qgis.core import QgsApplication
+
+
+def get_cache_dir(name):
+    """
+    Retorna o caminho de um diretório de cache do plugin, criando-o se necessário.
+    Os caches ficam no perfil do usuário do QGIS e sobrevivem entre sessões.
+
+    :param name: Nome do subdiretório do cache (ex.: 'respostas_sidra').
+    :return: O caminho completo do diretório.
+    """
+    path = os.path.join(QgsApplication.qgisSettingsDirPath(), 'cache', 'sidra_connector', name)
+    os.makedirs(path, exist_ok=True)
+    return path